@@ -0,0 +1,58 @@
+import asyncio
+from typing import Awaitable, TypeVar
+from fastapi import HTTPException, Request
+from app.core import deadline
+from app.core.deadline import DeadlineExceeded
+
+T = TypeVar("T")
+
+DEADLINE_HEADER = "X-Request-Deadline-Ms"
+DISCONNECT_POLL_INTERVAL = 0.1
+
+
+class ClientDisconnected(Exception):
+    """The client went away before the response was ready."""
+
+
+def apply_deadline_header(request: Request):
+    """Start the request deadline from the client's `X-Request-Deadline-Ms` header."""
+    value = request.headers.get(DEADLINE_HEADER)
+    if value is None:
+        deadline.set_budget(None)
+        return
+    try:
+        budget_ms = float(value)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid {DEADLINE_HEADER} header: {value}")
+    if budget_ms <= 0:
+        raise HTTPException(status_code=400, detail=f"{DEADLINE_HEADER} must be positive")
+    deadline.set_budget(budget_ms)
+
+
+async def run_cancellable(request: Request, work: Awaitable[T]) -> T:
+    """Await `work`, cancelling it when the client disconnects or the deadline passes.
+
+    Cancellation propagates down to the LLM call so abandoned requests stop
+    holding single-flight shares and queued limiter slots. An upstream call
+    that has already started keeps its executor and limiter slots until it
+    returns, so disconnects never raise upstream concurrency past the limits.
+    """
+    task = asyncio.ensure_future(work)
+    try:
+        while True:
+            timeout = DISCONNECT_POLL_INTERVAL
+            left = deadline.remaining()
+            if left is not None:
+                timeout = max(0.0, min(timeout, left))
+
+            done, _ = await asyncio.wait({task}, timeout=timeout)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                raise ClientDisconnected()
+            left = deadline.remaining()
+            if left is not None and left <= 0:
+                raise DeadlineExceeded("request deadline passed")
+    finally:
+        if not task.done():
+            task.cancel()
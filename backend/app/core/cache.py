@@ -1,66 +1,309 @@
-import json
+import asyncio
+import time
+import uuid
 import redis.asyncio as redis
-from typing import Optional, Any
+from redis.asyncio.connection import _AsyncRESP2Parser
+from redis.exceptions import RedisError
+from redis.utils import HIREDIS_AVAILABLE
+from typing import Awaitable, Callable, Optional, Any
+from app.core.circuit_breaker import CircuitBreaker
+from app.core.codec import Codec
 from app.core.config import get_settings
+from app.core.disk_cache import DiskCache
 
 settings = get_settings()
 
+# Return the cached value, or take a short lock so only one caller computes it.
+# Replies: {1, value} hit, {0} lock acquired, {2} someone else holds the lock.
+GET_OR_LOCK_SCRIPT = """
+local value = redis.call('GET', KEYS[1])
+if value then
+    return {1, value}
+end
+if redis.call('SET', KEYS[2], ARGV[1], 'NX', 'PX', ARGV[2]) then
+    return {0}
+end
+return {2}
+"""
+
+# Delete the lock only if it is still ours
+RELEASE_LOCK_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
 
 class RedisCache:
-    """Redis cache manager for context and responses."""
+    """Redis cache manager for context and responses.
+    
+    Redis is an optimization, never a dependency: every operation runs under
+    a timeout and a circuit breaker, and failures turn into cache misses. While
+    the breaker is open, a background task pings Redis with exponential
+    backoff and closes the breaker once it answers again.
+    
+    Writes go through `writer` when one is set: the L1 invalidator's
+    tracking connection, whose own writes Redis does not announce back.
+    """
+    
+    name = "Redis"
     
     def __init__(self):
         self.redis_client: Optional[redis.Redis] = None
+        self.writer: Optional[redis.Redis] = None
+        self.pool: Optional[redis.BlockingConnectionPool] = None
+        self.codec = Codec(
+            serializer=settings.CACHE_SERIALIZER,
+            compression=settings.CACHE_COMPRESSION,
+            threshold=settings.CACHE_COMPRESSION_THRESHOLD
+        )
+        self.op_timeout = settings.REDIS_OP_TIMEOUT_MS / 1000
+        self.breaker = CircuitBreaker(
+            failure_threshold=settings.REDIS_BREAKER_FAILURES,
+            reset_timeout=settings.REDIS_BREAKER_RESET_SECONDS
+        )
+        self._reconnect_task: Optional[asyncio.Task] = None
+        self.errors = 0
+        self.reconnects = 0
+        self.last_ping_ms: Optional[float] = None
+    
+    @property
+    def connected(self) -> bool:
+        return self.redis_client is not None
+    
+    @property
+    def _writes(self) -> redis.Redis:
+        return self.writer or self.redis_client
     
-    async def connect(self):
-        """Connect to Redis."""
-        self.redis_client = await redis.Redis(
-            host=settings.REDIS_HOST,
-            port=settings.REDIS_PORT,
+    async def connect(self, host: Optional[str] = None, port: Optional[int] = None):
+        """Connect to Redis through a bounded, blocking connection pool.
+        
+        An unreachable Redis does not fail startup: the cache starts bypassed
+        and reconnects in the background.
+        """
+        options = {}
+        if not settings.REDIS_USE_HIREDIS:
+            # redis-py picks the hiredis parser automatically when it is installed
+            options["parser_class"] = _AsyncRESP2Parser
+        self.pool = redis.BlockingConnectionPool(
+            host=host or settings.REDIS_HOST,
+            port=port or settings.REDIS_PORT,
             db=settings.REDIS_DB,
             password=settings.REDIS_PASSWORD if settings.REDIS_PASSWORD else None,
-            decode_responses=True
+            decode_responses=False,
+            max_connections=settings.REDIS_MAX_CONNECTIONS,
+            timeout=settings.REDIS_POOL_TIMEOUT,
+            socket_timeout=self.op_timeout,
+            socket_connect_timeout=settings.REDIS_CONNECT_TIMEOUT_MS / 1000,
+            socket_keepalive=True,
+            health_check_interval=30,
+            **options
         )
+        self.redis_client = redis.Redis(connection_pool=self.pool)
+        self._get_or_lock = self.redis_client.register_script(GET_OR_LOCK_SCRIPT)
+        self._release_lock = self.redis_client.register_script(RELEASE_LOCK_SCRIPT)
+        
+        if await self.ping() is None:
+            print("⚠️  Redis unreachable; serving without cache until it recovers")
+            self.breaker.trip()
+            self._start_reconnect()
     
     async def disconnect(self):
         """Disconnect from Redis."""
+        if self._reconnect_task is not None:
+            self._reconnect_task.cancel()
+            self._reconnect_task = None
         if self.redis_client:
-            await self.redis_client.close()
+            await self.redis_client.aclose()
+            await self.pool.disconnect()
     
-    async def get(self, key: str) -> Optional[Any]:
-        """Get value from cache."""
+    async def ping(self) -> Optional[float]:
+        """Round-trip latency to Redis in milliseconds, or None if it does not answer."""
         if not self.redis_client:
             return None
         
-        value = await self.redis_client.get(key)
-        if value:
-            return json.loads(value)
-        return None
+        started_at = time.perf_counter()
+        try:
+            async with asyncio.timeout(self.op_timeout):
+                await self.redis_client.ping()
+        except (RedisError, OSError, asyncio.TimeoutError):
+            self.last_ping_ms = None
+            return None
+        self.last_ping_ms = round((time.perf_counter() - started_at) * 1000, 2)
+        return self.last_ping_ms
+    
+    def _start_reconnect(self):
+        if self._reconnect_task is None or self._reconnect_task.done():
+            self._reconnect_task = asyncio.get_running_loop().create_task(self._reconnect())
+    
+    async def _reconnect(self):
+        delay = settings.REDIS_RECONNECT_MIN_SECONDS
+        while True:
+            await asyncio.sleep(delay)
+            if await self.ping() is not None:
+                self.breaker.reset()
+                self.reconnects += 1
+                print(f"✅ Redis reachable again ({self.last_ping_ms}ms)")
+                return
+            delay = min(delay * 2, settings.REDIS_RECONNECT_MAX_SECONDS)
+    
+    async def _call(self, operation: Callable[[], Awaitable[Any]], default: Any = None) -> Any:
+        """Run one Redis operation under the timeout and breaker, or return `default`."""
+        if not self.redis_client or not self.breaker.allow():
+            return default
+        
+        try:
+            async with asyncio.timeout(self.op_timeout):
+                result = await operation()
+        except (RedisError, OSError, asyncio.TimeoutError) as e:
+            self.errors += 1
+            if self.breaker.record_failure():
+                print(f"⚠️  Redis failing ({e!r}); bypassing the cache")
+                self._start_reconnect()
+            return default
+        except BaseException:
+            self.breaker.abandon()
+            raise
+        self.breaker.record_success()
+        return result
+    
+    def _decode(self, key: str, value: Optional[bytes]) -> Optional[Any]:
+        if not value:
+            return None
+        try:
+            return self.codec.decode(value)
+        except ValueError as e:
+            print(f"⚠️  Unreadable cache entry {key}: {e}")
+            return None
+    
+    async def get(self, key: str) -> Optional[Any]:
+        """Get value from cache."""
+        return self._decode(key, await self._call(lambda: self.redis_client.get(key)))
+    
+    async def mget(self, keys: list[str]) -> list[Optional[Any]]:
+        """Get several values in one round trip; missing keys come back as None."""
+        if not keys:
+            return []
+        
+        values = await self._call(lambda: self.redis_client.mget(keys), [None] * len(keys))
+        return [self._decode(key, value) for key, value in zip(keys, values)]
     
     async def set(self, key: str, value: Any, ttl: int = settings.CACHE_TTL):
         """Set value in cache with TTL."""
-        if not self.redis_client:
-            return False
+        data = self.codec.encode(value)
+        return await self._call(lambda: self._writes.setex(key, ttl, data), False) is not False
+    
+    async def mset_with_ttl(
+        self,
+        items: dict[str, Any],
+        ttl: int = settings.CACHE_TTL,
+        transaction: bool = False
+    ):
+        """Set several values with a TTL in one round trip.
+        
+        With `transaction`, the writes are applied atomically (MULTI/EXEC);
+        otherwise they are only pipelined.
+        """
+        if not items:
+            return True
+        encoded = {key: self.codec.encode(value) for key, value in items.items()}
+        
+        async def write():
+            async with self._writes.pipeline(transaction=transaction) as pipe:
+                for key, data in encoded.items():
+                    pipe.setex(key, ttl, data)
+                return await pipe.execute()
         
-        serialized = json.dumps(value)
-        await self.redis_client.setex(key, ttl, serialized)
-        return True
+        return await self._call(write, False) is not False
+    
+    async def get_or_lock(
+        self,
+        key: str,
+        lock_ttl_ms: int = 30000
+    ) -> tuple[Optional[Any], Optional[str]]:
+        """Read a key, or atomically take a lock to compute it.
+        
+        Returns `(value, None)` on a hit and `(None, token)` when this caller
+        holds the lock and should compute and store the value, then call
+        `release_lock`. `(None, None)` means another caller holds the lock,
+        or Redis is unavailable. The lock is the key `lock:<key>`, outside
+        the key's own namespace, so it causes no L1 invalidations.
+        """
+        token = uuid.uuid4().hex
+        reply = await self._call(
+            lambda: self._get_or_lock(keys=[key, f"lock:{key}"], args=[token, lock_ttl_ms])
+        )
+        if reply is None:
+            return None, None
+        if reply[0] == 1:
+            return self._decode(key, reply[1]), None
+        return None, token if reply[0] == 0 else None
+    
+    async def release_lock(self, key: str, token: str) -> bool:
+        """Release a lock taken by `get_or_lock`, if it is still held with `token`."""
+        return bool(await self._call(
+            lambda: self._release_lock(keys=[f"lock:{key}"], args=[token]), 0
+        ))
     
     async def delete(self, key: str):
         """Delete key from cache."""
-        if not self.redis_client:
-            return False
+        return await self._call(lambda: self._writes.delete(key), False) is not False
+    
+    async def delete_many(self, keys: list[str]) -> int:
+        """Delete several keys in one round trip, reclaiming memory off the main thread."""
+        if not keys:
+            return 0
         
-        await self.redis_client.delete(key)
-        return True
+        return await self._call(lambda: self._writes.unlink(*keys), 0)
+    
+    async def scan(self, match: str, cursor: int = 0, count: int = 500) -> tuple[int, list[str]]:
+        """One SCAN step over keys matching `match`; a returned cursor of 0 means done."""
+        reply = await self._call(
+            lambda: self.redis_client.scan(cursor=cursor, match=match, count=count)
+        )
+        if reply is None:
+            return 0, []
+        cursor, keys = reply
+        return cursor, [key.decode() if isinstance(key, bytes) else key for key in keys]
+    
+    async def publish(self, channel: str, message: str) -> int:
+        """Publish a message; returns how many subscribers received it."""
+        return await self._call(lambda: self.redis_client.publish(channel, message), 0)
     
     async def exists(self, key: str) -> bool:
         """Check if key exists."""
-        if not self.redis_client:
-            return False
+        return await self._call(lambda: self.redis_client.exists(key), 0) > 0
+    
+    def stats(self) -> dict:
+        """Connection pool occupancy and availability.
+        
+        Saturation near 1 means callers queue for connections.
+        """
+        stats = {
+            "backend": "redis",
+            "connected": self.pool is not None,
+            "breaker": self.breaker.stats(),
+            "errors": self.errors,
+            "reconnects": self.reconnects,
+            "last_ping_ms": self.last_ping_ms,
+        }
+        if self.pool is None:
+            return stats
         
-        return await self.redis_client.exists(key) > 0
+        in_use = len(self.pool._in_use_connections)
+        stats.update({
+            "hiredis": HIREDIS_AVAILABLE and settings.REDIS_USE_HIREDIS,
+            "max_connections": self.pool.max_connections,
+            "in_use": in_use,
+            "idle": len(self.pool._available_connections),
+            "saturation": round(in_use / self.pool.max_connections, 4),
+        })
+        return stats
 
 
-# Global cache instance
-cache = RedisCache()
\ No newline at end of file
+# Global cache instance; "disk" serves single-node installs without Redis
+cache: RedisCache | DiskCache = (
+    DiskCache(settings.DISK_CACHE_PATH, settings.DISK_CACHE_MAX_BYTES)
+    if settings.CACHE_BACKEND == "disk" else RedisCache()
+)
\ No newline at end of file
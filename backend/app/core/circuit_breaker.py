@@ -0,0 +1,89 @@
+import time
+
+
+class CircuitBreaker:
+    """Stop calling a failing dependency for a while instead of waiting on it.
+
+    After `failure_threshold` consecutive failures the breaker opens and
+    `allow()` refuses calls for `reset_timeout` seconds. It then half-opens:
+    one trial call is let through, and its outcome closes or re-opens the
+    breaker.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 10.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self._trial_in_flight = False
+        self.failures = 0
+        self.opens = 0
+        self.short_circuited = 0
+
+    @property
+    def state(self) -> str:
+        if self.consecutive_failures < self.failure_threshold:
+            return self.CLOSED
+        if time.monotonic() - self.opened_at < self.reset_timeout:
+            return self.OPEN
+        return self.HALF_OPEN
+
+    def allow(self) -> bool:
+        """Whether a call may go ahead now."""
+        state = self.state
+        if state == self.CLOSED:
+            return True
+        if state == self.HALF_OPEN and not self._trial_in_flight:
+            self._trial_in_flight = True
+            return True
+        self.short_circuited += 1
+        return False
+
+    def record_success(self):
+        self.consecutive_failures = 0
+        self._trial_in_flight = False
+
+    def abandon(self):
+        """Give up on a call without an outcome, e.g. because it was cancelled.
+
+        Frees the half-open trial slot so the next call can try again.
+        """
+        self._trial_in_flight = False
+
+    def record_failure(self) -> bool:
+        """Count a failure; returns True if this one opened the breaker."""
+        self.failures += 1
+        was_closed = self.state == self.CLOSED
+        self.consecutive_failures += 1
+        self._trial_in_flight = False
+        if self.consecutive_failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+            if was_closed:
+                self.opens += 1
+                return True
+        return False
+
+    def trip(self):
+        """Open the breaker right away, e.g. when a dependency is down at startup."""
+        if self.state == self.CLOSED:
+            self.opens += 1
+        self.consecutive_failures = max(self.consecutive_failures, self.failure_threshold)
+        self.opened_at = time.monotonic()
+        self._trial_in_flight = False
+
+    def reset(self):
+        """Close the breaker, e.g. after an out-of-band health check succeeded."""
+        self.record_success()
+
+    def stats(self) -> dict:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "failures": self.failures,
+            "opens": self.opens,
+            "short_circuited": self.short_circuited,
+        }
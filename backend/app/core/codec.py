@@ -0,0 +1,142 @@
+import json
+import zlib
+from typing import Any, Callable
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional speedup
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - optional serializer
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - optional compressor
+    zstandard = None
+
+# Header byte: 1vvv sscc -> marker bit, format version, serializer id, compressor id.
+# Values written before the codec existed are plain JSON text, which always
+# starts with an ASCII byte, so the marker bit tells the two apart.
+FORMAT_VERSION = 1
+_MARKER = 0x80
+
+
+def _json_dumps(value: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, separators=(",", ":")).encode()
+
+
+def _json_loads(data: bytes) -> Any:
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+# id -> (name, dumps, loads)
+SERIALIZERS: dict[int, tuple[str, Callable[[Any], bytes], Callable[[bytes], Any]]] = {
+    0: ("json", _json_dumps, _json_loads),
+}
+if msgpack is not None:
+    SERIALIZERS[1] = ("msgpack", msgpack.packb, msgpack.unpackb)
+
+# id -> (name, compress, decompress)
+COMPRESSORS: dict[int, tuple[str, Callable[[bytes], bytes], Callable[[bytes], bytes]]] = {
+    0: ("none", bytes, bytes),
+    1: ("zlib", lambda data: zlib.compress(data, 6), zlib.decompress),
+}
+if zstandard is not None:
+    COMPRESSORS[2] = (
+        "zstd",
+        zstandard.ZstdCompressor(level=3).compress,
+        zstandard.ZstdDecompressor().decompress,
+    )
+
+
+def _lookup(table: dict, name: str) -> int:
+    for id_, (entry_name, *_) in table.items():
+        if entry_name == name:
+            return id_
+    raise ValueError(f"Codec component '{name}' is not available")
+
+
+class Codec:
+    """Serialize cache values to compact bytes behind a versioned header byte.
+
+    Payloads at least `threshold` bytes long are compressed. `compression`
+    may be "auto" to prefer zstd when installed and fall back to zlib.
+    Entries written by older versions (plain JSON text) stay readable.
+    """
+
+    def __init__(
+        self,
+        serializer: str = "json",
+        compression: str = "auto",
+        threshold: int = 1024
+    ):
+        if compression == "auto":
+            compression = "zstd" if zstandard is not None else "zlib"
+        self.serializer = _lookup(SERIALIZERS, serializer)
+        self.compressor = _lookup(COMPRESSORS, compression)
+        self.threshold = threshold
+        self.encoded = 0
+        self.compressed = 0
+        self.raw_bytes = 0
+        self.stored_bytes = 0
+
+    def encode(self, value: Any) -> bytes:
+        """Serialize and, above the threshold, compress a value."""
+        _, dumps, _ = SERIALIZERS[self.serializer]
+        payload = dumps(value)
+        raw_size = len(payload)
+        compressor = 0
+        if self.compressor and len(payload) >= self.threshold:
+            _, compress, _ = COMPRESSORS[self.compressor]
+            packed = compress(payload)
+            if len(packed) < len(payload):
+                payload, compressor = packed, self.compressor
+
+        header = _MARKER | (FORMAT_VERSION << 4) | (self.serializer << 2) | compressor
+        data = bytes([header]) + payload
+        self.encoded += 1
+        self.compressed += compressor != 0
+        self.raw_bytes += raw_size
+        self.stored_bytes += len(data)
+        return data
+
+    @staticmethod
+    def decode(data: bytes) -> Any:
+        """Decode bytes written by any codec version, or legacy JSON text."""
+        header = data[0]
+        if not header & _MARKER:
+            return json.loads(data)
+
+        version = (header >> 4) & 0x7
+        if version != FORMAT_VERSION:
+            raise ValueError(f"Unknown cache format version {version}")
+        serializer, compressor = (header >> 2) & 0x3, header & 0x3
+        if serializer not in SERIALIZERS or compressor not in COMPRESSORS:
+            raise ValueError(f"Cache entry needs an unavailable codec (header {header:#x})")
+
+        try:
+            payload = COMPRESSORS[compressor][2](data[1:])
+            return SERIALIZERS[serializer][2](payload)
+        except Exception as e:
+            raise ValueError(f"Corrupt cache entry: {e}") from e
+
+    def stats(self) -> dict:
+        """Bytes stored against the uncompressed serialized size."""
+        return {
+            "serializer": SERIALIZERS[self.serializer][0],
+            "compression": COMPRESSORS[self.compressor][0],
+            "threshold": self.threshold,
+            "encoded": self.encoded,
+            "compressed": self.compressed,
+            "raw_bytes": self.raw_bytes,
+            "stored_bytes": self.stored_bytes,
+            "bytes_saved": self.raw_bytes - self.stored_bytes,
+            "ratio": round(self.raw_bytes / self.stored_bytes, 2) if self.stored_bytes else 1.0,
+        }
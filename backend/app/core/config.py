@@ -11,15 +11,102 @@ class Settings(BaseSettings):
     
     # Google Gemini Configuration
     GEMINI_API_KEY: str
+    GEMINI_MODEL: str = "gemini-2.5-flash"
+    GEMINI_POOL_CHANNELS: int = 2
+    GEMINI_KEEPALIVE_MS: int = 30000
+    
+    # Cheaper profile used when a client deadline is tight
+    GEMINI_FAST_MODEL: str = "gemini-2.5-flash-lite"
+    GEMINI_FAST_MAX_OUTPUT_TOKENS: int = 512
+    DEADLINE_MIN_BUDGET_MS: int = 150
+    
+    # LLM Routing: Gemini plus optional OpenAI-compatible endpoints, e.g.
+    # LLM_ENDPOINTS='[{"name": "ollama", "base_url": "http://localhost:11434/v1",
+    #                  "model": "codellama", "weight": 0.5}]'
+    GEMINI_WEIGHT: float = 1.0
+    LLM_ENDPOINTS: list[dict] = []
+    ROUTER_EJECT_ERROR_RATE: float = 0.5
+    ROUTER_EJECT_SECONDS: int = 30
     
     # Redis Configuration
     REDIS_HOST: str = "localhost"
     REDIS_PORT: int = 6379
     REDIS_DB: int = 0
     REDIS_PASSWORD: str = ""
+    REDIS_MAX_CONNECTIONS: int = 64
+    REDIS_POOL_TIMEOUT: int = 5  # seconds to wait for a free connection
+    REDIS_USE_HIREDIS: bool = True  # only takes effect when hiredis is installed
+    REDIS_OP_TIMEOUT_MS: int = 250  # per operation; a slow Redis becomes a cache miss
+    REDIS_CONNECT_TIMEOUT_MS: int = 500
+    REDIS_BREAKER_FAILURES: int = 5  # consecutive failures before the cache is bypassed
+    REDIS_BREAKER_RESET_SECONDS: float = 10.0
+    REDIS_RECONNECT_MIN_SECONDS: float = 0.5
+    REDIS_RECONNECT_MAX_SECONDS: float = 30.0
     
     # Cache Configuration
+    CACHE_BACKEND: str = "redis"  # or "disk": a local SQLite file, for installs without Redis
+    DISK_CACHE_PATH: str = "cache.db"
+    DISK_CACHE_MAX_BYTES: int = 512 * 1024 * 1024
     CACHE_TTL: int = 3600  # 1 hour
+    CACHE_SOFT_TTL: int = 1800  # served stale and refreshed in the background after this
+    CACHE_TTL_JITTER: float = 0.1  # +/- fraction applied to both TTLs
+    CACHE_REFRESH_AHEAD_BETA: float = 1.0  # 0 disables early refresh
+    CACHE_NEGATIVE_TTL: int = 60  # seconds to remember deterministic upstream errors
+    CACHE_LOCK_TTL_MS: int = 30000  # lock letting one replica compute a missing key
+    # How long to wait for another replica's result; 0 computes right away
+    CACHE_LOCK_WAIT_SECONDS: float = 10.0
+    CACHE_SWEEP_OLD_NAMESPACES: bool = True  # drop keys of old prompt/model versions
+    CACHE_SWEEP_DELAY_SECONDS: int = 600  # let a rolling deploy finish first
+    CACHE_SWEEP_BATCH: int = 500
+    CACHE_STATS_SAMPLE_RATE: float = 0.05  # share of stores/hits sampled for size and age stats
+    CACHE_SERIALIZER: str = "json"  # or "msgpack" when installed
+    CACHE_COMPRESSION: str = "auto"  # zstd when installed, else zlib; or "none"
+    CACHE_COMPRESSION_THRESHOLD: int = 1024  # bytes
+    
+    # In-process (L1) cache in front of the shared backend
+    L1_CACHE_MAX_BYTES: int = 64 * 1024 * 1024  # 0 disables the in-process tier
+    L1_CACHE_TTL: int = 300
+    L1_CACHE_INVALIDATION: bool = True  # drop L1 copies when their Redis key changes
+    L1_CACHE_WINDOW: float = 0.01  # LRU window share before TinyLFU admission; 1.0 = plain LRU
+    
+    # Request log and cache warming (python -m app.services.cache_warmer)
+    REQUEST_LOG_PATH: str = ""  # JSON lines of served generate requests; empty disables
+    CACHE_WARM_TOP_K: int = 100
+    CACHE_WARM_CONCURRENCY: int = 4
+    CACHE_WARM_BUDGET: int = 200  # maximum upstream calls per warming run
+    
+    # Semantic cache (code generation prompts)
+    SEMANTIC_CACHE_ENABLED: bool = False  # opt in: near matches can still need other code
+    SEMANTIC_CACHE_THRESHOLD: float = 0.95
+    SEMANTIC_CACHE_DIM: int = 512
+    SEMANTIC_CACHE_CAPACITY: int = 10000
+    SEMANTIC_CACHE_PATH: str = ""  # directory for a per-process memory-mapped index
+    
+    # LLM Execution
+    LLM_EXECUTOR_WORKERS: int = 64
+    LLM_CONCURRENCY_GENERATE: int = 32
+    LLM_CONCURRENCY_IMPROVE: int = 16
+    LLM_CONCURRENCY_AUTOCOMPLETE: int = 32
+    LLM_LIMIT_INITIAL: int = 8
+    LLM_LIMIT_MIN: int = 1
+    LLM_LIMIT_MAX: int = 64
+    
+    # Scheduling weights: interactive autocomplete > interactive generate > bulk improve
+    SCHEDULER_WEIGHT_AUTOCOMPLETE: float = 8.0
+    SCHEDULER_WEIGHT_GENERATE: float = 3.0
+    SCHEDULER_WEIGHT_IMPROVE: float = 1.0
+    SCHEDULER_MAX_WAIT_MS: int = 5000
+    
+    # Autocomplete micro-batching (0 disables)
+    AUTOCOMPLETE_BATCH_WINDOW_MS: int = 0
+    AUTOCOMPLETE_BATCH_MAX_SIZE: int = 8
+    
+    # Autocomplete hedging (percentile 0 disables)
+    AUTOCOMPLETE_HEDGE_PERCENTILE: float = 95.0
+    AUTOCOMPLETE_HEDGE_BUDGET: float = 0.05
+    AUTOCOMPLETE_HEDGE_MIN_DELAY_MS: int = 50
+    AUTOCOMPLETE_PREFIX_CACHE_ENTRIES: int = 5000  # 0 disables the prefix cache
+    AUTOCOMPLETE_PREFIX_CACHE_TTL: int = 300
     
     # CORS
     BACKEND_CORS_ORIGINS: list[str] = ["http://localhost:3000", "http://localhost:5173"]
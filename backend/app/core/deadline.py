@@ -0,0 +1,23 @@
+import time
+from contextvars import ContextVar
+from typing import Optional
+
+# Absolute time.monotonic() deadline for the current request, if the client sent one
+_deadline: ContextVar[Optional[float]] = ContextVar("request_deadline", default=None)
+
+
+class DeadlineExceeded(Exception):
+    """The request's time budget ran out, or is too small to be worth starting."""
+
+
+def set_budget(budget_ms: Optional[float]):
+    """Start the current request's deadline `budget_ms` from now (None clears it)."""
+    _deadline.set(time.monotonic() + budget_ms / 1000 if budget_ms is not None else None)
+
+
+def remaining() -> Optional[float]:
+    """Seconds left before the deadline, or None when there is no deadline."""
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
@@ -0,0 +1,392 @@
+import asyncio
+import contextvars
+import sqlite3
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional
+from app.core.circuit_breaker import CircuitBreaker
+from app.core.codec import Codec
+from app.core.config import get_settings
+
+settings = get_settings()
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    value BLOB NOT NULL,
+    expires_at REAL NOT NULL,
+    accessed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_accessed_at ON entries (accessed_at);
+CREATE INDEX IF NOT EXISTS entries_expires_at ON entries (expires_at);
+"""
+
+
+class DiskCache:
+    """Persistent cache in a local SQLite file, for deployments without Redis.
+
+    Offers the same operations as `RedisCache`. The database runs in WAL mode
+    so readers never wait on the writer, and all access goes through one
+    worker thread, which keeps the event loop free and the connection
+    single-threaded. Several processes may share the file: `get_or_lock`
+    takes its lock inside an immediate transaction.
+
+    The file is kept under `max_bytes` of live pages: once a write goes over,
+    expired entries and then the least recently read ones are deleted down to
+    90% of the budget. Eviction runs in the background, a batch at a time,
+    outside the per-operation timeout. Read times are buffered in memory and
+    written back together every `ACCESS_BATCH` reads or `ACCESS_FLUSH_SECONDS`,
+    and before each eviction. Failures (disk full, a locked or corrupt file)
+    count towards a circuit breaker and turn into cache misses, as with Redis.
+    """
+
+    name = "SQLite disk cache"
+    ACCESS_BATCH = 256
+    ACCESS_FLUSH_SECONDS = 5.0
+
+    def __init__(self, path: str, max_bytes: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.codec = Codec(
+            serializer=settings.CACHE_SERIALIZER,
+            compression=settings.CACHE_COMPRESSION,
+            threshold=settings.CACHE_COMPRESSION_THRESHOLD
+        )
+        self.op_timeout = settings.REDIS_OP_TIMEOUT_MS / 1000
+        self.breaker = CircuitBreaker(
+            failure_threshold=settings.REDIS_BREAKER_FAILURES,
+            reset_timeout=settings.REDIS_BREAKER_RESET_SECONDS
+        )
+        self.db: Optional[sqlite3.Connection] = None
+        self._worker: Optional[ThreadPoolExecutor] = None
+        self._page_size = 4096
+        # Keys read since the last flush -> read time; only touched on the worker thread
+        self._accessed: dict[str, float] = {}
+        self._accessed_flushed_at = time.monotonic()
+        self._maintenance: Optional[asyncio.Task] = None
+        self._maintenance_due = False
+        self.errors = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.last_ping_ms: Optional[float] = None
+
+    @property
+    def connected(self) -> bool:
+        return self.db is not None
+
+    async def connect(self, host: Optional[str] = None, port: Optional[int] = None):
+        """Open (or create) the database file; `host` and `port` are ignored."""
+        self._worker = ThreadPoolExecutor(max_workers=1, thread_name_prefix="disk-cache")
+        try:
+            await self._run(self._open)
+        except (sqlite3.Error, OSError) as e:
+            print(f"⚠️  Disk cache unavailable ({e}); serving without cache")
+            self.breaker.trip()
+            return
+        await self.ping()
+
+    def _open(self):
+        db = sqlite3.connect(self.path, isolation_level=None, timeout=self.op_timeout)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        db.executescript(SCHEMA)
+        self._page_size = db.execute("PRAGMA page_size").fetchone()[0]
+        self.db = db
+
+    async def disconnect(self):
+        """Close the database and stop the worker thread."""
+        if self._maintenance is not None:
+            self._maintenance.cancel()
+            self._maintenance = None
+        if self.db is not None:
+            try:
+                await self._run(self._flush_accesses)
+            except (sqlite3.Error, OSError):
+                pass
+            db, self.db = self.db, None
+            await self._run(db.close)
+        if self._worker is not None:
+            self._worker.shutdown(wait=True)
+            self._worker = None
+
+    async def _run(self, func: Callable[..., Any], *args: Any) -> Any:
+        return await asyncio.get_running_loop().run_in_executor(self._worker, func, *args)
+
+    async def ping(self) -> Optional[float]:
+        """Round-trip latency to the database in milliseconds, or None if it fails."""
+        if self.db is None:
+            return None
+
+        started_at = time.perf_counter()
+        try:
+            async with asyncio.timeout(self.op_timeout):
+                await self._run(lambda: self.db.execute("SELECT 1").fetchone())
+        except (sqlite3.Error, OSError, asyncio.TimeoutError):
+            self.last_ping_ms = None
+            return None
+        self.last_ping_ms = round((time.perf_counter() - started_at) * 1000, 2)
+        return self.last_ping_ms
+
+    async def _call(self, func: Callable[..., Any], *args: Any, default: Any = None) -> Any:
+        """Run one database operation on the worker under the breaker, or return `default`."""
+        if self.db is None or not self.breaker.allow():
+            return default
+
+        try:
+            async with asyncio.timeout(self.op_timeout):
+                result = await self._run(func, *args)
+        except (sqlite3.Error, OSError, asyncio.TimeoutError) as e:
+            self.errors += 1
+            if self.breaker.record_failure():
+                print(f"⚠️  Disk cache failing ({e!r}); bypassing the cache")
+            return default
+        except BaseException:
+            self.breaker.abandon()
+            raise
+        self.breaker.record_success()
+        return result
+
+    def _decode(self, key: str, value: Optional[bytes]) -> Optional[Any]:
+        if not value:
+            return None
+        try:
+            return self.codec.decode(value)
+        except ValueError as e:
+            print(f"⚠️  Unreadable cache entry {key}: {e}")
+            return None
+
+    def _read(self, keys: list[str]) -> list[Optional[bytes]]:
+        now = time.time()
+        found = {}
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            rows = self.db.execute(
+                f"SELECT key, value FROM entries WHERE key IN ({','.join('?' * len(chunk))})"
+                " AND expires_at > ?",
+                (*chunk, now)
+            )
+            found.update(rows)
+        self._accessed.update(dict.fromkeys(found, now))
+        return [found.get(key) for key in keys]
+
+    def _flush_accesses(self):
+        accessed, self._accessed = self._accessed, {}
+        self._accessed_flushed_at = time.monotonic()
+        if not accessed:
+            return
+        try:
+            with self.db:
+                self.db.execute("BEGIN IMMEDIATE")
+                self.db.executemany(
+                    "UPDATE entries SET accessed_at = ? WHERE key = ?",
+                    [(at, key) for key, at in accessed.items()]
+                )
+        except sqlite3.OperationalError:
+            # Another process holds the write lock; recency is best effort
+            pass
+
+    def _write(self, rows: list[tuple[str, bytes]], ttl: int):
+        now = time.time()
+        with self.db:
+            self.db.execute("BEGIN IMMEDIATE")
+            self.db.executemany(
+                "INSERT OR REPLACE INTO entries (key, value, expires_at, accessed_at)"
+                " VALUES (?, ?, ?, ?)",
+                [(key, data, now + ttl, now) for key, data in rows]
+            )
+
+    def _used_bytes(self) -> int:
+        pages = self.db.execute("PRAGMA page_count").fetchone()[0]
+        free = self.db.execute("PRAGMA freelist_count").fetchone()[0]
+        return (pages - free) * self._page_size
+
+    def _expire_step(self) -> bool:
+        """Delete one batch of expired entries; False once none are left."""
+        deleted = self.db.execute(
+            "DELETE FROM entries WHERE key IN"
+            " (SELECT key FROM entries WHERE expires_at <= ? LIMIT 500)",
+            (time.time(),)
+        ).rowcount
+        self.expirations += deleted
+        return deleted > 0
+
+    def _evict_step(self, target: float) -> bool:
+        """Delete one batch of the least recently read entries; False once under `target`."""
+        if self._used_bytes() <= target:
+            return False
+        deleted = self.db.execute(
+            "DELETE FROM entries WHERE key IN"
+            " (SELECT key FROM entries ORDER BY accessed_at LIMIT 100)"
+        ).rowcount
+        self.evictions += deleted
+        return deleted > 0
+
+    def _schedule_maintenance(self):
+        """Flush read times and evict in the background, once per burst of requests."""
+        self._maintenance_due = True
+        if self._maintenance is None or self._maintenance.done():
+            self._maintenance = asyncio.get_running_loop().create_task(
+                self._maintain(),
+                context=contextvars.Context()
+            )
+
+    async def _maintain(self):
+        # Each step is its own job on the worker, so reads queue behind one batch at most
+        while self._maintenance_due and self.db is not None:
+            self._maintenance_due = False
+            try:
+                await self._run(self._flush_accesses)
+                if await self._run(self._used_bytes) <= self.max_bytes:
+                    continue
+                while await self._run(self._expire_step):
+                    pass
+                while await self._run(self._evict_step, self.max_bytes * 0.9):
+                    pass
+            except (sqlite3.Error, OSError) as e:
+                self.errors += 1
+                print(f"⚠️  Disk cache maintenance failed ({e!r})")
+
+    def _note_reads(self):
+        if len(self._accessed) >= self.ACCESS_BATCH or (
+            self._accessed
+            and time.monotonic() - self._accessed_flushed_at >= self.ACCESS_FLUSH_SECONDS
+        ):
+            self._schedule_maintenance()
+
+    async def get(self, key: str) -> Optional[Any]:
+        """Get value from cache."""
+        values = await self._call(self._read, [key], default=[None])
+        self._note_reads()
+        return self._decode(key, values[0])
+
+    async def mget(self, keys: list[str]) -> list[Optional[Any]]:
+        """Get several values in one transaction; missing keys come back as None."""
+        if not keys:
+            return []
+
+        values = await self._call(self._read, keys, default=[None] * len(keys))
+        self._note_reads()
+        return [self._decode(key, value) for key, value in zip(keys, values)]
+
+    async def set(self, key: str, value: Any, ttl: int = settings.CACHE_TTL):
+        """Set value in cache with TTL."""
+        data = self.codec.encode(value)
+        return await self._store([(key, data)], ttl)
+
+    async def mset_with_ttl(
+        self,
+        items: dict[str, Any],
+        ttl: int = settings.CACHE_TTL,
+        transaction: bool = False
+    ):
+        """Set several values with a TTL; writes are always applied atomically."""
+        if not items:
+            return True
+        rows = [(key, self.codec.encode(value)) for key, value in items.items()]
+        return await self._store(rows, ttl)
+
+    async def _store(self, rows: list[tuple[str, bytes]], ttl: int) -> bool:
+        stored = await self._call(self._write, rows, ttl, default=False) is not False
+        if stored:
+            self._schedule_maintenance()
+        return stored
+
+    def _get_or_lock_sync(self, key: str, token: str, lock_ttl_ms: int) -> tuple[int, Any]:
+        now = time.time()
+        with self.db:
+            self.db.execute("BEGIN IMMEDIATE")
+            row = self.db.execute(
+                "SELECT value FROM entries WHERE key = ? AND expires_at > ?", (key, now)
+            ).fetchone()
+            if row:
+                return 1, row[0]
+            lock = self.db.execute(
+                "SELECT 1 FROM entries WHERE key = ? AND expires_at > ?", (f"lock:{key}", now)
+            ).fetchone()
+            if lock:
+                return 2, None
+            self.db.execute(
+                "INSERT OR REPLACE INTO entries (key, value, expires_at, accessed_at)"
+                " VALUES (?, ?, ?, ?)",
+                (f"lock:{key}", token.encode(), now + lock_ttl_ms / 1000, now)
+            )
+            return 0, None
+
+    async def get_or_lock(
+        self,
+        key: str,
+        lock_ttl_ms: int = 30000
+    ) -> tuple[Optional[Any], Optional[str]]:
+        """Read a key, or atomically take a lock to compute it (see `RedisCache.get_or_lock`)."""
+        token = uuid.uuid4().hex
+        reply = await self._call(self._get_or_lock_sync, key, token, lock_ttl_ms)
+        if reply is None:
+            return None, None
+        if reply[0] == 1:
+            return self._decode(key, reply[1]), None
+        return None, token if reply[0] == 0 else None
+
+    async def release_lock(self, key: str, token: str) -> bool:
+        """Release a lock taken by `get_or_lock`, if it is still held with `token`."""
+        return bool(await self._call(
+            lambda: self.db.execute(
+                "DELETE FROM entries WHERE key = ? AND value = ?", (f"lock:{key}", token.encode())
+            ).rowcount,
+            default=0
+        ))
+
+    async def delete(self, key: str):
+        """Delete key from cache."""
+        return await self.delete_many([key]) is not False
+
+    async def delete_many(self, keys: list[str]) -> int:
+        """Delete several keys in one transaction."""
+        if not keys:
+            return 0
+
+        def delete():
+            with self.db:
+                self.db.execute("BEGIN IMMEDIATE")
+                return self.db.executemany(
+                    "DELETE FROM entries WHERE key = ?", [(key,) for key in keys]
+                ).rowcount
+
+        return await self._call(delete, default=0)
+
+    async def scan(self, match: str, cursor: int = 0, count: int = 500) -> tuple[int, list[str]]:
+        """One step over keys matching the glob `match`; a returned cursor of 0 means done."""
+        rows = await self._call(
+            lambda: self.db.execute(
+                "SELECT rowid, key FROM entries WHERE rowid > ? AND key GLOB ?"
+                " ORDER BY rowid LIMIT ?",
+                (cursor, match, count)
+            ).fetchall(),
+            default=[]
+        )
+        if len(rows) < count:
+            return 0, [key for _, key in rows]
+        return rows[-1][0], [key for _, key in rows]
+
+    async def exists(self, key: str) -> bool:
+        """Check if key exists."""
+        return await self._call(
+            lambda: self.db.execute(
+                "SELECT 1 FROM entries WHERE key = ? AND expires_at > ?", (key, time.time())
+            ).fetchone() is not None,
+            default=False
+        )
+
+    def stats(self) -> dict:
+        """Availability and the eviction counters of the database file."""
+        return {
+            "backend": "disk",
+            "connected": self.connected,
+            "path": self.path,
+            "max_bytes": self.max_bytes,
+            "breaker": self.breaker.stats(),
+            "errors": self.errors,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "last_ping_ms": self.last_ping_ms,
+        }
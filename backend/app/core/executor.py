@@ -0,0 +1,214 @@
+import asyncio
+import contextvars
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import partial
+from typing import Any, AsyncIterator, Callable, Iterable, Optional
+from app.core.config import get_settings
+
+settings = get_settings()
+
+# Pool work that kept running after its caller was cancelled. Whoever reserved
+# upstream capacity for the call (the limiter) sets a list here and keeps the
+# reservation until that work has really finished.
+abandoned_work: contextvars.ContextVar[Optional[list[Future]]] = contextvars.ContextVar(
+    "abandoned_work", default=None
+)
+
+
+def _abandon(future: Future):
+    pending = abandoned_work.get()
+    if pending is not None and not future.done():
+        pending.append(future)
+
+
+class EndpointGate:
+    """Concurrency gate and queue-depth counters for one endpoint."""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.semaphore = asyncio.Semaphore(limit)
+        self.queued = 0
+        self.max_queued = 0
+        self.in_flight = 0
+        self.completed = 0
+        self.failed = 0
+        self.total_wait = 0.0
+        self.total_run = 0.0
+
+    def stats(self) -> dict:
+        """Snapshot of the gate counters."""
+        finished = self.completed + self.failed
+        return {
+            "limit": self.limit,
+            "queued": self.queued,
+            "max_queued": self.max_queued,
+            "in_flight": self.in_flight,
+            "completed": self.completed,
+            "failed": self.failed,
+            "avg_wait_ms": round(self.total_wait / finished * 1000, 2) if finished else 0.0,
+            "avg_run_ms": round(self.total_run / finished * 1000, 2) if finished else 0.0,
+        }
+
+
+_STREAM_END = object()
+
+
+class LLMExecutor:
+    """Bounded thread pool that keeps blocking LLM SDK calls off the event loop.
+
+    A blocking SDK call cannot be interrupted, so cancelling its caller does
+    not stop it. Endpoint slots are therefore released when the pool work
+    finishes, not when the caller gives up, and `in_flight` counts running
+    upstream calls, abandoned or not.
+    """
+
+    def __init__(self, max_workers: int, limits: dict[str, int]):
+        self.max_workers = max_workers
+        self.limits = limits
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._gates: dict[str, EndpointGate] = {}
+
+    def _get_pool(self) -> ThreadPoolExecutor:
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(
+                max_workers=self.max_workers,
+                thread_name_prefix="llm"
+            )
+        return self._pool
+
+    def _get_gate(self, endpoint: str) -> EndpointGate:
+        gate = self._gates.get(endpoint)
+        if gate is None:
+            gate = EndpointGate(self.limits.get(endpoint, self.max_workers))
+            self._gates[endpoint] = gate
+        return gate
+
+    async def _enter(self, gate: EndpointGate) -> float:
+        """Wait for a slot on the gate and return the start timestamp."""
+        queued_at = time.perf_counter()
+        gate.queued += 1
+        gate.max_queued = max(gate.max_queued, gate.queued)
+        try:
+            await gate.semaphore.acquire()
+        finally:
+            gate.queued -= 1
+
+        started_at = time.perf_counter()
+        gate.total_wait += started_at - queued_at
+        gate.in_flight += 1
+        return started_at
+
+    def _exit(self, gate: EndpointGate, started_at: float):
+        gate.in_flight -= 1
+        gate.total_run += time.perf_counter() - started_at
+        gate.semaphore.release()
+
+    def _submit(
+        self,
+        gate: EndpointGate,
+        started_at: float,
+        func: Callable[[], Any]
+    ) -> Future:
+        """Start `func` in the pool; the gate slot is returned when it finishes."""
+        loop = asyncio.get_running_loop()
+        try:
+            future = self._get_pool().submit(func)
+        except BaseException:
+            self._exit(gate, started_at)
+            raise
+
+        def finished(_: Future):
+            try:
+                loop.call_soon_threadsafe(self._exit, gate, started_at)
+            except RuntimeError:
+                # Event loop already closed at shutdown
+                pass
+
+        future.add_done_callback(finished)
+        return future
+
+    async def run(self, endpoint: str, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """Run a blocking callable in the pool, bounded by the endpoint's limit."""
+        gate = self._get_gate(endpoint)
+        started_at = await self._enter(gate)
+        future = self._submit(gate, started_at, partial(func, *args, **kwargs))
+        try:
+            result = await asyncio.wrap_future(future)
+            gate.completed += 1
+            return result
+        except BaseException:
+            gate.failed += 1
+            _abandon(future)
+            raise
+
+    async def stream(
+        self,
+        endpoint: str,
+        func: Callable[..., Iterable[Any]],
+        *args,
+        **kwargs
+    ) -> AsyncIterator[Any]:
+        """Iterate a blocking iterable in the pool, yielding items as they arrive.
+
+        The endpoint slot is held until the producer thread stops: when the
+        iterable is exhausted, or at the next item after the consumer stops
+        reading.
+        """
+        gate = self._get_gate(endpoint)
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        stop = threading.Event()
+
+        def produce():
+            try:
+                for item in func(*args, **kwargs):
+                    if stop.is_set():
+                        break
+                    loop.call_soon_threadsafe(queue.put_nowait, item)
+                loop.call_soon_threadsafe(queue.put_nowait, _STREAM_END)
+            except BaseException as e:
+                loop.call_soon_threadsafe(queue.put_nowait, e)
+
+        started_at = await self._enter(gate)
+        future = self._submit(gate, started_at, produce)
+        try:
+            while True:
+                item = await queue.get()
+                if item is _STREAM_END:
+                    break
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+            gate.completed += 1
+        except BaseException:
+            gate.failed += 1
+            raise
+        finally:
+            stop.set()
+            _abandon(future)
+
+    def stats(self) -> dict:
+        """Pool size plus per-endpoint queue depth and latency counters."""
+        return {
+            "max_workers": self.max_workers,
+            "endpoints": {name: gate.stats() for name, gate in self._gates.items()},
+        }
+
+    def shutdown(self):
+        """Stop the worker threads."""
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+# Global executor instance
+llm_executor = LLMExecutor(
+    max_workers=settings.LLM_EXECUTOR_WORKERS,
+    limits={
+        "generate": settings.LLM_CONCURRENCY_GENERATE,
+        "improve": settings.LLM_CONCURRENCY_IMPROVE,
+        "autocomplete": settings.LLM_CONCURRENCY_AUTOCOMPLETE,
+    }
+)
@@ -0,0 +1,103 @@
+import asyncio
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Optional
+from app.core.config import get_settings
+
+settings = get_settings()
+
+
+class Hedger:
+    """Hedge slow requests with a backup call and keep whichever answers first.
+
+    The hedge delay is a percentile of recently observed latencies, and
+    backup calls are capped at `budget` times the number of requests.
+    """
+
+    def __init__(
+        self,
+        percentile: float,
+        budget: float,
+        min_delay_ms: int,
+        window: int = 200,
+        min_samples: int = 20
+    ):
+        self.percentile = percentile
+        self.budget = budget
+        self.min_delay = min_delay_ms / 1000
+        self.min_samples = min_samples
+        self._latencies: deque[float] = deque(maxlen=window)
+        self.requests = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.budget_denied = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.percentile > 0 and self.budget > 0
+
+    def delay(self) -> Optional[float]:
+        """Current hedge delay in seconds, or None until enough samples exist."""
+        if len(self._latencies) < self.min_samples:
+            return None
+        ordered = sorted(self._latencies)
+        index = min(len(ordered) - 1, int(len(ordered) * self.percentile / 100))
+        return max(self.min_delay, ordered[index])
+
+    async def run(self, func: Callable[[], Awaitable[Any]]) -> Any:
+        """Await `func()`, firing one backup call if it is slower than the delay."""
+        self.requests += 1
+        started_at = time.perf_counter()
+        delay = self.delay() if self.enabled else None
+        if delay is None:
+            result = await func()
+            self._latencies.append(time.perf_counter() - started_at)
+            return result
+
+        primary = asyncio.ensure_future(func())
+        tasks = {primary}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if not done:
+                if self.hedges < self.budget * self.requests:
+                    self.hedges += 1
+                    tasks.add(asyncio.ensure_future(func()))
+                else:
+                    self.budget_denied += 1
+
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not primary:
+                            self.hedge_wins += 1
+                        self._latencies.append(time.perf_counter() - started_at)
+                        return task.result()
+            # Every attempt failed; surface the primary's error
+            return primary.result()
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def stats(self) -> dict:
+        """Hedge rate, win rate and the current delay."""
+        delay = self.delay()
+        return {
+            "enabled": self.enabled,
+            "percentile": self.percentile,
+            "delay_ms": round(delay * 1000, 2) if delay is not None else None,
+            "requests": self.requests,
+            "hedges": self.hedges,
+            "hedge_rate": round(self.hedges / self.requests, 4) if self.requests else 0.0,
+            "hedge_wins": self.hedge_wins,
+            "win_rate": round(self.hedge_wins / self.hedges, 4) if self.hedges else 0.0,
+            "budget_denied": self.budget_denied,
+        }
+
+
+# Global hedger for the autocomplete path
+autocomplete_hedger = Hedger(
+    percentile=settings.AUTOCOMPLETE_HEDGE_PERCENTILE,
+    budget=settings.AUTOCOMPLETE_HEDGE_BUDGET,
+    min_delay_ms=settings.AUTOCOMPLETE_HEDGE_MIN_DELAY_MS
+)
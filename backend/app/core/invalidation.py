@@ -0,0 +1,199 @@
+import asyncio
+from functools import partial
+from typing import Optional
+import redis.asyncio as redis
+from redis.exceptions import RedisError, ResponseError
+from app.core.cache import RedisCache
+from app.core.config import get_settings
+from app.core.memory_cache import MemoryCache
+
+settings = get_settings()
+
+TRACKING_CHANNEL = "__redis__:invalidate"
+INVALIDATION_CHANNEL = "cache:invalidate"
+
+
+class L1Invalidator:
+    """Keep each replica's in-process cache coherent with Redis.
+
+    Uses Redis server-assisted client-side caching in broadcast mode: one
+    connection subscribes to `__redis__:invalidate`, and a second one turns
+    on `CLIENT TRACKING ... REDIRECT <subscriber> BCAST PREFIX <prefix>
+    NOLOOP`, so Redis announces every write, delete or expiry of a key under
+    `prefixes` and the local copy is dropped right away. The second
+    connection also becomes the backend's writer: with NOLOOP, this replica's
+    own writes are not announced back to it and do not drop the L1 copies it
+    has just stored. Tracking is turned on again whenever that connection
+    reconnects, and the local cache is cleared since announcements may have
+    been missed in between.
+
+    Where tracking is unavailable (Redis < 6, or CLIENT disabled by a
+    managed service) only explicit deletes published on
+    `cache:invalidate` are propagated; overwrites then rely on the L1 TTL.
+
+    Whenever the subscription is lost, invalidations may have been missed,
+    so the local cache is cleared before reconnecting.
+
+    Each invalidation bumps the generation of its key's bucket (one of
+    `buckets`), and a flush bumps all of them. A reader that fetched a value
+    from Redis only copies it into the local cache if its key's generation
+    did not move while the read was in flight, since the reply may predate
+    a change whose invalidation was already applied.
+    """
+
+    def __init__(
+        self,
+        backend: RedisCache,
+        local: Optional[MemoryCache],
+        prefixes: tuple[str, ...],
+        check_interval: float = 5.0,
+        buckets: int = 4096
+    ):
+        self.backend = backend
+        self.local = local
+        self.prefixes = prefixes
+        self.check_interval = check_interval
+        self.tracking = False
+        self.subscribed = False
+        self.invalidations = 0
+        self.flushes = 0
+        self.subscriptions = 0
+        self._generations = [0] * buckets
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        """Start listening in the background; a no-op without an L1 tier or Redis."""
+        if self.local is None or not isinstance(self.backend, RedisCache):
+            return
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def publish(self, keys: list[str]):
+        """Announce deleted keys to the other replicas (tracking also sees them)."""
+        if self._task is None or not keys:
+            return
+        await self.backend.publish(INVALIDATION_CHANNEL, "\n".join(keys))
+
+    def generation(self, key: str) -> tuple[int, int]:
+        """Changes whenever `key` may have been invalidated."""
+        return self.flushes, self._generations[hash(key) % len(self._generations)]
+
+    def _flush(self):
+        self.local.clear()
+        self.flushes += 1
+
+    def _invalidate(self, keys: list[str]):
+        for key in keys:
+            self.local.delete(key)
+            self._generations[hash(key) % len(self._generations)] += 1
+        self.invalidations += len(keys)
+
+    def _handle(self, message: dict):
+        if message["type"] != "message":
+            return
+        data = message["data"]
+        if data is None:
+            # FLUSHDB/FLUSHALL: Redis does not list the keys
+            self._flush()
+        elif message["channel"] == TRACKING_CHANNEL.encode():
+            self._invalidate([key.decode() for key in data])
+        else:
+            self._invalidate(data.decode().split("\n"))
+
+    async def _run(self):
+        delay = settings.REDIS_RECONNECT_MIN_SECONDS
+        while True:
+            try:
+                await self._listen()
+            except (RedisError, OSError, asyncio.TimeoutError) as e:
+                if self.subscribed:
+                    print(f"⚠️  Lost L1 invalidations ({e!r}); clearing the local cache")
+                    self._flush()
+                    delay = settings.REDIS_RECONNECT_MIN_SECONDS
+            self.subscribed = False
+            self.tracking = False
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, settings.REDIS_RECONNECT_MAX_SECONDS)
+
+    async def _track(self, client_id: int, connection: redis.Connection):
+        """Connect hook of the writer: turn tracking on for every new connection."""
+        await connection.on_connect()
+        await connection.send_command(
+            "CLIENT", "TRACKING", "ON", "REDIRECT", client_id, "BCAST",
+            *[arg for prefix in self.prefixes for arg in ("PREFIX", prefix)], "NOLOOP"
+        )
+        await connection.read_response()
+        if self.tracking:
+            # Reconnected: writes made while tracking was off went unannounced
+            self._flush()
+        self.tracking = True
+
+    async def _listen(self):
+        # Dedicated connections outside the shared pool, without the per-operation
+        # timeout: the subscriber blocks until Redis has something to say
+        options = {**self.backend.pool.connection_kwargs, "socket_timeout": None}
+        client = redis.Redis(connection_pool=redis.ConnectionPool(**options))
+        pubsub = client.pubsub()
+        writer: Optional[redis.Redis] = None
+        try:
+            await pubsub.connect()
+            await pubsub.connection.send_command("CLIENT", "ID")
+            client_id = await pubsub.connection.read_response()
+            await pubsub.subscribe(TRACKING_CHANNEL, INVALIDATION_CHANNEL)
+
+            # A single connection, so that everything written through it is NOLOOP
+            writer = redis.Redis(connection_pool=redis.BlockingConnectionPool(
+                max_connections=1,
+                timeout=settings.REDIS_POOL_TIMEOUT,
+                redis_connect_func=partial(self._track, client_id),
+                **self.backend.pool.connection_kwargs
+            ))
+            try:
+                await writer.ping()
+                self.backend.writer = writer
+            except ResponseError as e:
+                print(f"⚠️  Redis client tracking unavailable ({e}); propagating deletes only")
+                await writer.aclose()
+                await writer.connection_pool.disconnect()
+                writer = None
+
+            # Anything cached before now may have changed unseen
+            self._flush()
+            self.subscribed = True
+            self.subscriptions += 1
+            while True:
+                message = await pubsub.get_message(timeout=self.check_interval)
+                if message is not None:
+                    self._handle(message)
+                elif writer is not None:
+                    # A hung connection, or tracking dying with its connection,
+                    # would otherwise go unnoticed while all is quiet
+                    async with asyncio.timeout(self.backend.op_timeout):
+                        await writer.ping()
+        finally:
+            if writer is not None:
+                if self.backend.writer is writer:
+                    self.backend.writer = None
+                await writer.aclose()
+                await writer.connection_pool.disconnect()
+            await pubsub.aclose()
+            await client.aclose()
+            await client.connection_pool.disconnect()
+
+    def stats(self) -> dict:
+        return {
+            "subscribed": self.subscribed,
+            "tracking": self.tracking,
+            "invalidations": self.invalidations,
+            "flushes": self.flushes,
+            "subscriptions": self.subscriptions,
+        }
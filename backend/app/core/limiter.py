@@ -0,0 +1,296 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional
+import httpx
+from google.api_core import exceptions as google_exceptions
+from app.core.config import get_settings
+from app.core.executor import abandoned_work
+from app.core.scheduler import FairQueue
+
+settings = get_settings()
+
+# Provider responses that mean "slow down" rather than "this request is bad"
+OVERLOAD_ERRORS = (
+    google_exceptions.ResourceExhausted,
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.TooManyRequests,
+)
+
+
+# Failures of the provider rather than of the request: another attempt may succeed
+TRANSIENT_ERRORS = OVERLOAD_ERRORS + (
+    google_exceptions.ServerError,
+    httpx.TransportError,
+    asyncio.TimeoutError,
+    ConnectionError,
+)
+
+
+def is_overload_error(exc: BaseException) -> bool:
+    """Whether an upstream error signals rate limiting or overload (429/503)."""
+    return isinstance(exc, OVERLOAD_ERRORS)
+
+
+def is_retryable_error(exc: BaseException) -> bool:
+    """Whether an upstream error is the provider's fault (overload, 5xx, timeout, network).
+
+    Bad or blocked input and the client's own deadline are not: any provider
+    would fail the same way.
+    """
+    return isinstance(exc, TRANSIENT_ERRORS)
+
+
+class EndpointWindow:
+    """AIMD window and latency history of one endpoint."""
+
+    def __init__(self, initial: int):
+        self.limit = float(initial)
+        self.in_flight = 0
+        self.samples: list[float] = []
+        self.min_p50: Optional[float] = None
+        self.increases = 0
+        self.decreases = 0
+
+    def stats(self) -> dict:
+        return {
+            "limit": int(self.limit),
+            "in_flight": self.in_flight,
+            "min_p50_ms": round(self.min_p50 * 1000, 2) if self.min_p50 else None,
+            "increases": self.increases,
+            "decreases": self.decreases,
+        }
+
+
+class AdaptiveLimiter:
+    """AIMD concurrency limiter for upstream LLM calls.
+
+    Each endpoint has its own window, since a code review is expected to take
+    far longer than an autocomplete and must not shrink its window. A window
+    is cut multiplicatively on 429/503 responses, or when the median latency
+    of the last `sample_size` calls exceeds `latency_tolerance` times the
+    lowest median seen so far (which drifts up by `baseline_drift` per batch
+    so a permanently slower model is eventually accepted). Single slow calls
+    from a long-tailed latency distribution therefore never cut it. A batch
+    without inflation grows the window by about one slot per window's worth
+    of calls.
+
+    All windows together are capped at `max_limit`. Callers waiting for a
+    slot are ordered by a weighted fair queue keyed by endpoint.
+    """
+
+    def __init__(
+        self,
+        initial: int,
+        min_limit: int,
+        max_limit: int,
+        backoff: float = 0.7,
+        latency_tolerance: float = 2.0,
+        sample_size: int = 50,
+        baseline_drift: float = 1.01,
+        queue: Optional[FairQueue] = None
+    ):
+        self.initial = initial
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.backoff = backoff
+        self.latency_tolerance = latency_tolerance
+        self.sample_size = sample_size
+        self.baseline_drift = baseline_drift
+        self._windows: dict[str, EndpointWindow] = {}
+        self._waiters = queue if queue is not None else FairQueue()
+        self._waiting: dict[asyncio.Future, str] = {}
+        self.in_flight = 0
+        self.baseline_latency: dict[str, float] = {}
+        self.overloads = 0
+        self.abandoned = 0
+        self.acquired = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def window(self, endpoint: str) -> EndpointWindow:
+        if endpoint not in self._windows:
+            self._windows[endpoint] = EndpointWindow(self.initial)
+        return self._windows[endpoint]
+
+    def limit(self, endpoint: str = "default") -> int:
+        return int(self.window(endpoint).limit)
+
+    def _has_room(self, endpoint: str) -> bool:
+        window = self.window(endpoint)
+        return self.in_flight < self.max_limit and window.in_flight < int(window.limit)
+
+    def _grant(self, endpoint: str):
+        self.window(endpoint).in_flight += 1
+        self.in_flight += 1
+
+    def _return(self, endpoint: str):
+        self.window(endpoint).in_flight -= 1
+        self.in_flight -= 1
+
+    async def acquire(self, endpoint: str = "default") -> float:
+        """Wait for a slot and return the time spent queued, in seconds."""
+        queued_at = time.perf_counter()
+        if not self._has_room(endpoint) or self._waiters.queued(endpoint):
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.push(waiter, endpoint)
+            self._waiting[waiter] = endpoint
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if waiter.done() and not waiter.cancelled():
+                    # Slot was handed over just before cancellation; pass it on
+                    self._return(endpoint)
+                    self._wake()
+                else:
+                    self._waiters.remove(waiter)
+                    self._waiting.pop(waiter, None)
+                raise
+        else:
+            self._grant(endpoint)
+
+        waited = time.perf_counter() - queued_at
+        self.acquired += 1
+        self.total_wait += waited
+        self.max_wait = max(self.max_wait, waited)
+        return waited
+
+    def release(
+        self,
+        latency: float,
+        endpoint: str = "default",
+        overloaded: bool = False,
+        failed: bool = False
+    ):
+        """Return a slot and adjust the endpoint's window from the call outcome.
+
+        Calls that failed for reasons unrelated to load (cancellation, bad
+        requests) leave the window unchanged.
+        """
+        self._return(endpoint)
+        window = self.window(endpoint)
+        if overloaded:
+            self.overloads += 1
+            self._decrease(window)
+        elif not failed:
+            window.samples.append(latency)
+            if len(window.samples) >= self.sample_size:
+                self._evaluate(endpoint, window)
+        self._wake()
+
+    def _evaluate(self, endpoint: str, window: EndpointWindow):
+        samples = sorted(window.samples)
+        window.samples.clear()
+        p50 = samples[len(samples) // 2]
+        expected = self.baseline_latency.get(endpoint)
+        self.baseline_latency[endpoint] = 0.8 * expected + 0.2 * p50 if expected else p50
+
+        if window.min_p50 is not None and p50 > window.min_p50 * self.latency_tolerance:
+            self._decrease(window)
+        else:
+            window.limit = min(self.max_limit, window.limit + len(samples) / window.limit)
+            window.increases += 1
+        if window.min_p50 is None:
+            window.min_p50 = p50
+        else:
+            window.min_p50 = min(p50, window.min_p50 * self.baseline_drift)
+
+    def _decrease(self, window: EndpointWindow):
+        window.limit = max(self.min_limit, window.limit * self.backoff)
+        window.decreases += 1
+
+    def _wake(self):
+        while self.in_flight < self.max_limit:
+            waiter = self._waiters.pop(eligible=self._has_room)
+            if waiter is None:
+                return
+            endpoint = self._waiting.pop(waiter)
+            if not waiter.done():
+                self._grant(endpoint)
+                waiter.set_result(None)
+
+    @asynccontextmanager
+    async def slot(self, endpoint: str = "default") -> AsyncIterator[None]:
+        """Hold a slot of `endpoint`'s window for the duration of one upstream call.
+
+        If the caller is cancelled while a blocking SDK call it started is
+        still running in the executor, the slot stays taken until that call
+        returns, since it still loads the provider.
+        """
+        await self.acquire(endpoint)
+        started_at = time.perf_counter()
+        overloaded = failed = False
+        pending: list = []
+        token = abandoned_work.set(pending)
+        try:
+            yield
+        except BaseException as e:
+            overloaded = is_overload_error(e)
+            failed = not overloaded
+            raise
+        finally:
+            try:
+                abandoned_work.reset(token)
+            except ValueError:
+                # Generator finalized from another context
+                pass
+            running = [future for future in pending if not future.done()]
+            if running:
+                self._release_when_done(running, endpoint)
+            else:
+                self.release(time.perf_counter() - started_at, endpoint, overloaded, failed)
+
+    def _release_when_done(self, futures: list, endpoint: str):
+        self.abandoned += 1
+        loop = asyncio.get_running_loop()
+        remaining = len(futures)
+
+        def settle():
+            nonlocal remaining
+            remaining -= 1
+            if remaining == 0:
+                self.release(0.0, endpoint, failed=True)
+
+        def finished(_):
+            try:
+                loop.call_soon_threadsafe(settle)
+            except RuntimeError:
+                pass
+
+        for future in futures:
+            future.add_done_callback(finished)
+
+    def stats(self) -> dict:
+        """Windows per endpoint, queue and adjustment counters."""
+        return {
+            "max_limit": self.max_limit,
+            "in_flight": self.in_flight,
+            "queued": len(self._waiters),
+            "endpoints": {name: window.stats() for name, window in self._windows.items()},
+            "baseline_latency_ms": {
+                name: round(latency * 1000, 2) for name, latency in self.baseline_latency.items()
+            },
+            "avg_wait_ms": (
+                round(self.total_wait / self.acquired * 1000, 2) if self.acquired else 0.0
+            ),
+            "max_wait_ms": round(self.max_wait * 1000, 2),
+            "overloads": self.overloads,
+            "abandoned": self.abandoned,
+            "scheduler": self._waiters.stats(),
+        }
+
+
+# Global limiter for upstream LLM calls
+llm_limiter = AdaptiveLimiter(
+    initial=settings.LLM_LIMIT_INITIAL,
+    min_limit=settings.LLM_LIMIT_MIN,
+    max_limit=settings.LLM_LIMIT_MAX,
+    queue=FairQueue(
+        weights={
+            "autocomplete": settings.SCHEDULER_WEIGHT_AUTOCOMPLETE,
+            "generate": settings.SCHEDULER_WEIGHT_GENERATE,
+            "improve": settings.SCHEDULER_WEIGHT_IMPROVE,
+        },
+        max_wait=settings.SCHEDULER_MAX_WAIT_MS / 1000
+    )
+)
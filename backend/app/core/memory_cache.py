@@ -0,0 +1,222 @@
+import json
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+from app.core.sketch import CountMinSketch
+
+WINDOW = "window"
+PROBATION = "probation"
+PROTECTED = "protected"
+
+
+def estimate_size(key: str, value: Any) -> int:
+    """Approximate memory cost of an entry, in bytes."""
+    if isinstance(value, str):
+        payload = len(value.encode())
+    else:
+        payload = len(json.dumps(value, default=str).encode())
+    return payload + len(key) + 64
+
+
+class MemoryCache:
+    """In-process cache with per-entry TTL, a memory budget in bytes and
+    W-TinyLFU admission.
+
+    New entries land in a small LRU window (`window` of the budget). Entries
+    pushed out of the window only enter the main area if a count-min sketch
+    says they are requested more often than the main area's eviction victim,
+    so a burst of one-off keys cannot flush the hot set. The main area is a
+    segmented LRU: entries hit again move from probation to protected (80%
+    of the main area). Sketch counts are halved every `10 * sketch_width`
+    accesses so that old popularity fades. `admitted` and `rejected` count
+    the candidates that had to compete for a full main area.
+
+    `window=1.0` turns admission off and gives a plain LRU cache.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int,
+        default_ttl: int,
+        window: float = 0.01,
+        sketch_width: int = 8192
+    ):
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        self.window_bytes = max_bytes * window
+        self.protected_bytes = (max_bytes - self.window_bytes) * 0.8
+        self._segments: dict[str, OrderedDict[str, tuple[Any, int, float]]] = {
+            WINDOW: OrderedDict(),
+            PROBATION: OrderedDict(),
+            PROTECTED: OrderedDict(),
+        }
+        self._segment_bytes = dict.fromkeys(self._segments, 0)
+        self._where: dict[str, str] = {}
+        self.admission = window < 1.0
+        self.sketch = CountMinSketch(sketch_width) if self.admission else None
+        self.sample_size = 10 * sketch_width
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.admitted = 0
+        self.rejected = 0
+
+    def __len__(self) -> int:
+        return len(self._where)
+
+    def _record(self, key: str):
+        if self.sketch is None:
+            return
+        self.sketch.add(key)
+        if self.sketch.total >= self.sample_size:
+            self.sketch.halve()
+
+    def _frequency(self, key: str) -> int:
+        return self.sketch.estimate(key)
+
+    def get(self, key: str) -> Optional[Any]:
+        """Return a live entry and mark it recently used."""
+        self._record(key)
+        segment = self._where.get(key)
+        if segment is None:
+            self.misses += 1
+            return None
+
+        value, size, expires_at = self._segments[segment][key]
+        if expires_at <= time.monotonic():
+            self._remove(key)
+            self.expirations += 1
+            self.misses += 1
+            return None
+
+        if segment == PROBATION:
+            self._move(key, PROTECTED)
+            self._demote_protected()
+        else:
+            self._segments[segment].move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: str, value: Any, ttl: Optional[int] = None):
+        """Store an entry in the window, then settle what it pushes out."""
+        size = estimate_size(key, value)
+        expires_at = time.monotonic() + (ttl if ttl is not None else self.default_ttl)
+        segment = self._where.get(key)
+        if segment is not None:
+            # An update keeps the entry's place; only the size may change
+            self._remove(key)
+            if size <= self.max_bytes:
+                self._insert(key, (value, size, expires_at), segment)
+                self._shrink(keep=key)
+            return
+
+        self._record(key)
+        if size > self.max_bytes:
+            return
+        self._insert(key, (value, size, expires_at), WINDOW)
+        window = self._segments[WINDOW]
+        # The window always keeps the newest entry, however small its share
+        while self._segment_bytes[WINDOW] > self.window_bytes and len(window) > 1:
+            self._admit(next(iter(window)))
+
+    def _admit(self, candidate: str):
+        """Move a window entry to probation if it beats the main area's victims."""
+        self._move(candidate, PROBATION)
+        if self.bytes <= self.max_bytes:
+            return
+        if not self.admission:
+            self._remove(candidate)
+            self.evictions += 1
+            return
+
+        victim = self._victim(exclude=candidate)
+        if victim is not None and self._frequency(candidate) <= self._frequency(victim):
+            self._remove(candidate)
+            self.rejected += 1
+            self.evictions += 1
+            return
+        self.admitted += 1
+        while self.bytes > self.max_bytes:
+            victim = self._victim(exclude=candidate)
+            if victim is None:
+                break
+            self._remove(victim)
+            self.evictions += 1
+        if self.bytes > self.max_bytes:
+            self._remove(candidate)
+            self.evictions += 1
+
+    def _shrink(self, keep: str):
+        for segment in (PROBATION, PROTECTED, WINDOW):
+            entries = self._segments[segment]
+            while self.bytes > self.max_bytes and entries:
+                victim = next(iter(entries))
+                if victim == keep:
+                    if len(entries) == 1:
+                        break
+                    entries.move_to_end(keep)
+                    continue
+                self._remove(victim)
+                self.evictions += 1
+
+    def _victim(self, exclude: str) -> Optional[str]:
+        for segment in (PROBATION, PROTECTED):
+            for key in self._segments[segment]:
+                if key != exclude:
+                    return key
+        return None
+
+    def _demote_protected(self):
+        protected = self._segments[PROTECTED]
+        while self._segment_bytes[PROTECTED] > self.protected_bytes and len(protected) > 1:
+            self._move(next(iter(protected)), PROBATION)
+
+    def _insert(self, key: str, entry: tuple[Any, int, float], segment: str):
+        self._segments[segment][key] = entry
+        self._segment_bytes[segment] += entry[1]
+        self._where[key] = segment
+        self.bytes += entry[1]
+
+    def _move(self, key: str, segment: str):
+        entry = self._segments[self._where[key]][key]
+        self._remove(key)
+        self._insert(key, entry, segment)
+
+    def delete(self, key: str):
+        """Drop an entry if present."""
+        if key in self._where:
+            self._remove(key)
+
+    def clear(self):
+        """Drop every entry."""
+        for segment in self._segments.values():
+            segment.clear()
+        self._segment_bytes = dict.fromkeys(self._segments, 0)
+        self._where.clear()
+        self.bytes = 0
+
+    def _remove(self, key: str):
+        segment = self._where.pop(key)
+        _, size, _ = self._segments[segment].pop(key)
+        self._segment_bytes[segment] -= size
+        self.bytes -= size
+
+    def stats(self) -> dict:
+        """Occupancy and hit/miss/eviction/admission counters."""
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._where),
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "policy": "w-tinylfu" if self.admission else "lru",
+            "segment_bytes": dict(self._segment_bytes),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+        }
@@ -0,0 +1,39 @@
+import json
+import time
+from typing import IO, Any, Optional
+from app.core.config import get_settings
+
+settings = get_settings()
+
+
+class RequestLog:
+    """Append-only JSON-lines log of served requests, used to warm the cache.
+
+    Disabled when `path` is empty. Each line is
+    `{"ts": ..., "endpoint": ..., <request fields>}`.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file: Optional[IO[str]] = None
+
+    def record(self, endpoint: str, **fields: Any):
+        """Append one request; never fails the request being served."""
+        if not self.path:
+            return
+        try:
+            if self._file is None:
+                self._file = open(self.path, "a", buffering=1, encoding="utf-8")
+            record = {"ts": time.time(), "endpoint": endpoint, **fields}
+            self._file.write(json.dumps(record) + "\n")
+        except OSError as e:
+            print(f"⚠️  Could not write request log: {e}")
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+# Global request log, disabled unless REQUEST_LOG_PATH is set
+request_log = RequestLog(settings.REQUEST_LOG_PATH)
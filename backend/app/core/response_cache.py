@@ -0,0 +1,559 @@
+import asyncio
+import contextvars
+import hashlib
+import json
+import math
+import random
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Iterator, Optional
+from google.api_core import exceptions as google_exceptions
+from google.generativeai.types import BlockedPromptException, StopCandidateException
+from app.core.cache import RedisCache, cache
+from app.core.circuit_breaker import CircuitBreaker
+from app.core.disk_cache import DiskCache
+from app.core.invalidation import L1Invalidator
+from app.core.config import get_settings
+from app.core.memory_cache import MemoryCache
+from app.core.singleflight import llm_singleflight
+
+settings = get_settings()
+
+# Marks values stored with expiry metadata; bare values predate it
+ENTRY_MARKER = "__cache_entry__"
+
+# Set around a producer whose value is about to be cached; the producer may
+# report where the value came from (`provider`, `model`) for the entry's metadata
+entry_origin: ContextVar[Optional[dict]] = ContextVar("entry_origin", default=None)
+
+
+@contextmanager
+def recording_origin() -> Iterator[dict]:
+    """Collect what producers inside the block report through `entry_origin`."""
+    origin: dict = {}
+    token = entry_origin.set(origin)
+    try:
+        yield origin
+    finally:
+        try:
+            entry_origin.reset(token)
+        except ValueError:
+            # Generator finalized from another context
+            pass
+
+
+def normalize_prompt(text: Optional[str]) -> str:
+    """Collapse whitespace in natural-language input so formatting does not split keys."""
+    return " ".join((text or "").split())
+
+
+def normalize_code(text: Optional[str]) -> str:
+    """Normalize line endings and trailing whitespace, keeping indentation intact."""
+    lines = (text or "").replace("\r\n", "\n").replace("\r", "\n").split("\n")
+    return "\n".join(line.rstrip() for line in lines).strip("\n")
+
+
+def make_cache_key(namespace: str, **parts: Any) -> str:
+    """Build a stable, content-addressed key from already-normalized parts.
+
+    Parts are serialized as canonical JSON and hashed with SHA-256, so the
+    same inputs give the same key in every process and on every worker.
+    """
+    canonical = json.dumps(parts, sort_keys=True, separators=(",", ":"), default=str)
+    return f"{namespace}:{hashlib.sha256(canonical.encode()).hexdigest()}"
+
+
+def estimate_tokens(text: Any) -> int:
+    """Rough token count (about four characters per token) for savings estimates."""
+    return len(text) // 4 + 1 if isinstance(text, str) else 0
+
+
+def _percentiles(samples: deque) -> dict:
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+
+    def pick(q: float):
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    return {"p50": pick(0.5), "p90": pick(0.9), "p99": pick(0.99), "max": ordered[-1]}
+
+
+class NamespaceStats:
+    """Hit/miss counters, estimated savings and sampled sizes for one key namespace."""
+
+    def __init__(self, sample_size: int):
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.negative_hits = 0
+        self.stores = 0
+        self.saved_seconds = 0.0
+        self.saved_tokens = 0
+        self.entry_bytes: deque = deque(maxlen=sample_size)
+        self.hit_age_seconds: deque = deque(maxlen=sample_size)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses + self.negative_hits
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "stale": self.stale,
+            "negative_hits": self.negative_hits,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "stale_rate": round(self.stale / self.hits, 4) if self.hits else 0.0,
+            "stores": self.stores,
+            "upstream_seconds_saved": round(self.saved_seconds, 2),
+            "tokens_saved": self.saved_tokens,
+            "entry_bytes": _percentiles(self.entry_bytes),
+            "hit_age_seconds": _percentiles(self.hit_age_seconds),
+        }
+
+
+def is_deterministic_error(exc: BaseException) -> bool:
+    """Whether retrying the same prompt would fail the same way (bad or blocked input)."""
+    if isinstance(exc, (BlockedPromptException, StopCandidateException)):
+        return True
+    return (
+        isinstance(exc, google_exceptions.GoogleAPICallError)
+        and exc.code is not None
+        and 400 <= exc.code < 500
+        and exc.code not in (408, 429)
+    )
+
+
+class ResponseCache:
+    """Cache-through layer for LLM responses.
+
+    An optional in-process tier (L1) sits in front of the shared backend
+    (L2, Redis). L1 hits are answered without any network I/O; L2 hits are
+    copied into L1 for subsequent requests on this worker. An `invalidator`
+    drops L1 copies when their key changes in Redis, on any replica, and L2
+    replies that raced with an invalidation are not copied.
+
+    Entries carry a soft expiry before the hard (backend) TTL. A stale entry
+    is still served while one background task refreshes it, and hits close
+    to the soft expiry refresh early with a probability that grows with the
+    entry's recompute cost and with traffic, so popular keys rarely go stale
+    (probabilistic early expiration). Both TTLs are jittered. Deterministic
+    upstream errors are cached for `negative_ttl` seconds and re-raised.
+
+    A miss is computed once per key across replicas: concurrent callers in
+    this process share one call, and the backend's `get_or_lock` lets a
+    single process compute while the others wait up to `lock_wait` seconds
+    for its result. `get(lock=True)` reads through `get_or_lock`, so a miss
+    costs one backend round trip before computing.
+
+    Each entry records how it was produced (upstream latency, estimated
+    tokens, provider and model, creation time), so hits can be turned into
+    savings per key namespace. Entry sizes and hit ages are sampled at
+    `sample_rate`.
+    """
+
+    def __init__(
+        self,
+        backend: RedisCache | DiskCache,
+        local: Optional[MemoryCache] = None,
+        invalidator: Optional[L1Invalidator] = None,
+        ttl: int = settings.CACHE_TTL,
+        soft_ttl: int = settings.CACHE_SOFT_TTL,
+        jitter: float = settings.CACHE_TTL_JITTER,
+        negative_ttl: int = settings.CACHE_NEGATIVE_TTL,
+        refresh_beta: float = settings.CACHE_REFRESH_AHEAD_BETA,
+        sample_rate: float = settings.CACHE_STATS_SAMPLE_RATE,
+        sample_size: int = 1000,
+        lock_ttl_ms: int = settings.CACHE_LOCK_TTL_MS,
+        lock_wait: float = settings.CACHE_LOCK_WAIT_SECONDS
+    ):
+        self.backend = backend
+        self.local = local
+        self.invalidator = invalidator
+        self.ttl = ttl
+        self.soft_ttl = min(soft_ttl, ttl)
+        self.jitter = jitter
+        self.negative_ttl = negative_ttl
+        self.refresh_beta = refresh_beta
+        self.sample_rate = sample_rate
+        self.sample_size = sample_size
+        self.lock_ttl_ms = lock_ttl_ms
+        self.lock_wait = lock_wait
+        self._namespaces: dict[str, NamespaceStats] = {}
+        self._refreshing: dict[str, asyncio.Task] = {}
+        self._held: dict[str, str] = {}
+        self.stale_served = 0
+        self.refreshes_ahead = 0
+        self.refreshes = 0
+        self.refresh_failures = 0
+        self.negative_stored = 0
+        self.negative_hits = 0
+        self.lock_waits = 0
+        self.computed_elsewhere = 0
+
+    def _namespace(self, key: str) -> NamespaceStats:
+        namespace = key.rsplit(":", 1)[0]
+        stats = self._namespaces.get(namespace)
+        if stats is None:
+            stats = self._namespaces[namespace] = NamespaceStats(self.sample_size)
+        return stats
+
+    def _sampled(self) -> bool:
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def _jittered(self, seconds: float) -> float:
+        return seconds * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    async def _store(self, key: str, entry: dict, ttl: int):
+        if self.local is not None:
+            self.local.set(key, entry, ttl=min(self.local.default_ttl, ttl))
+        await self.backend.set(key, entry, ttl=ttl)
+        await self.release(key)
+
+    @staticmethod
+    def _cached_error(entry: dict) -> Exception:
+        return google_exceptions.from_http_status(entry["status"], f"{entry['error']} (cached)")
+
+    def _promote(self, key: str, entry: Any):
+        """Copy an L2 hit into L1, for no longer than it has left in L2."""
+        ttl = self.local.default_ttl
+        if isinstance(entry, dict) and "expires_at" in entry:
+            ttl = min(ttl, int(entry["expires_at"] - time.time()))
+        if ttl > 0:
+            self.local.set(key, entry, ttl=ttl)
+
+    def _generation(self, key: str) -> Optional[tuple[int, int]]:
+        return self.invalidator.generation(key) if self.invalidator is not None else None
+
+    async def _load(self, key: str, lock: bool = False) -> Optional[dict]:
+        entry = self.local.get(key) if self.local is not None else None
+        if entry is None:
+            generation = self._generation(key)
+            if lock:
+                entry, token = await self.backend.get_or_lock(key, self.lock_ttl_ms)
+                if token is not None:
+                    self._held[key] = token
+            else:
+                entry = await self.backend.get(key)
+            if entry is not None and self.local is not None and self._generation(key) == generation:
+                self._promote(key, entry)
+        if entry is not None and not (isinstance(entry, dict) and ENTRY_MARKER in entry):
+            entry = {ENTRY_MARKER: 1, "value": entry}
+        return entry
+
+    async def get(
+        self,
+        key: str,
+        refresh: Optional[Callable[[], Awaitable[Any]]] = None,
+        lock: bool = False
+    ) -> Optional[Any]:
+        """Look a key up in L1, then with a single backend round trip.
+
+        With `refresh`, a stale or nearly stale entry is still returned and
+        refreshed in the background. A cached upstream error is re-raised.
+        With `lock`, a miss also takes the lock to compute the key in that
+        same round trip; the caller must then `compute` or `release` it.
+        """
+        entry = await self._load(key, lock)
+        stats = self._namespace(key)
+        if entry is None:
+            stats.misses += 1
+            return None
+
+        if "error" in entry:
+            self.negative_hits += 1
+            stats.negative_hits += 1
+            raise self._cached_error(entry)
+
+        stats.hits += 1
+        stats.saved_seconds += entry.get("cost", 0.0)
+        stats.saved_tokens += entry.get("input_tokens", 0) + entry.get("output_tokens", 0)
+        if "created_at" in entry and self._sampled():
+            stats.hit_age_seconds.append(round(time.time() - entry["created_at"], 1))
+
+        soft_expires_at = entry.get("soft_expires_at")
+        if soft_expires_at is not None:
+            now = time.time()
+            if now >= soft_expires_at:
+                self.stale_served += 1
+                stats.stale += 1
+                if refresh is not None:
+                    self._refresh(key, refresh, entry)
+            elif refresh is not None and self.refresh_beta > 0:
+                # Draw an early refresh time from an exponential whose scale is the recompute cost
+                cost = entry.get("cost", 0.0) * self.refresh_beta
+                early = cost * -math.log(1.0 - random.random())
+                if now + early >= soft_expires_at and self._refresh(key, refresh, entry):
+                    self.refreshes_ahead += 1
+        return entry["value"]
+
+    async def get_many(self, keys: list[str]) -> list[Optional[Any]]:
+        """Look several keys up with at most one backend round trip.
+
+        Meant for maintenance flows such as warming: stale entries count as
+        present, cached errors as absent, and traffic counters are untouched.
+        """
+        entries: list[Optional[Any]] = [
+            self.local.get(key) if self.local is not None else None for key in keys
+        ]
+        missing = [i for i, entry in enumerate(entries) if entry is None]
+        if missing:
+            generations = [self._generation(keys[i]) for i in missing]
+            fetched = await self.backend.mget([keys[i] for i in missing])
+            for i, entry, generation in zip(missing, fetched, generations):
+                entries[i] = entry
+                if (
+                    entry is not None
+                    and self.local is not None
+                    and self._generation(keys[i]) == generation
+                ):
+                    self._promote(keys[i], entry)
+
+        values = []
+        for entry in entries:
+            if isinstance(entry, dict) and ENTRY_MARKER in entry:
+                entry = entry.get("value")
+            values.append(entry)
+        return values
+
+    async def set(
+        self,
+        key: str,
+        value: Any,
+        cost: float = 0.0,
+        model: Optional[str] = None,
+        input_tokens: int = 0,
+        provider: Optional[str] = None
+    ):
+        """Store a value in both tiers.
+
+        `cost` is the upstream seconds it took to compute, `provider`, `model`
+        and `input_tokens` describe the call that produced it.
+        """
+        now = time.time()
+        soft_ttl = self._jittered(self.soft_ttl)
+        ttl = max(int(self._jittered(self.ttl)), math.ceil(soft_ttl))
+        entry = {
+            ENTRY_MARKER: 1,
+            "value": value,
+            "soft_expires_at": now + soft_ttl,
+            "expires_at": now + ttl,
+            "created_at": now,
+            "cost": round(cost, 3),
+            "provider": provider,
+            "model": model,
+            "input_tokens": input_tokens,
+            "output_tokens": estimate_tokens(value),
+        }
+        stats = self._namespace(key)
+        stats.stores += 1
+        if self._sampled():
+            stats.entry_bytes.append(len(json.dumps(entry, default=str)))
+        await self._store(key, entry, ttl)
+
+    async def set_error(self, key: str, exc: BaseException) -> bool:
+        """Cache a deterministic upstream error briefly; other errors are not cached."""
+        if self.negative_ttl <= 0 or not is_deterministic_error(exc):
+            return False
+        status = getattr(exc, "code", None) or 400
+        message = getattr(exc, "message", None) or str(exc)
+        entry = {
+            ENTRY_MARKER: 1,
+            "error": message[:500],
+            "status": status,
+            "expires_at": time.time() + self.negative_ttl,
+        }
+        await self._store(key, entry, self.negative_ttl)
+        self.negative_stored += 1
+        return True
+
+    def _refresh(self, key: str, func: Callable[[], Awaitable[Any]], entry: dict) -> bool:
+        """Start one background refresh for `key` unless one is already running."""
+        if key in self._refreshing:
+            return False
+        # A fresh context so the triggering request's deadline does not apply
+        task = asyncio.get_running_loop().create_task(
+            self._run_refresh(key, func, entry.get("model"), entry.get("input_tokens", 0)),
+            context=contextvars.Context()
+        )
+        self._refreshing[key] = task
+        task.add_done_callback(lambda _: self._refreshing.pop(key, None))
+        return True
+
+    async def _run_refresh(
+        self,
+        key: str,
+        func: Callable[[], Awaitable[Any]],
+        model: Optional[str],
+        input_tokens: int
+    ):
+        started_at = time.perf_counter()
+        try:
+            value, origin = await self._produce(func)
+            await self.set(
+                key,
+                value,
+                cost=time.perf_counter() - started_at,
+                input_tokens=input_tokens,
+                **{"model": model, **origin}
+            )
+            self.refreshes += 1
+        except Exception as e:
+            self.refresh_failures += 1
+            print(f"⚠️  Background refresh of {key} failed: {e}")
+
+    @staticmethod
+    async def _produce(func: Callable[[], Awaitable[Any]]) -> tuple[Any, dict]:
+        """Await `func`, collecting what it reports through `entry_origin`."""
+        with recording_origin() as origin:
+            return await func(), origin
+
+    async def delete(self, key: str):
+        """Remove a key from both tiers."""
+        if self.local is not None:
+            self.local.delete(key)
+        await self.backend.delete(key)
+        if self.invalidator is not None:
+            await self.invalidator.publish([key])
+
+    async def compute(
+        self,
+        key: str,
+        func: Callable[[], Awaitable[Any]],
+        model: Optional[str] = None,
+        input_tokens: int = 0
+    ) -> Any:
+        """Run `func` once across concurrent callers for `key` and store the result.
+
+        If another replica stores the key while this one waits for its lock,
+        that result (or cached error) is returned instead. `model` is
+        recorded unless the producer reports its own origin.
+        """
+        async def compute_and_store() -> Any:
+            entry, token = None, self._held.pop(key, None)
+            if token is None:
+                entry, token = await self._lock(key)
+            if entry is not None:
+                self.computed_elsewhere += 1
+                if not (isinstance(entry, dict) and ENTRY_MARKER in entry):
+                    return entry
+                if "error" in entry:
+                    raise self._cached_error(entry)
+                return entry["value"]
+
+            started_at = time.perf_counter()
+            try:
+                value, origin = await self._produce(func)
+            except Exception as e:
+                await self.set_error(key, e)
+                raise
+            else:
+                await self.set(
+                    key,
+                    value,
+                    cost=time.perf_counter() - started_at,
+                    input_tokens=input_tokens,
+                    **{"model": model, **origin}
+                )
+            finally:
+                if token is not None:
+                    await self.backend.release_lock(key, token)
+            return value
+
+        return await llm_singleflight.do(key, compute_and_store)
+
+    async def release(self, key: str):
+        """Give up the lock a `get(lock=True)` miss took, if this process holds it."""
+        token = self._held.pop(key, None)
+        if token is not None:
+            await self.backend.release_lock(key, token)
+
+    async def _lock(self, key: str) -> tuple[Optional[Any], Optional[str]]:
+        """Take the backend lock to compute `key`, waiting while another process holds it.
+
+        Returns `(entry, None)` once the key has been stored meanwhile, and
+        `(None, token)` with the lock. `(None, None)` means computing without
+        the lock: the backend is unavailable or the wait ran out.
+        """
+        give_up_at = time.monotonic() + self.lock_wait
+        delay = 0.05
+        while True:
+            entry, token = await self.backend.get_or_lock(key, self.lock_ttl_ms)
+            if entry is not None or token is not None:
+                return entry, token
+            if (
+                not self.backend.connected
+                or self.backend.breaker.state != CircuitBreaker.CLOSED
+                or time.monotonic() + delay > give_up_at
+            ):
+                return None, None
+            self.lock_waits += 1
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 0.5)
+
+    def namespace_stats(self) -> dict:
+        """Effectiveness and estimated savings per key namespace (endpoint)."""
+        return {namespace: stats.stats() for namespace, stats in self._namespaces.items()}
+
+    def stats(self) -> dict:
+        """Staleness, refresh and negative caching counters, plus overall savings."""
+        hits = sum(stats.hits for stats in self._namespaces.values())
+        lookups = hits + sum(
+            stats.misses + stats.negative_hits for stats in self._namespaces.values()
+        )
+        return {
+            "hits": hits,
+            "lookups": lookups,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            "upstream_seconds_saved": round(
+                sum(stats.saved_seconds for stats in self._namespaces.values()), 2
+            ),
+            "tokens_saved": sum(stats.saved_tokens for stats in self._namespaces.values()),
+            "stale_served": self.stale_served,
+            "refreshes_ahead": self.refreshes_ahead,
+            "refreshes": self.refreshes,
+            "refresh_failures": self.refresh_failures,
+            "refreshing": len(self._refreshing),
+            "negative_stored": self.negative_stored,
+            "negative_hits": self.negative_hits,
+            "lock_waits": self.lock_waits,
+            "computed_elsewhere": self.computed_elsewhere,
+        }
+
+
+async def sweep_namespaces(
+    backend: RedisCache | DiskCache,
+    namespaces: dict[str, str],
+    batch: int = 500,
+    pause: float = 0.05
+) -> int:
+    """Unlink keys left behind by older versions of each namespace family.
+
+    `namespaces` maps a family prefix (e.g. `gemini:generate`) to its current
+    namespace; keys under the family that are not under the current namespace
+    are dropped a batch at a time, pausing between batches so the sweep
+    stays in the background. Families whose namespace did not change lose
+    nothing. Returns the number of keys removed.
+    """
+    removed = 0
+    for family, current in namespaces.items():
+        cursor = 0
+        while True:
+            cursor, keys = await backend.scan(f"{family}:*", cursor=cursor, count=batch)
+            stale = [key for key in keys if not key.startswith(f"{current}:")]
+            if stale:
+                removed += await backend.delete_many(stale)
+            if cursor == 0:
+                break
+            await asyncio.sleep(pause)
+    return removed
+
+
+# Global response cache instance; L1 copies are kept coherent across replicas
+_local = MemoryCache(
+    max_bytes=settings.L1_CACHE_MAX_BYTES,
+    default_ttl=settings.L1_CACHE_TTL,
+    window=settings.L1_CACHE_WINDOW
+) if settings.L1_CACHE_MAX_BYTES > 0 else None
+l1_invalidator = L1Invalidator(cache, _local, prefixes=("gemini:",))
+response_cache = ResponseCache(cache, local=_local, invalidator=l1_invalidator)
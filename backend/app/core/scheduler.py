@@ -0,0 +1,107 @@
+import asyncio
+import time
+from collections import deque
+from typing import Callable, Optional
+
+
+class _Waiter:
+    __slots__ = ("future", "tag", "enqueued_at")
+
+    def __init__(self, future: asyncio.Future, tag: float, enqueued_at: float):
+        self.future = future
+        self.tag = tag
+        self.enqueued_at = enqueued_at
+
+
+class FairQueue:
+    """Weighted fair queue of waiters, one FIFO lane per priority class.
+
+    Each waiter gets a virtual finish tag of `1 / weight` after the later of
+    the current virtual time and its lane's previous tag, and the smallest
+    tag is served first. A lane whose head has waited longer than `max_wait`
+    is served ahead of the tags so low-weight work is never starved.
+    """
+
+    def __init__(self, weights: Optional[dict[str, float]] = None, max_wait: float = 2.0):
+        self.weights = weights or {}
+        self.max_wait = max_wait
+        self._lanes: dict[str, deque[_Waiter]] = {}
+        self._last_tag: dict[str, float] = {}
+        self._virtual_time = 0.0
+        self.served: dict[str, int] = {}
+        self.promoted: dict[str, int] = {}
+        self.total_wait: dict[str, float] = {}
+
+    def __len__(self) -> int:
+        return sum(len(lane) for lane in self._lanes.values())
+
+    def __bool__(self) -> bool:
+        return any(self._lanes.values())
+
+    def push(self, future: asyncio.Future, priority: str):
+        """Queue a waiter in its priority lane."""
+        weight = self.weights.get(priority, 1.0)
+        tag = max(self._virtual_time, self._last_tag.get(priority, 0.0)) + 1.0 / weight
+        self._last_tag[priority] = tag
+        self._lanes.setdefault(priority, deque()).append(_Waiter(future, tag, time.monotonic()))
+
+    def queued(self, priority: str) -> int:
+        """Number of waiters in one lane."""
+        return len(self._lanes.get(priority, ()))
+
+    def pop(
+        self,
+        eligible: Optional[Callable[[str], bool]] = None
+    ) -> Optional[asyncio.Future]:
+        """Remove and return the next waiter to serve, or None if empty.
+
+        With `eligible`, lanes it rejects are skipped, e.g. classes that are
+        at their own concurrency limit.
+        """
+        now = time.monotonic()
+        best = None
+        starving = None
+        for priority, lane in self._lanes.items():
+            if not lane or (eligible is not None and not eligible(priority)):
+                continue
+            head = lane[0]
+            if now - head.enqueued_at >= self.max_wait:
+                if starving is None or head.enqueued_at < self._lanes[starving][0].enqueued_at:
+                    starving = priority
+            if best is None or head.tag < self._lanes[best][0].tag:
+                best = priority
+
+        if best is None:
+            return None
+        if starving is not None and starving != best:
+            self.promoted[starving] = self.promoted.get(starving, 0) + 1
+            best = starving
+
+        waiter = self._lanes[best].popleft()
+        self._virtual_time = max(self._virtual_time, waiter.tag)
+        self.served[best] = self.served.get(best, 0) + 1
+        self.total_wait[best] = self.total_wait.get(best, 0.0) + now - waiter.enqueued_at
+        return waiter.future
+
+    def remove(self, future: asyncio.Future):
+        """Drop a waiter that gave up before being served."""
+        for lane in self._lanes.values():
+            for waiter in lane:
+                if waiter.future is future:
+                    lane.remove(waiter)
+                    return
+
+    def stats(self) -> dict:
+        """Per-class queue depth, served count, starvation promotions and wait."""
+        return {
+            priority: {
+                "weight": self.weights.get(priority, 1.0),
+                "queued": len(lane),
+                "served": self.served.get(priority, 0),
+                "promoted": self.promoted.get(priority, 0),
+                "avg_wait_ms": round(
+                    self.total_wait.get(priority, 0.0) / self.served[priority] * 1000, 2
+                ) if self.served.get(priority) else 0.0,
+            }
+            for priority, lane in self._lanes.items()
+        }
@@ -0,0 +1,244 @@
+import hashlib
+import re
+import tempfile
+import zlib
+from typing import Optional
+import numpy as np
+from app.core.config import get_settings
+
+settings = get_settings()
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+_STOP_WORDS = frozenset(
+    "a an and as at by for from in into of on or the then to using via with".split()
+)
+_NUMBER = re.compile(r"\d+(?:\.\d+)?")
+_QUOTED = re.compile(r"""(["'`])(.+?)\1""")
+# Words whose order decides what an ETL prompt reads from and writes to
+_ENDPOINTS = frozenset(
+    "s3 gcs hdfs sftp ftp azure blob postgres postgresql mysql sqlite oracle mssql "
+    "snowflake bigquery redshift databricks mongodb dynamodb cassandra elasticsearch "
+    "kafka kinesis pubsub redis api rest csv json parquet avro orc excel xlsx".split()
+)
+_DIRECTIONS = frozenset("from to into onto".split())
+# Words that flip or bound a filter while barely moving the embedding
+_QUALIFIERS = frozenset(
+    "older newer before after earlier later greater less more fewer above below over "
+    "under least most min max minimum maximum first last top bottom asc desc ascending "
+    "descending not no without except excluding exclude including include only".split()
+)
+
+
+def embed(text: str, dim: int) -> np.ndarray:
+    """Embed text as a unit-length vector of hashed word and character n-grams.
+
+    Features are words, adjacent word pairs and character trigrams of each
+    word, hashed into `dim` buckets with a sign bit. The trigrams let
+    inflections ("load" / "loader") overlap; no model or network is needed,
+    and the hashing is stable across processes.
+    """
+    vector = np.zeros(dim, dtype=np.float32)
+    words = [word for word in _TOKEN.findall(text.lower()) if word not in _STOP_WORDS]
+    features = list(words)
+    features += [f"{a} {b}" for a, b in zip(words, words[1:])]
+    for word in words:
+        padded = f"<{word}>"
+        features += [padded[i:i + 3] for i in range(len(padded) - 2)]
+
+    for feature in features:
+        h = zlib.crc32(feature.encode())
+        vector[h % dim] += 1.0 if (h >> 31) & 1 else -1.0
+
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def guard_signature(text: str) -> tuple:
+    """Parts of a prompt that must match exactly for a semantic hit.
+
+    Numbers, quoted identifiers, source/sink words in order (with the
+    direction word in front of each) and comparison/negation words. Prompts
+    differing in these ("first 5 rows" / "first 10 rows", "S3 to Postgres" /
+    "Postgres to S3") embed almost identically but need different code.
+    """
+    words = _TOKEN.findall(text.lower())
+    endpoints = tuple(
+        (words[i - 1] if i and words[i - 1] in _DIRECTIONS else "", word)
+        for i, word in enumerate(words) if word in _ENDPOINTS
+    )
+    return (
+        tuple(_NUMBER.findall(text)),
+        tuple(quoted for _, quoted in _QUOTED.findall(text)),
+        endpoints,
+        tuple(word for word in words if word in _QUALIFIERS),
+    )
+
+
+def quantize(vector: np.ndarray) -> np.ndarray:
+    """Scale a vector into int8, using the full range for its largest component."""
+    peak = float(np.abs(vector).max())
+    if not peak:
+        return np.zeros(vector.shape, dtype=np.int8)
+    return np.clip(np.round(vector * (127 / peak)), -127, 127).astype(np.int8)
+
+
+def scope_id(scope: str) -> int:
+    """64-bit id for a scope string; 0 is reserved for empty rows."""
+    digest = hashlib.sha256(scope.encode()).digest()
+    return int.from_bytes(digest[:8], "little", signed=True) or 1
+
+
+class SemanticCache:
+    """Nearest-neighbour index from prompt embeddings to exact cache keys.
+
+    Vectors are stored int8-quantized in a fixed-size ring buffer, optionally
+    memory-mapped from a private, already-unlinked file in the directory
+    `path` so a large index is paged by the OS instead of held on the heap.
+    The index belongs to one process and does not outlive it. Only rows in
+    the same scope (model, template, context) are compared, and a match must
+    also have the same `guard_signature`. The cached value itself stays in
+    the response cache; the index only answers "which exact key is close
+    enough to this prompt".
+    """
+
+    # Rows scored per step, so a lookup never copies the whole index at once
+    CHUNK_ROWS = 1024
+
+    def __init__(
+        self,
+        dim: int = 512,
+        capacity: int = 10000,
+        threshold: float = 0.95,
+        path: Optional[str] = None
+    ):
+        self.dim = dim
+        self.capacity = capacity
+        self.threshold = threshold
+        if path:
+            self._file = tempfile.TemporaryFile(dir=path, prefix="semantic-index-")
+            self._vectors = np.memmap(
+                self._file, dtype=np.int8, mode="w+", shape=(capacity, dim)
+            )
+        else:
+            self._vectors = np.zeros((capacity, dim), dtype=np.int8)
+        self._norms = np.ones(capacity, dtype=np.float32)
+        self._scopes = np.zeros(capacity, dtype=np.int64)
+        self._keys: list[Optional[str]] = [None] * capacity
+        self._guards: list[Optional[tuple]] = [None] * capacity
+        self._rows: dict[str, int] = {}
+        self._next = 0
+        self.lookups = 0
+        self.hits = 0
+        self.near_misses = 0
+        self.guard_rejections = 0
+        self.stale = 0
+        self._hit_similarity_total = 0.0
+        self._hit_similarity_min: Optional[float] = None
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def add(self, text: str, scope: str, key: str):
+        """Index `text` as leading to the cached value under `key`."""
+        row = self._rows.get(key)
+        if row is None:
+            row = self._next % self.capacity
+            self._next += 1
+            evicted = self._keys[row]
+            if evicted is not None:
+                del self._rows[evicted]
+        vector = quantize(embed(text, self.dim))
+        self._vectors[row] = vector
+        self._norms[row] = np.linalg.norm(vector) or 1.0
+        self._scopes[row] = scope_id(scope)
+        self._keys[row] = key
+        self._guards[row] = guard_signature(text)
+        self._rows[key] = row
+
+    def lookup(self, text: str, scope: str) -> Optional[tuple[str, float]]:
+        """Return `(key, similarity)` of the closest indexed prompt above the threshold."""
+        self.lookups += 1
+        rows = np.flatnonzero(self._scopes == scope_id(scope))
+        if rows.size == 0:
+            return None
+
+        query = quantize(embed(text, self.dim)).astype(np.float32)
+        # Cosine over the quantized vectors, so an identical prompt scores 1
+        similarities = self._dot(rows, query) / (
+            self._norms[rows] * (np.linalg.norm(query) or 1.0)
+        )
+        best = float(similarities.max())
+        if best < self.threshold:
+            if best >= self.threshold - 0.1:
+                self.near_misses += 1
+            return None
+
+        guard = guard_signature(text)
+        for i in np.argsort(-similarities):
+            similarity = float(similarities[i])
+            if similarity < self.threshold:
+                self.guard_rejections += 1
+                return None
+            if self._guards[rows[i]] == guard:
+                break
+        else:
+            self.guard_rejections += 1
+            return None
+
+        self.hits += 1
+        self._hit_similarity_total += similarity
+        if self._hit_similarity_min is None or similarity < self._hit_similarity_min:
+            self._hit_similarity_min = similarity
+        return self._keys[rows[i]], similarity
+
+    def _dot(self, rows: np.ndarray, query: np.ndarray) -> np.ndarray:
+        """Dot products of `query` with the int8 vectors in `rows`, a chunk at a time.
+
+        Each chunk is widened to float32 for BLAS; sums of int8 products stay
+        exact there up to dim 1040, and within rounding beyond.
+        """
+        products = np.empty(rows.size, dtype=np.float32)
+        for start in range(0, rows.size, self.CHUNK_ROWS):
+            chunk = rows[start:start + self.CHUNK_ROWS]
+            products[start:start + chunk.size] = self._vectors[chunk].astype(np.float32) @ query
+        return products
+
+    def discard(self, key: str):
+        """Drop a key whose cached value is gone, counting it as a stale hit."""
+        row = self._rows.pop(key, None)
+        if row is None:
+            return
+        self.stale += 1
+        self._scopes[row] = 0
+        self._keys[row] = None
+        self._guards[row] = None
+
+    def stats(self) -> dict:
+        """Hit rate and hit quality (similarity of accepted matches)."""
+        return {
+            "entries": len(self._rows),
+            "capacity": self.capacity,
+            "threshold": self.threshold,
+            "lookups": self.lookups,
+            "hits": self.hits,
+            "hit_rate": round(self.hits / self.lookups, 4) if self.lookups else 0.0,
+            "avg_hit_similarity": (
+                round(self._hit_similarity_total / self.hits, 4) if self.hits else None
+            ),
+            "min_hit_similarity": (
+                round(self._hit_similarity_min, 4)
+                if self._hit_similarity_min is not None else None
+            ),
+            "near_misses": self.near_misses,
+            "guard_rejections": self.guard_rejections,
+            "stale": self.stale,
+        }
+
+
+# Global semantic cache instance
+semantic_cache = SemanticCache(
+    dim=settings.SEMANTIC_CACHE_DIM,
+    capacity=settings.SEMANTIC_CACHE_CAPACITY,
+    threshold=settings.SEMANTIC_CACHE_THRESHOLD,
+    path=settings.SEMANTIC_CACHE_PATH or None
+)
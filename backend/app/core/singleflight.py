@@ -0,0 +1,62 @@
+import asyncio
+from typing import Any, Awaitable, Callable
+
+
+class _Call:
+    """One in-flight upstream call and the number of callers awaiting it."""
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Coalesce concurrent calls with the same key into one upstream call."""
+
+    def __init__(self):
+        self._calls: dict[str, _Call] = {}
+        self.calls = 0
+        self.coalesced = 0
+
+    async def do(self, key: str, func: Callable[[], Awaitable[Any]]) -> Any:
+        """Await `func()` once per key; duplicates share the leader's result.
+
+        The shared call is only cancelled when every caller awaiting it has
+        been cancelled; callers arriving after that start a fresh call.
+        """
+        self.calls += 1
+        call = self._calls.get(key)
+        if call is None:
+            call = _Call(asyncio.ensure_future(func()))
+            self._calls[key] = call
+            call.task.add_done_callback(lambda _: self._forget(key, call))
+        else:
+            self.coalesced += 1
+
+        call.waiters += 1
+        try:
+            return await asyncio.shield(call.task)
+        except asyncio.CancelledError:
+            if call.waiters == 1 and not call.task.done():
+                self._forget(key, call)
+                call.task.cancel()
+            raise
+        finally:
+            call.waiters -= 1
+
+    def _forget(self, key: str, call: _Call):
+        if self._calls.get(key) is call:
+            del self._calls[key]
+
+    def stats(self) -> dict:
+        """Call counts and the share of calls served by another caller's request."""
+        return {
+            "calls": self.calls,
+            "coalesced": self.coalesced,
+            "in_flight": len(self._calls),
+            "coalescing_rate": round(self.coalesced / self.calls, 4) if self.calls else 0.0,
+        }
+
+
+# Global single-flight instance for LLM calls
+llm_singleflight = SingleFlight()
@@ -0,0 +1,82 @@
+import hashlib
+import heapq
+import numpy as np
+
+
+class CountMinSketch:
+    """Approximate frequency counts in fixed memory.
+
+    Estimates never undercount; they overcount by at most about
+    `total / width` with probability `1 - 2 ** -depth`.
+    """
+
+    def __init__(self, width: int = 2048, depth: int = 4):
+        self.width = width
+        self.depth = depth
+        self.counts = np.zeros((depth, width), dtype=np.int64)
+        self.total = 0
+        self._rows = np.arange(depth)
+
+    def _columns(self, item: str) -> np.ndarray:
+        # Double hashing: depth independent-enough columns from one digest
+        digest = hashlib.blake2b(item.encode(), digest_size=8).digest()
+        h1 = int.from_bytes(digest[:4], "little")
+        h2 = int.from_bytes(digest[4:], "little") | 1
+        return (h1 + self._rows * h2) % self.width
+
+    def add(self, item: str, count: int = 1) -> int:
+        """Count `item` and return its new estimate."""
+        columns = self._columns(item)
+        self.counts[self._rows, columns] += count
+        self.total += count
+        return int(self.counts[self._rows, columns].min())
+
+    def estimate(self, item: str) -> int:
+        return int(self.counts[self._rows, self._columns(item)].min())
+
+    def halve(self):
+        """Age every count by half so that old popularity fades."""
+        self.counts >>= 1
+        self.total = int(self.counts[0].sum())
+
+
+class HeavyHitters:
+    """Track the `k` most frequent items of a stream with a count-min sketch.
+
+    Only the current top-k candidates are kept exactly; everything else
+    lives in the sketch, so memory does not grow with the number of
+    distinct items. Updates leave stale entries in the min-heap, which is
+    rebuilt from the candidates once it holds more than `2 * k` entries.
+    """
+
+    def __init__(self, k: int, width: int = 2048, depth: int = 4):
+        self.k = k
+        self.sketch = CountMinSketch(width, depth)
+        self._candidates: dict[str, int] = {}
+        self._heap: list[tuple[int, str]] = []
+
+    def add(self, item: str, count: int = 1):
+        estimate = self.sketch.add(item, count)
+        if item in self._candidates or len(self._candidates) < self.k:
+            self._candidates[item] = estimate
+            self._push(item, estimate)
+            return
+
+        # Drop heap entries made stale by later updates before comparing
+        while self._heap and self._candidates.get(self._heap[0][1]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+        if self._heap and estimate > self._heap[0][0]:
+            _, evicted = heapq.heappop(self._heap)
+            del self._candidates[evicted]
+            self._candidates[item] = estimate
+            self._push(item, estimate)
+
+    def _push(self, item: str, estimate: int):
+        heapq.heappush(self._heap, (estimate, item))
+        if len(self._heap) > 2 * self.k:
+            self._heap = [(count, name) for name, count in self._candidates.items()]
+            heapq.heapify(self._heap)
+
+    def top(self) -> list[tuple[str, int]]:
+        """Candidates with their estimated counts, most frequent first."""
+        return sorted(self._candidates.items(), key=lambda pair: pair[1], reverse=True)
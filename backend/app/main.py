@@ -1,35 +1,84 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from contextlib import asynccontextmanager
+from typing import AsyncIterator
+import asyncio
+import json
 import sys
 import os
 
 # Add parent directory to path
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+from app.api.deps import ClientDisconnected, apply_deadline_header, run_cancellable
 from app.core.config import get_settings
 from app.core.cache import cache
+from app.core.deadline import DeadlineExceeded
+from app.core.executor import llm_executor
+from app.core.hedging import autocomplete_hedger
+from app.core.limiter import is_overload_error, llm_limiter
+from app.core.request_log import request_log
+from app.core.response_cache import l1_invalidator, response_cache, sweep_namespaces
+from app.core.semantic_cache import semantic_cache
+from app.core.singleflight import llm_singleflight
 from app.models.request import GenerateCodeRequest, ImproveCodeRequest, AutocompleteRequest
 from app.models.response import (
     GenerateCodeResponse, ImproveCodeResponse, 
     AutocompleteResponse, ErrorResponse
 )
-from app.services.gemini_service import GeminiService as LLMService
+from app.services.gemini_service import GeminiService as LLMService, autocomplete_batcher
+from app.services.prefix_cache import autocomplete_prefix_cache
+from app.services.llm_router import llm_router
+from app.services.model_pool import model_pool
 
 settings = get_settings()
 
 
+async def _sweep_old_cache_namespaces():
+    """Drop entries of superseded prompt/model versions once a rollout has settled."""
+    await asyncio.sleep(settings.CACHE_SWEEP_DELAY_SECONDS)
+    namespaces = {
+        f"gemini:{endpoint}": namespace
+        for endpoint, namespace in LLMService.current_namespaces().items()
+    }
+    try:
+        removed = await sweep_namespaces(
+            cache, namespaces, batch=settings.CACHE_SWEEP_BATCH
+        )
+    except Exception as e:
+        print(f"⚠️  Cache namespace sweep failed: {e}")
+        return
+    if removed:
+        print(f"🧹 Removed {removed} cache entries from old prompt/model versions")
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Manage application lifespan."""
     # Startup
     print("🚀 Starting DataOps Copilot API...")
     await cache.connect()
-    print("✅ Redis connected")
+    if cache.last_ping_ms is not None:
+        print(f"✅ {cache.name} connected ({cache.last_ping_ms}ms)")
+    if settings.L1_CACHE_INVALIDATION:
+        l1_invalidator.start()
+    model_pool.start()
+    print(f"✅ Gemini client pool ready ({model_pool.channels} channels)")
+    sweeper = None
+    if settings.CACHE_SWEEP_OLD_NAMESPACES:
+        sweeper = asyncio.create_task(_sweep_old_cache_namespaces())
     yield
     # Shutdown
     print("👋 Shutting down...")
+    if sweeper is not None:
+        sweeper.cancel()
+    await l1_invalidator.stop()
     await cache.disconnect()
+    await llm_router.close()
+    llm_executor.shutdown()
+    model_pool.close()
+    request_log.close()
 
 
 # Create FastAPI app
@@ -49,6 +98,25 @@ app.add_middleware(
 )
 
 
+def _upstream_error(message: str, e: Exception) -> HTTPException:
+    """Map an LLM failure to an HTTP error.
+    
+    Overload becomes 429, a blown client deadline 504 and a client that went
+    away 499; anything else is a 500.
+    """
+    if isinstance(e, ClientDisconnected):
+        return HTTPException(status_code=499, detail=f"{message}: client closed request")
+    if isinstance(e, DeadlineExceeded):
+        return HTTPException(status_code=504, detail=f"{message}: deadline exceeded ({str(e)})")
+    if is_overload_error(e):
+        return HTTPException(
+            status_code=429,
+            detail=f"{message}: upstream is rate limited, retry shortly",
+            headers={"Retry-After": "2"}
+        )
+    return HTTPException(status_code=500, detail=f"{message}: {str(e)}")
+
+
 # Root endpoints
 @app.get("/")
 async def root():
@@ -62,17 +130,73 @@ async def root():
 
 @app.get("/health")
 async def health_check():
-    """Health check endpoint."""
-    redis_status = "connected" if cache.redis_client else "disconnected"
+    """
+    Health check endpoint.
+    
+    The API stays healthy without Redis (requests bypass the cache); the
+    `redis` field reports what a real round trip shows (to the SQLite file
+    when `CACHE_BACKEND=disk`).
+    """
+    latency_ms = await cache.ping()
+    if not cache.connected:
+        redis_status = "disconnected"
+    elif latency_ms is None:
+        redis_status = "unreachable"
+    elif cache.breaker.state != cache.breaker.CLOSED:
+        redis_status = "recovering"
+    else:
+        redis_status = "connected"
     return {
         "status": "healthy",
-        "redis": redis_status
+        "cache_backend": settings.CACHE_BACKEND,
+        "redis": redis_status,
+        "redis_latency_ms": latency_ms,
+        "redis_breaker": cache.breaker.state
+    }
+
+
+@app.get("/metrics")
+async def metrics():
+    """Runtime metrics for the LLM execution layer."""
+    return {
+        "llm_executor": llm_executor.stats(),
+        "singleflight": llm_singleflight.stats(),
+        "model_pool": model_pool.stats(),
+        "router": llm_router.stats(),
+        "l1_cache": response_cache.local.stats() if response_cache.local else None,
+        "l1_invalidation": l1_invalidator.stats(),
+        "cache_codec": cache.codec.stats(),
+        "redis": cache.stats(),
+        "response_cache": response_cache.stats(),
+        "semantic_cache": semantic_cache.stats(),
+        "limiter": llm_limiter.stats(),
+        "autocomplete_batcher": autocomplete_batcher.stats(),
+        "autocomplete_hedging": autocomplete_hedger.stats(),
+        "autocomplete_prefix_cache": autocomplete_prefix_cache.stats()
+    }
+
+
+@app.get("/admin/cache/stats")
+async def cache_stats():
+    """
+    Cache effectiveness per endpoint.
+    
+    Hit, miss and stale ratios, estimated upstream seconds and tokens saved,
+    and sampled entry size and hit age distributions, for every cache tier.
+    """
+    return {
+        "overall": response_cache.stats(),
+        "endpoints": response_cache.namespace_stats(),
+        "l1_cache": response_cache.local.stats() if response_cache.local else None,
+        "codec": cache.codec.stats(),
+        "semantic_cache": semantic_cache.stats(),
+        "autocomplete_prefix_cache": autocomplete_prefix_cache.stats()
     }
 
 
 # Code generation endpoint
 @app.post(f"{settings.API_V1_STR}/code/generate", response_model=GenerateCodeResponse)
-async def generate_code(request: GenerateCodeRequest):
+async def generate_code(request: GenerateCodeRequest, http_request: Request):
     """
     Generate Python code for ETL tasks from natural language prompt.
     
@@ -80,26 +204,24 @@ async def generate_code(request: GenerateCodeRequest):
     - "Extract data from S3 bucket, clean null values, load into PostgreSQL"
     - "Create a pipeline to read CSV files, transform with pandas, write to Snowflake"
     - "Build an ETL script that pulls from REST API and loads into MongoDB"
+    
+    An optional `X-Request-Deadline-Ms` header bounds the time spent upstream.
     """
+    apply_deadline_header(http_request)
+    request_log.record("generate", prompt=request.prompt, context=request.context)
     try:
         print(f"📝 Generating code for: {request.prompt[:50]}...")
         
-        # Check if cached
-        cached = False
-        if request.use_cache:
-            cache_key = f"llm:{hash(request.prompt + (request.context or ''))}"
-            cached_result = await cache.get(cache_key)
-            if cached_result:
-                cached = True
-                print("✅ Using cached result")
-        
-        # Generate code
-        code = await LLMService.generate_code(
+        # Generate code (served from cache when possible)
+        code, cached = await run_cancellable(http_request, LLMService.generate(
             prompt=request.prompt,
             context=request.context,
-            use_cache=request.use_cache
-        )
+            use_cache=request.use_cache,
+            use_semantic_cache=request.use_semantic_cache
+        ))
         
+        if cached:
+            print("✅ Using cached result")
         print(f"✅ Code generated successfully ({len(code)} chars)")
         
         return GenerateCodeResponse(
@@ -110,12 +232,59 @@ async def generate_code(request: GenerateCodeRequest):
     
     except Exception as e:
         print(f"❌ Error: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Code generation failed: {str(e)}")
+        raise _upstream_error("Code generation failed", e)
+
+
+def _sse(event: str, data: dict) -> str:
+    """Format a single Server-Sent Event."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def _sse_stream(chunks: AsyncIterator[tuple[str, bool]]) -> AsyncIterator[str]:
+    """Forward (chunk, cached) pairs as `chunk` events followed by `done`."""
+    cached = False
+    length = 0
+    try:
+        async for text, cached in chunks:
+            length += len(text)
+            yield _sse("chunk", {"text": text})
+        yield _sse("done", {"cached": cached, "chars": length})
+    except Exception as e:
+        print(f"❌ Error: {str(e)}")
+        yield _sse("error", {"detail": str(e)})
+
+
+def _sse_response(chunks: AsyncIterator[tuple[str, bool]]) -> StreamingResponse:
+    return StreamingResponse(
+        _sse_stream(chunks),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@app.post(f"{settings.API_V1_STR}/code/generate/stream")
+async def generate_code_stream(request: GenerateCodeRequest, http_request: Request):
+    """
+    Stream generated code as Server-Sent Events.
+    
+    Emits `chunk` events with `{"text": ...}` as Gemini produces output, then a
+    final `done` event with `{"cached": ..., "chars": ...}`. Failures after the
+    stream has started are reported as an `error` event.
+    """
+    apply_deadline_header(http_request)
+    request_log.record("generate", prompt=request.prompt, context=request.context)
+    print(f"📝 Streaming code for: {request.prompt[:50]}...")
+    return _sse_response(LLMService.stream_generate_code(
+        prompt=request.prompt,
+        context=request.context,
+        use_cache=request.use_cache,
+        use_semantic_cache=request.use_semantic_cache
+    ))
 
 
 # Code improvement endpoint
 @app.post(f"{settings.API_V1_STR}/code/improve", response_model=ImproveCodeResponse)
-async def improve_code(request: ImproveCodeRequest):
+async def improve_code(request: ImproveCodeRequest, http_request: Request):
     """
     Analyze existing code and suggest improvements.
     
@@ -126,13 +295,14 @@ async def improve_code(request: ImproveCodeRequest):
     - security: Address security concerns
     - scalability: Make code more scalable
     """
+    apply_deadline_header(http_request)
     try:
         print(f"🔍 Analyzing code ({len(request.code)} chars)...")
         
-        result = await LLMService.improve_code(
+        result = await run_cancellable(http_request, LLMService.improve_code(
             code=request.code,
             focus_areas=request.focus_areas
-        )
+        ))
         
         print("✅ Analysis complete")
         
@@ -140,22 +310,39 @@ async def improve_code(request: ImproveCodeRequest):
     
     except Exception as e:
         print(f"❌ Error: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Code improvement failed: {str(e)}")
+        raise _upstream_error("Code improvement failed", e)
+
+
+@app.post(f"{settings.API_V1_STR}/code/improve/stream")
+async def improve_code_stream(request: ImproveCodeRequest, http_request: Request):
+    """
+    Stream improvement suggestions as Server-Sent Events.
+    
+    Uses the same `chunk` / `done` / `error` events as the generate stream.
+    """
+    apply_deadline_header(http_request)
+    print(f"🔍 Streaming analysis ({len(request.code)} chars)...")
+    return _sse_response(LLMService.stream_improve_code(
+        code=request.code,
+        focus_areas=request.focus_areas
+    ))
 
 
 # Autocomplete endpoint
 @app.post(f"{settings.API_V1_STR}/code/autocomplete", response_model=AutocompleteResponse)
-async def autocomplete(request: AutocompleteRequest):
+async def autocomplete(request: AutocompleteRequest, http_request: Request):
     """
     Provide intelligent autocomplete suggestions for code.
     
     Returns up to 3 completion suggestions based on the code prefix and context.
+    Work is abandoned as soon as the editor disconnects or its deadline passes.
     """
+    apply_deadline_header(http_request)
     try:
-        completions = await LLMService.autocomplete(
+        completions = await run_cancellable(http_request, LLMService.autocomplete(
             code_prefix=request.code_prefix,
             context=request.context
-        )
+        ))
         
         return AutocompleteResponse(
             completions=completions,
@@ -163,7 +350,7 @@ async def autocomplete(request: AutocompleteRequest):
         )
     
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Autocomplete failed: {str(e)}")
+        raise _upstream_error("Autocomplete failed", e)
 
 
 # Print registered routes on startup
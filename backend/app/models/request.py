@@ -8,6 +8,9 @@ class GenerateCodeRequest(BaseModel):
     prompt: str = Field(..., description="Natural language description of the ETL task")
     context: Optional[str] = Field(None, description="Additional context or existing code")
     use_cache: bool = Field(True, description="Whether to use cached results")
+    use_semantic_cache: bool = Field(
+        True, description="Whether a cached result for a similarly worded prompt may be used"
+    )
     
     class Config:
         json_schema_extra = {
@@ -16,6 +16,7 @@ class ImproveCodeResponse(BaseModel):
     original_code: str = Field(..., description="Original code")
     suggestions: str = Field(..., description="Improvement suggestions")
     focus_areas: list[str] = Field(default_factory=list, description="Areas analyzed")
+    cached: bool = Field(False, description="Whether result was from cache")
 
 
 class AutocompleteResponse(BaseModel):
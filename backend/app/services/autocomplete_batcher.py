@@ -0,0 +1,135 @@
+import asyncio
+import contextvars
+import time
+from functools import partial
+from typing import Awaitable, Callable, Optional
+
+AutocompleteItem = tuple[str, Optional[str]]
+
+
+class AutocompleteBatcher:
+    """Micro-batch autocomplete requests into shared upstream calls.
+
+    Requests arriving within `window_ms` of the first queued one are sent
+    upstream together, up to `max_size` per batch. Items the batch answer
+    does not cover fall back to individual calls. A batch runs outside any
+    one caller's deadline and is cancelled once every caller has gone.
+    """
+
+    def __init__(
+        self,
+        window_ms: int,
+        max_size: int,
+        complete_one: Callable[[str, Optional[str]], Awaitable[list[str]]],
+        complete_many: Callable[[list[AutocompleteItem]], Awaitable[list[Optional[list[str]]]]]
+    ):
+        self.window_ms = window_ms
+        self.max_size = max_size
+        self._complete_one = complete_one
+        self._complete_many = complete_many
+        self._pending: list[tuple[AutocompleteItem, asyncio.Future, float]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self.batches = 0
+        self.items = 0
+        self.upstream_calls = 0
+        self.fallbacks = 0
+        self.abandoned = 0
+        self.total_delay = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return self.window_ms > 0 and self.max_size > 1
+
+    async def submit(self, code_prefix: str, context: Optional[str] = None) -> list[str]:
+        """Queue one request and wait for its completions."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append(((code_prefix, context), future, time.perf_counter()))
+
+        if len(self._pending) >= self.max_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window_ms / 1000, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+        # A fresh context so the first caller's deadline does not apply to the others
+        task = asyncio.get_running_loop().create_task(
+            self._run(batch),
+            context=contextvars.Context()
+        )
+        for _, future, _ in batch:
+            future.add_done_callback(partial(self._abandon, task, batch))
+
+    def _abandon(self, task: asyncio.Task, batch: list, future: asyncio.Future):
+        """Cancel the batch once all of its callers have been cancelled."""
+        if not future.cancelled() or task.done():
+            return
+        if all(pending.done() for _, pending, _ in batch):
+            self.abandoned += 1
+            task.cancel()
+
+    async def _run(self, batch: list[tuple[AutocompleteItem, asyncio.Future, float]]):
+        now = time.perf_counter()
+        self.batches += 1
+        self.items += len(batch)
+        self.total_delay += sum(now - queued_at for _, _, queued_at in batch)
+
+        # Callers that gave up while queued need no completion
+        batch = [entry for entry in batch if not entry[1].done()]
+        if not batch:
+            return
+
+        try:
+            if len(batch) == 1:
+                results = [None]
+            else:
+                self.upstream_calls += 1
+                results = await self._complete_many([item for item, _, _ in batch])
+
+            async def resolve(item: AutocompleteItem, future: asyncio.Future, result):
+                if result is None:
+                    self.upstream_calls += 1
+                    if len(batch) > 1:
+                        self.fallbacks += 1
+                    result = await self._complete_one(*item)
+                if not future.done():
+                    future.set_result(result)
+
+            outcomes = await asyncio.gather(
+                *[
+                    resolve(item, future, result)
+                    for (item, future, _), result in zip(batch, results)
+                ],
+                return_exceptions=True
+            )
+            for (_, future, _), outcome in zip(batch, outcomes):
+                if isinstance(outcome, BaseException) and not future.done():
+                    future.set_exception(outcome)
+        except Exception as e:
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+
+    def stats(self) -> dict:
+        """Batch sizes against the queueing delay they cost."""
+        return {
+            "window_ms": self.window_ms,
+            "max_size": self.max_size,
+            "batches": self.batches,
+            "items": self.items,
+            "avg_batch_size": round(self.items / self.batches, 2) if self.batches else 0.0,
+            "avg_queue_delay_ms": (
+                round(self.total_delay / self.items * 1000, 2) if self.items else 0.0
+            ),
+            "upstream_calls": self.upstream_calls,
+            "upstream_calls_saved": self.items - self.upstream_calls,
+            "fallbacks": self.fallbacks,
+            "abandoned": self.abandoned,
+        }
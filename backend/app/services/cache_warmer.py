@@ -0,0 +1,124 @@
+"""Pre-populate the response cache from a log of past code generation requests.
+
+Usage:
+    python -m app.services.cache_warmer requests.log --top-k 100 --concurrency 4 --budget 200
+
+The log is the JSON-lines file written when REQUEST_LOG_PATH is set. The
+most frequent (prompt, context) pairs are found with a count-min sketch in
+one streaming pass, then generated through `GeminiService.generate_code`
+so the entries land under exactly the keys live traffic will look up.
+"""
+import argparse
+import asyncio
+import json
+from typing import Iterable, Iterator, Optional
+from app.core.cache import cache
+from app.core.config import get_settings
+from app.core.executor import llm_executor
+from app.core.response_cache import normalize_code, normalize_prompt, response_cache
+from app.core.sketch import HeavyHitters
+from app.services.gemini_service import GeminiService
+from app.services.llm_router import llm_router
+from app.services.model_pool import model_pool
+
+settings = get_settings()
+
+
+def read_requests(lines: Iterable[str], endpoint: str = "generate") -> Iterator[tuple[str, str]]:
+    """Yield normalized (prompt, context) pairs for `endpoint` from JSON-lines log records."""
+    for line in lines:
+        try:
+            record = json.loads(line)
+        except ValueError:
+            continue
+        if not isinstance(record, dict) or record.get("endpoint") != endpoint:
+            continue
+        prompt = normalize_prompt(record.get("prompt"))
+        if prompt:
+            yield prompt, normalize_code(record.get("context"))
+
+
+def rank_requests(lines: Iterable[str], top_k: int) -> list[tuple[str, str, int]]:
+    """The `top_k` most frequent (prompt, context) pairs with estimated counts."""
+    hitters = HeavyHitters(top_k)
+    for prompt, context in read_requests(lines):
+        hitters.add(json.dumps([prompt, context]))
+    return [(*json.loads(item), count) for item, count in hitters.top()]
+
+
+async def warm_cache(
+    requests: list[tuple[str, str, int]],
+    concurrency: int,
+    budget: int
+) -> dict:
+    """Generate and cache the given requests, spending at most `budget` upstream calls."""
+    semaphore = asyncio.Semaphore(concurrency)
+    summary = {
+        "candidates": len(requests),
+        "already_cached": 0,
+        "warmed": 0,
+        "failed": 0,
+        "skipped_over_budget": 0,
+    }
+    spent = 0
+
+    # One round trip to find what is already cached
+    keys = [GeminiService._generate_cache_key(prompt, context) for prompt, context, _ in requests]
+    cached = await response_cache.get_many(keys)
+    summary["already_cached"] = sum(value is not None for value in cached)
+    cold = [
+        (prompt, context)
+        for (prompt, context, _), value in zip(requests, cached)
+        if value is None
+    ]
+
+    async def warm(prompt: str, context: str):
+        nonlocal spent
+        async with semaphore:
+            if spent >= budget:
+                summary["skipped_over_budget"] += 1
+                return
+            spent += 1
+            try:
+                await GeminiService.generate_code(
+                    prompt, context or None, use_cache=True, use_semantic_cache=False
+                )
+                summary["warmed"] += 1
+            except Exception as e:
+                summary["failed"] += 1
+                print(f"⚠️  Could not warm '{prompt[:50]}': {e}")
+
+    await asyncio.gather(*[warm(prompt, context) for prompt, context in cold])
+    return summary
+
+
+async def main(argv: Optional[list[str]] = None) -> dict:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("log", help="JSON-lines request log (REQUEST_LOG_PATH)")
+    parser.add_argument("--top-k", type=int, default=settings.CACHE_WARM_TOP_K)
+    parser.add_argument("--concurrency", type=int, default=settings.CACHE_WARM_CONCURRENCY)
+    parser.add_argument(
+        "--budget", type=int, default=settings.CACHE_WARM_BUDGET,
+        help="maximum number of upstream LLM calls"
+    )
+    args = parser.parse_args(argv)
+
+    with open(args.log, encoding="utf-8") as log:
+        requests = rank_requests(log, args.top_k)
+    print(f"🔥 Warming {len(requests)} frequent prompts (budget {args.budget} calls)")
+
+    await cache.connect()
+    model_pool.start()
+    try:
+        summary = await warm_cache(requests, args.concurrency, args.budget)
+    finally:
+        await cache.disconnect()
+        await llm_router.close()
+        llm_executor.shutdown()
+        model_pool.close()
+    print(f"✅ {json.dumps(summary)}")
+    return summary
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,44 @@
+import ast
+import hashlib
+import textwrap
+from typing import Optional
+from app.core.response_cache import normalize_code
+
+_DOCSTRING_OWNERS = (ast.Module, ast.ClassDef, ast.FunctionDef, ast.AsyncFunctionDef)
+
+
+def _strip_docstrings(tree: ast.AST) -> ast.AST:
+    """Remove module, class and function docstrings in place."""
+    for node in ast.walk(tree):
+        if not isinstance(node, _DOCSTRING_OWNERS) or not node.body:
+            continue
+        first = node.body[0]
+        if (
+            isinstance(first, ast.Expr)
+            and isinstance(first.value, ast.Constant)
+            and isinstance(first.value.value, str)
+        ):
+            node.body = node.body[1:] or [ast.Pass()]
+    return tree
+
+
+def code_fingerprint(code: Optional[str]) -> str:
+    """Hash Python source by structure rather than by text.
+
+    Formatting, comments and docstrings do not change the fingerprint, so
+    two versions of a file that differ only in those share it. Code that
+    does not parse, or nests too deeply for the parser, falls back to a hash
+    of its whitespace-normalized text.
+    """
+    text = textwrap.dedent(normalize_code(code))
+    try:
+        tree = _strip_docstrings(ast.parse(text))
+        dump = ast.dump(tree, annotate_fields=False, include_attributes=False)
+    except (SyntaxError, ValueError, RecursionError, MemoryError):
+        return f"text:{hashlib.sha256(text.encode()).hexdigest()}"
+    return f"ast:{hashlib.sha256(dump.encode()).hexdigest()}"
+
+
+def normalize_focus_areas(focus_areas: Optional[list[str]]) -> list[str]:
+    """Sorted, de-duplicated focus areas, so their order does not split keys."""
+    return sorted({area.strip() for area in focus_areas or [] if area.strip()})
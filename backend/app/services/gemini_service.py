@@ -1,8 +1,24 @@
 import google.generativeai as genai
 from app.core.config import get_settings
-from app.core.cache import cache
-import hashlib
-from typing import Optional
+from app.core import deadline
+from app.core.deadline import DeadlineExceeded
+from app.core.hedging import autocomplete_hedger
+from app.core.limiter import llm_limiter
+from app.core.response_cache import (
+    estimate_tokens, make_cache_key, normalize_code, normalize_prompt, recording_origin,
+    response_cache
+)
+from app.core.semantic_cache import semantic_cache
+from app.core.singleflight import llm_singleflight
+from app.services.llm_router import llm_router
+from app.services.autocomplete_batcher import AutocompleteBatcher
+from app.services.code_normalizer import code_fingerprint, normalize_focus_areas
+from app.services.prefix_cache import autocomplete_prefix_cache
+import json
+import time
+from functools import partial
+from google.api_core import exceptions as google_exceptions
+from typing import AsyncIterator, Optional
 
 settings = get_settings()
 genai.configure(api_key=settings.GEMINI_API_KEY)
@@ -11,7 +27,20 @@ genai.configure(api_key=settings.GEMINI_API_KEY)
 class GeminiService:
     """Service for Google Gemini interactions."""
     
-    SYSTEM_PROMPT = """You are a code generation assistant for data engineers. Generate Python ETL code based on the task description. Be concise and include only essential imports and error handling. Return raw Python code without markdown formatting."""
+    # Cached endpoints; each gets its own versioned key namespace
+    CACHED_ENDPOINTS = ("generate", "improve", "autocomplete")
+    
+    # Generation config of the default profile, which is the one that gets cached
+    GENERATION_CONFIG: dict = {}
+    
+    _namespaces: dict[tuple[str, str], str] = {}
+
+    SYSTEM_PROMPT = (
+        "You are a code generation assistant for data engineers. "
+        "Generate Python ETL code based on the task description. "
+        "Be concise and include only essential imports and error handling. "
+        "Return raw Python code without markdown formatting."
+    )
 
     IMPROVEMENT_PROMPT = """You are a DataOps Copilot reviewing data pipeline code.
 
@@ -25,87 +54,481 @@ Analyze the provided code and suggest improvements for:
 
 Provide specific, actionable suggestions with code examples."""
 
+    AUTOCOMPLETE_PROMPT = (
+        "You are a code completion assistant. "
+        "Provide 3 likely completions for the given code prefix. "
+        "Return only the completion text, one per line."
+    )
+
+    AUTOCOMPLETE_BATCH_PROMPT = (
+        "You are a code completion assistant. "
+        "For each numbered item below, provide 3 likely completions for its code prefix. "
+        "Return only a JSON object mapping each item number (as a string) "
+        "to a list of completion strings, without markdown formatting."
+    )
+
+    @staticmethod
+    def _select_profile(endpoint: str) -> str:
+        """Pick a generation profile that fits the request's remaining time budget."""
+        left = deadline.remaining()
+        if left is None:
+            return "default"
+        if left < settings.DEADLINE_MIN_BUDGET_MS / 1000:
+            raise DeadlineExceeded(f"{int(max(left, 0) * 1000)}ms left, too little for upstream")
+        expected = llm_limiter.baseline_latency.get(endpoint)
+        if expected and left < expected:
+            return "fast"
+        return "default"
+    
+    @staticmethod
+    async def _generate(endpoint: str, full_prompt: str, profile: str = "default") -> str:
+        """Send a prompt upstream through the limiter and the provider router."""
+        async with llm_limiter.slot(endpoint):
+            return await llm_router.complete(endpoint, full_prompt, profile)
+    
+    @staticmethod
+    async def _stream(
+        endpoint: str,
+        full_prompt: str,
+        profile: str = "default"
+    ) -> AsyncIterator[str]:
+        """Stream text chunks from the provider router as they arrive."""
+        async with llm_limiter.slot(endpoint):
+            async for text in llm_router.stream(endpoint, full_prompt, profile):
+                yield text
+    
+    @staticmethod
+    def _template(endpoint: str) -> str:
+        """The prompt an endpoint sends, rendered with placeholders for user input."""
+        if endpoint == "generate":
+            return GeminiService._build_generate_prompt("{prompt}", "{context}")
+        if endpoint == "improve":
+            return GeminiService._build_improve_prompt("{code}", ["{focus_area}"])
+        return (
+            GeminiService._build_autocomplete_prompt("{code_prefix}", "{context}")
+            + GeminiService._build_autocomplete_batch_prompt([("{code_prefix}", "{context}")])
+        )
+    
+    @staticmethod
+    def _namespace(endpoint: str) -> str:
+        """Versioned key namespace for an endpoint, e.g. `gemini:generate:v1a2b3c4d`.
+        
+        The version hashes the endpoint's rendered prompt template, the model
+        and the generation config, so changing any of them moves that
+        endpoint (and only that endpoint) to fresh keys. Scoped variants such
+        as `generate:scope` share the version of their endpoint.
+        """
+        base = endpoint.split(":")[0]
+        cache_key = (base, settings.GEMINI_MODEL)
+        version = GeminiService._namespaces.get(cache_key)
+        if version is None:
+            version = make_cache_key(
+                "v",
+                template=GeminiService._template(base),
+                model=settings.GEMINI_MODEL,
+                generation_config=GeminiService.GENERATION_CONFIG
+            ).split(":")[1][:8]
+            GeminiService._namespaces[cache_key] = version
+        return f"gemini:{endpoint}:v{version}"
+    
+    @staticmethod
+    def current_namespaces() -> dict[str, str]:
+        """Current namespace of every cached endpoint."""
+        return {
+            endpoint: GeminiService._namespace(endpoint)
+            for endpoint in GeminiService.CACHED_ENDPOINTS
+        }
+    
+    @staticmethod
+    def _cache_key(endpoint: str, **parts) -> str:
+        """Content-addressed key under the endpoint's versioned namespace."""
+        return make_cache_key(GeminiService._namespace(endpoint), **parts)
+    
     @staticmethod
     def _generate_cache_key(prompt: str, context: str = "") -> str:
         """Generate cache key from prompt and context."""
-        content = f"{prompt}:{context}"
-        return f"gemini:{hashlib.md5(content.encode()).hexdigest()}"
+        return GeminiService._cache_key(
+            "generate",
+            prompt=normalize_prompt(prompt),
+            context=normalize_code(context)
+        )
     
     @staticmethod
-    async def generate_code(
+    def _semantic_scope(context: Optional[str] = None) -> str:
+        """Prompts are only matched semantically against others sharing this scope."""
+        return GeminiService._cache_key("generate:scope", context=normalize_code(context))
+    
+    @staticmethod
+    async def _cached_generation(
         prompt: str,
-        context: Optional[str] = None,
-        use_cache: bool = True
-    ) -> str:
-        """Generate code based on prompt."""
+        context: Optional[str],
+        use_semantic_cache: bool,
+        lock: bool = False
+    ) -> Optional[str]:
+        """Look a generation up by exact key, then by prompt similarity.
         
-        # Check cache
-        if use_cache:
-            cache_key = GeminiService._generate_cache_key(prompt, context or "")
-            cached_result = await cache.get(cache_key)
-            if cached_result:
-                return cached_result
+        A stale exact hit is served and refreshed in the background. With
+        `lock`, an exact miss takes the key's compute lock (see `ResponseCache.get`).
+        """
+        full_prompt = GeminiService._build_generate_prompt(prompt, context)
+        cached_result = await response_cache.get(
+            GeminiService._generate_cache_key(prompt, context or ""),
+            refresh=partial(GeminiService._generate, "generate", full_prompt),
+            lock=lock
+        )
+        if cached_result is not None:
+            return cached_result
+        if not (use_semantic_cache and settings.SEMANTIC_CACHE_ENABLED):
+            return None
         
-        # Prepare full prompt
+        match = semantic_cache.lookup(
+            normalize_prompt(prompt), GeminiService._semantic_scope(context)
+        )
+        if match is None:
+            return None
+        key, similarity = match
+        try:
+            cached_result = await response_cache.get(key)
+        except google_exceptions.GoogleAPICallError:
+            # The neighbour's entry is a cached error, which says nothing about this prompt
+            cached_result = None
+        if cached_result is None:
+            semantic_cache.discard(key)
+        else:
+            print(f"🔎 Semantic cache hit (similarity {similarity:.2f})")
+        return cached_result
+    
+    @staticmethod
+    def _remember_generation(prompt: str, context: Optional[str], cache_key: str):
+        """Index a freshly cached generation for semantic lookups."""
+        if settings.SEMANTIC_CACHE_ENABLED:
+            semantic_cache.add(
+                normalize_prompt(prompt), GeminiService._semantic_scope(context), cache_key
+            )
+    
+    @staticmethod
+    def _improve_cache_key(code: str, focus_areas: Optional[list[str]] = None) -> str:
+        """Generate cache key from the code's AST fingerprint and focus areas."""
+        return GeminiService._cache_key(
+            "improve",
+            code=code_fingerprint(code),
+            focus_areas=normalize_focus_areas(focus_areas)
+        )
+    
+    @staticmethod
+    def _autocomplete_cache_key(code_prefix: str, context: str = "") -> str:
+        """Generate cache key from code prefix and context."""
+        return GeminiService._cache_key(
+            "autocomplete",
+            code_prefix=code_prefix,
+            context=normalize_code(context)
+        )
+    
+    @staticmethod
+    def _autocomplete_scope(context: Optional[str] = None) -> str:
+        """Autocomplete answers are only reused for a longer prefix within this scope."""
+        return GeminiService._cache_key("autocomplete:scope", context=normalize_code(context))
+    
+    @staticmethod
+    def _build_generate_prompt(prompt: str, context: Optional[str] = None) -> str:
+        """Build the full code generation prompt."""
         full_prompt = f"{GeminiService.SYSTEM_PROMPT}\n\n"
         if context:
             full_prompt += f"Context:\n{context}\n\n"
         full_prompt += f"Task: {prompt}"
+        return full_prompt
+    
+    @staticmethod
+    def _build_improve_prompt(code: str, focus_areas: Optional[list[str]] = None) -> str:
+        """Build the full code review prompt."""
+        focus = ""
+        if focus_areas:
+            focus = f"\nFocus on: {', '.join(focus_areas)}"
         
-        # Call Gemini
-        model = genai.GenerativeModel('gemini-2.5-flash')
-        response = model.generate_content(full_prompt)
-        result = response.text
+        return (
+            f"{GeminiService.IMPROVEMENT_PROMPT}\n\n"
+            f"Review this code:\n\n```python\n{code}\n```{focus}"
+        )
+    
+    @staticmethod
+    async def generate(
+        prompt: str,
+        context: Optional[str] = None,
+        use_cache: bool = True,
+        use_semantic_cache: bool = True
+    ) -> tuple[str, bool]:
+        """Generate code based on prompt, returning `(code, cached)`."""
         
-        # Cache result
-        if use_cache:
-            await cache.set(cache_key, result)
+        full_prompt = GeminiService._build_generate_prompt(prompt, context)
+        if not use_cache:
+            profile = GeminiService._select_profile("generate")
+            return await GeminiService._generate("generate", full_prompt, profile), False
         
-        return result
+        # Check cache; an exact miss also takes the lock to compute the key
+        cache_key = GeminiService._generate_cache_key(prompt, context or "")
+        try:
+            cached_result = await GeminiService._cached_generation(
+                prompt, context, use_semantic_cache, lock=True
+            )
+            if cached_result is not None:
+                return cached_result, True
+            
+            # Call Gemini; answers from the cheaper profile are not cached
+            profile = GeminiService._select_profile("generate")
+            if profile != "default":
+                return await GeminiService._generate("generate", full_prompt, profile), False
+            
+            # Identical in-flight requests share one upstream call
+            result = await response_cache.compute(
+                cache_key,
+                partial(GeminiService._generate, "generate", full_prompt),
+                model=settings.GEMINI_MODEL,
+                input_tokens=estimate_tokens(full_prompt)
+            )
+        finally:
+            # A semantic hit or an uncached answer leaves the lock unused
+            await response_cache.release(cache_key)
+        GeminiService._remember_generation(prompt, context, cache_key)
+        return result, False
+    
+    @staticmethod
+    async def generate_code(
+        prompt: str,
+        context: Optional[str] = None,
+        use_cache: bool = True,
+        use_semantic_cache: bool = True
+    ) -> str:
+        """Generate code based on prompt."""
+        code, _ = await GeminiService.generate(prompt, context, use_cache, use_semantic_cache)
+        return code
     
     @staticmethod
     async def improve_code(
         code: str,
         focus_areas: Optional[list[str]] = None
     ) -> dict:
-        """Analyze and suggest improvements for code."""
+        """Analyze and suggest improvements for code.
         
-        # Prepare prompt
-        focus = ""
-        if focus_areas:
-            focus = f"\nFocus on: {', '.join(focus_areas)}"
+        Suggestions are cached by the code's structure, so a review of the
+        same file with only formatting, comment or docstring edits is reused.
+        """
         
-        full_prompt = f"{GeminiService.IMPROVEMENT_PROMPT}\n\nReview this code:\n\n```python\n{code}\n```{focus}"
+        # Check cache; a miss also takes the lock to compute the key
+        cache_key = GeminiService._improve_cache_key(code, focus_areas)
+        full_prompt = GeminiService._build_improve_prompt(code, focus_areas)
+        suggestions = await response_cache.get(
+            cache_key, refresh=partial(GeminiService._generate, "improve", full_prompt), lock=True
+        )
+        cached = suggestions is not None
         
-        # Call Gemini - Use gemini-1.5-flash for free tier
-        model = genai.GenerativeModel('gemini-2.5-flash')
-        response = model.generate_content(full_prompt)
-        suggestions = response.text
+        if not cached:
+            try:
+                profile = GeminiService._select_profile("improve")
+                if profile == "default":
+                    suggestions = await response_cache.compute(
+                        cache_key,
+                        partial(GeminiService._generate, "improve", full_prompt),
+                        model=settings.GEMINI_MODEL,
+                        input_tokens=estimate_tokens(full_prompt)
+                    )
+                else:
+                    suggestions = await llm_singleflight.do(
+                        f"{cache_key}:{profile}",
+                        partial(GeminiService._generate, "improve", full_prompt, profile)
+                    )
+            finally:
+                await response_cache.release(cache_key)
         
         return {
             "original_code": code,
             "suggestions": suggestions,
-            "focus_areas": focus_areas or []
+            "focus_areas": focus_areas or [],
+            "cached": cached
         }
     
     @staticmethod
-    async def autocomplete(
-        code_prefix: str,
-        context: Optional[str] = None
-    ) -> list[str]:
-        """Provide intelligent autocomplete suggestions."""
+    async def stream_generate_code(
+        prompt: str,
+        context: Optional[str] = None,
+        use_cache: bool = True,
+        use_semantic_cache: bool = True
+    ) -> AsyncIterator[tuple[str, bool]]:
+        """Stream generated code as (chunk, cached) pairs.
+        
+        A cache hit is replayed as a single chunk; a fresh generation is
+        cached once the stream completes.
+        """
+        if use_cache:
+            cache_key = GeminiService._generate_cache_key(prompt, context or "")
+            cached_result = await GeminiService._cached_generation(
+                prompt, context, use_semantic_cache
+            )
+            if cached_result is not None:
+                yield cached_result, True
+                return
+        
+        full_prompt = GeminiService._build_generate_prompt(prompt, context)
+        profile = GeminiService._select_profile("generate")
+        started_at = time.perf_counter()
+        parts = []
+        with recording_origin() as origin:
+            try:
+                async for text in GeminiService._stream("generate", full_prompt, profile):
+                    parts.append(text)
+                    yield text, False
+            except Exception as e:
+                if use_cache and profile == "default":
+                    await response_cache.set_error(cache_key, e)
+                raise
+        
+        if use_cache and profile == "default":
+            await response_cache.set(
+                cache_key,
+                "".join(parts),
+                cost=time.perf_counter() - started_at,
+                input_tokens=estimate_tokens(full_prompt),
+                **{"model": settings.GEMINI_MODEL, **origin}
+            )
+            GeminiService._remember_generation(prompt, context, cache_key)
+    
+    @staticmethod
+    async def stream_improve_code(
+        code: str,
+        focus_areas: Optional[list[str]] = None
+    ) -> AsyncIterator[tuple[str, bool]]:
+        """Stream improvement suggestions as (chunk, cached) pairs."""
+        cache_key = GeminiService._improve_cache_key(code, focus_areas)
+        full_prompt = GeminiService._build_improve_prompt(code, focus_areas)
+        cached_result = await response_cache.get(
+            cache_key, refresh=partial(GeminiService._generate, "improve", full_prompt)
+        )
+        if cached_result is not None:
+            yield cached_result, True
+            return
         
-        full_prompt = f"""You are a code completion assistant. Provide 3 likely completions for the given code prefix. Return only the completion text, one per line.
+        profile = GeminiService._select_profile("improve")
+        started_at = time.perf_counter()
+        parts = []
+        with recording_origin() as origin:
+            try:
+                async for text in GeminiService._stream("improve", full_prompt, profile):
+                    parts.append(text)
+                    yield text, False
+            except Exception as e:
+                if profile == "default":
+                    await response_cache.set_error(cache_key, e)
+                raise
+        
+        if profile == "default":
+            await response_cache.set(
+                cache_key,
+                "".join(parts),
+                cost=time.perf_counter() - started_at,
+                input_tokens=estimate_tokens(full_prompt),
+                **{"model": settings.GEMINI_MODEL, **origin}
+            )
+    
+    @staticmethod
+    def _build_autocomplete_prompt(code_prefix: str, context: Optional[str] = None) -> str:
+        """Build the full autocomplete prompt."""
+        return f"""{GeminiService.AUTOCOMPLETE_PROMPT}
 
 Code context:
 {context or 'N/A'}
 
 Complete this:
 {code_prefix}"""
+    
+    @staticmethod
+    def _build_autocomplete_batch_prompt(items: list[tuple[str, Optional[str]]]) -> str:
+        """Build one prompt covering several numbered autocomplete requests."""
+        full_prompt = GeminiService.AUTOCOMPLETE_BATCH_PROMPT
+        for number, (code_prefix, context) in enumerate(items, start=1):
+            full_prompt += (
+                f"\n\n### Item {number}\nCode context:\n{context or 'N/A'}"
+                f"\n\nComplete this:\n{code_prefix}"
+            )
+        return full_prompt
+    
+    @staticmethod
+    def _parse_completions(text: str) -> list[str]:
+        """Split a completion response into at most 3 suggestions."""
+        completions = text.strip().split('\n')
+        return [c.strip() for c in completions if c.strip()][:3]
+    
+    @staticmethod
+    async def _autocomplete_one(code_prefix: str, context: Optional[str] = None) -> list[str]:
+        """Run a single autocomplete request upstream."""
+        full_prompt = GeminiService._build_autocomplete_prompt(code_prefix, context)
+        profile = GeminiService._select_profile("autocomplete")
+        text = await autocomplete_hedger.run(
+            partial(GeminiService._generate, "autocomplete", full_prompt, profile)
+        )
+        return GeminiService._parse_completions(text)
+    
+    @staticmethod
+    async def _autocomplete_many(
+        items: list[tuple[str, Optional[str]]]
+    ) -> list[Optional[list[str]]]:
+        """Run several autocomplete requests as one upstream call.
+        
+        Items missing from the model's answer come back as None.
+        """
+        full_prompt = GeminiService._build_autocomplete_batch_prompt(items)
+        text = await GeminiService._generate("autocomplete", full_prompt)
         
-        # Call Gemini - Use gemini-1.5-flash for free tier
-        model = genai.GenerativeModel('gemini-2.5-flash')
-        response = model.generate_content(full_prompt)
+        text = text.strip()
+        if text.startswith("```"):
+            text = text.strip("`").removeprefix("json").strip()
+        try:
+            answers = json.loads(text)
+        except ValueError:
+            return [None] * len(items)
+        if not isinstance(answers, dict):
+            return [None] * len(items)
         
-        completions = response.text.strip().split('\n')
-        return [c.strip() for c in completions if c.strip()][:3]
\ No newline at end of file
+        results = []
+        for number in range(1, len(items) + 1):
+            completions = answers.get(str(number))
+            if isinstance(completions, list) and completions:
+                results.append([str(c).strip() for c in completions if str(c).strip()][:3])
+            else:
+                results.append(None)
+        return results
+    
+    @staticmethod
+    async def autocomplete(
+        code_prefix: str,
+        context: Optional[str] = None
+    ) -> list[str]:
+        """Provide intelligent autocomplete suggestions.
+        
+        Keystrokes that extend a recently completed prefix are answered from
+        the prefix cache while any of its completions still match.
+        """
+        
+        scope = GeminiService._autocomplete_scope(context)
+        completions = autocomplete_prefix_cache.lookup(code_prefix, scope)
+        if completions is not None:
+            return completions
+        
+        if autocomplete_batcher.enabled:
+            call = partial(autocomplete_batcher.submit, code_prefix, context)
+        else:
+            call = partial(GeminiService._autocomplete_one, code_prefix, context)
+        
+        completions = await llm_singleflight.do(
+            GeminiService._autocomplete_cache_key(code_prefix, context or ""),
+            call
+        )
+        autocomplete_prefix_cache.add(code_prefix, scope, completions)
+        return completions
+
+
+# Global autocomplete batcher, disabled unless AUTOCOMPLETE_BATCH_WINDOW_MS > 0
+autocomplete_batcher = AutocompleteBatcher(
+    window_ms=settings.AUTOCOMPLETE_BATCH_WINDOW_MS,
+    max_size=settings.AUTOCOMPLETE_BATCH_MAX_SIZE,
+    complete_one=GeminiService._autocomplete_one,
+    complete_many=GeminiService._autocomplete_many
+)
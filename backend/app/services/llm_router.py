@@ -1,35 +1,218 @@
-from typing import Optional
+import random
+import time
+from typing import AsyncIterator, Optional
+from app.core import deadline
 from app.core.config import get_settings
+from app.core.limiter import is_retryable_error
+from app.core.response_cache import entry_origin
+from app.services.providers import (
+    GeminiProvider, LLMProvider, LocalProvider, OpenAICompatibleProvider
+)
 
 settings = get_settings()
 
 
+class EndpointHealth:
+    """EWMA latency and error rate for one provider endpoint."""
+
+    def __init__(self, weight: float, alpha: float = 0.2):
+        self.weight = weight
+        self.alpha = alpha
+        self.latency: Optional[float] = None
+        self.error_rate = 0.0
+        self.requests = 0
+        self.failures = 0
+        self.ejections = 0
+        self.ejected_until = 0.0
+
+    @property
+    def ejected(self) -> bool:
+        return time.monotonic() < self.ejected_until
+
+    def score(self) -> float:
+        """Routing weight: configured weight over expected latency, penalised by errors."""
+        latency = self.latency if self.latency is not None else 0.001
+        return self.weight * (1.0 - self.error_rate) / max(latency, 0.001)
+
+    def record(self, latency: Optional[float], ok: bool):
+        self.requests += 1
+        if ok:
+            if self.latency is None:
+                self.latency = latency
+            else:
+                self.latency = (1 - self.alpha) * self.latency + self.alpha * latency
+        else:
+            self.failures += 1
+        self.error_rate = (1 - self.alpha) * self.error_rate + self.alpha * (0.0 if ok else 1.0)
+
+    def stats(self) -> dict:
+        return {
+            "weight": self.weight,
+            "ewma_latency_ms": round(self.latency * 1000, 2) if self.latency is not None else None,
+            "error_rate": round(self.error_rate, 4),
+            "requests": self.requests,
+            "failures": self.failures,
+            "ejected": self.ejected,
+            "ejections": self.ejections,
+        }
+
+
 class LLMRouter:
-    """Router that always uses Google Gemini."""
-
-    _service = None
-
-    @classmethod
-    def get_service(cls):
-        """Always return Gemini service."""
-        if cls._service is None:
-            from app.services.gemini_service import GeminiService
-            cls._service = GeminiService
-            print("✅ Using Google Gemini (forced)")
-        
-        return cls._service
-
-    @staticmethod
-    async def generate_code(prompt: str, context: Optional[str] = None, use_cache: bool = True) -> str:
-        service = LLMRouter.get_service()
-        return await service.generate_code(prompt, context, use_cache)
-
-    @staticmethod
-    async def improve_code(code: str, focus_areas: Optional[list[str]] = None) -> dict:
-        service = LLMRouter.get_service()
-        return await service.improve_code(code, focus_areas)
-
-    @staticmethod
-    async def autocomplete(code_prefix: str, context: Optional[str] = None) -> list[str]:
-        service = LLMRouter.get_service()
-        return await service.autocomplete(code_prefix, context)
+    """Route prompts across LLM providers by health and latency.
+
+    Healthy providers are picked at random in proportion to their score
+    (weight over EWMA latency, discounted by error rate), and the remaining
+    ones are tried in score order if the pick fails. A provider whose error
+    rate crosses `eject_error_rate` is taken out of rotation for
+    `eject_seconds`, unless every provider is ejected.
+
+    Only provider failures (overload, 5xx, timeouts, network errors) count
+    against a provider and fail over. Errors any provider would repeat, such
+    as invalid or blocked input, are raised straight away, and so is the last
+    failure once the request's deadline has passed. The provider and model
+    that answered are reported to `entry_origin` for cache metadata.
+    """
+
+    def __init__(
+        self,
+        providers: list[tuple[LLMProvider, float]],
+        eject_error_rate: float = 0.5,
+        eject_seconds: float = 30.0,
+        min_requests: int = 5
+    ):
+        self.providers = {provider.name: provider for provider, _ in providers}
+        self.health = {provider.name: EndpointHealth(weight) for provider, weight in providers}
+        self.eject_error_rate = eject_error_rate
+        self.eject_seconds = eject_seconds
+        self.min_requests = min_requests
+        self.failovers = 0
+
+    def _candidates(self) -> list[str]:
+        """Provider names in the order they should be tried."""
+        names = [name for name, health in self.health.items() if not health.ejected]
+        if not names:
+            # Everything is ejected: try the least-recently ejected first
+            return sorted(self.health, key=lambda name: self.health[name].ejected_until)
+
+        scores = [self.health[name].score() for name in names]
+        first = random.choices(names, weights=scores)[0]
+        rest = sorted(
+            (name for name in names if name != first),
+            key=lambda name: self.health[name].score(),
+            reverse=True
+        )
+        return [first] + rest
+
+    def _record(self, name: str, started_at: float, ok: bool):
+        health = self.health[name]
+        health.record(time.perf_counter() - started_at, ok)
+        if (
+            not ok
+            and health.requests >= self.min_requests
+            and health.error_rate >= self.eject_error_rate
+        ):
+            health.ejected_until = time.monotonic() + self.eject_seconds
+            health.ejections += 1
+            # Re-admit with a clean slate once the cooldown ends
+            health.error_rate = 0.0
+            print(f"⚠️  Ejecting LLM provider '{name}' for {self.eject_seconds:.0f}s")
+
+    def _fail(self, name: str, started_at: float, error: Exception):
+        """Account for a failed attempt; raise unless it is worth failing over."""
+        if not is_retryable_error(error):
+            raise error
+        self._record(name, started_at, ok=False)
+        left = deadline.remaining()
+        if left is not None and left <= 0:
+            raise error
+
+    def _served(self, name: str, profile: str):
+        origin = entry_origin.get()
+        if origin is not None:
+            origin.update(provider=name, model=self.providers[name].model_name(profile))
+
+    async def complete(self, endpoint: str, prompt: str, profile: str = "default") -> str:
+        """Complete a prompt on the best provider, failing over on errors."""
+        error: Optional[Exception] = None
+        for attempt, name in enumerate(self._candidates()):
+            if attempt:
+                self.failovers += 1
+            started_at = time.perf_counter()
+            try:
+                result = await self.providers[name].complete(endpoint, prompt, profile)
+            except Exception as e:
+                self._fail(name, started_at, e)
+                error = e
+                continue
+            self._record(name, started_at, ok=True)
+            self._served(name, profile)
+            return result
+        raise error
+
+    async def stream(
+        self,
+        endpoint: str,
+        prompt: str,
+        profile: str = "default"
+    ) -> AsyncIterator[str]:
+        """Stream from the best provider, failing over only before the first chunk."""
+        error: Optional[Exception] = None
+        for attempt, name in enumerate(self._candidates()):
+            if attempt:
+                self.failovers += 1
+            started_at = time.perf_counter()
+            streamed = False
+            try:
+                async for text in self.providers[name].stream(endpoint, prompt, profile):
+                    streamed = True
+                    yield text
+            except Exception as e:
+                if streamed:
+                    if is_retryable_error(e):
+                        self._record(name, started_at, ok=False)
+                    raise
+                self._fail(name, started_at, e)
+                error = e
+                continue
+            self._record(name, started_at, ok=True)
+            self._served(name, profile)
+            return
+        raise error
+
+    async def close(self):
+        """Close every provider's connections."""
+        for provider in self.providers.values():
+            await provider.close()
+
+    def stats(self) -> dict:
+        """Per-provider health and the number of failovers."""
+        return {
+            "failovers": self.failovers,
+            "providers": {name: health.stats() for name, health in self.health.items()},
+        }
+
+
+def create_router() -> LLMRouter:
+    """Build the router from settings: Gemini plus any configured extra endpoints."""
+    providers: list[tuple[LLMProvider, float]] = [(GeminiProvider(), settings.GEMINI_WEIGHT)]
+    for endpoint in settings.LLM_ENDPOINTS:
+        if endpoint.get("type") == "local":
+            provider = LocalProvider(endpoint["name"])
+        else:
+            provider = OpenAICompatibleProvider(
+                name=endpoint["name"],
+                base_url=endpoint["base_url"],
+                model=endpoint["model"],
+                api_key=endpoint.get("api_key", ""),
+                fast_model=endpoint.get("fast_model")
+            )
+        providers.append((provider, float(endpoint.get("weight", 1.0))))
+    return LLMRouter(
+        providers,
+        eject_error_rate=settings.ROUTER_EJECT_ERROR_RATE,
+        eject_seconds=settings.ROUTER_EJECT_SECONDS
+    )
+
+
+# Global router instance
+llm_router = create_router()
@@ -0,0 +1,107 @@
+import itertools
+import json
+import threading
+from typing import Any, Optional
+import google.ai.generativelanguage as glm
+import google.generativeai as genai
+from google.auth import api_key
+from app.core.config import get_settings
+
+settings = get_settings()
+
+
+class ModelPool:
+    """Long-lived Gemini clients and model handles shared across requests.
+
+    Each client owns one gRPC channel (a single HTTP/2 connection with
+    keep-alive pings), so concurrent calls are multiplexed over a small,
+    fixed set of connections instead of churning new ones per request.
+    Model handles are keyed by channel, model name and generation config.
+    """
+
+    def __init__(self, channels: int, keepalive_ms: int):
+        self.channels = max(1, channels)
+        self.keepalive_ms = keepalive_ms
+        self._clients: list[glm.GenerativeServiceClient] = []
+        self._handles: dict[tuple[int, str, str], genai.GenerativeModel] = {}
+        self._next_client = itertools.count()
+        self._lock = threading.Lock()
+        self.clients_created = 0
+        self.handles_created = 0
+        self.handle_hits = 0
+        self.calls_per_client: list[int] = []
+
+    def _create_client(self) -> glm.GenerativeServiceClient:
+        transport_cls = glm.GenerativeServiceClient.get_transport_class("grpc")
+        channel = transport_cls.create_channel(
+            credentials=api_key.Credentials(settings.GEMINI_API_KEY),
+            options=[
+                ("grpc.keepalive_time_ms", self.keepalive_ms),
+                ("grpc.keepalive_timeout_ms", 10000),
+                ("grpc.keepalive_permit_without_calls", 1),
+                ("grpc.http2.max_pings_without_data", 0),
+            ]
+        )
+        self.clients_created += 1
+        return glm.GenerativeServiceClient(transport=transport_cls(channel=channel))
+
+    def start(self):
+        """Open the client channels."""
+        with self._lock:
+            if self._clients:
+                return
+            self._clients = [self._create_client() for _ in range(self.channels)]
+            self.calls_per_client = [0] * self.channels
+
+    def close(self):
+        """Close the client channels and drop cached handles."""
+        with self._lock:
+            for client in self._clients:
+                client.transport.close()
+            self._clients = []
+            self._handles.clear()
+
+    def get(
+        self,
+        model_name: str = settings.GEMINI_MODEL,
+        generation_config: Optional[dict[str, Any]] = None
+    ) -> genai.GenerativeModel:
+        """Return a pooled model handle, round-robin across client channels."""
+        if not self._clients:
+            self.start()
+
+        config_key = json.dumps(generation_config or {}, sort_keys=True)
+        with self._lock:
+            index = next(self._next_client) % self.channels
+            self.calls_per_client[index] += 1
+            key = (index, model_name, config_key)
+            model = self._handles.get(key)
+            if model is not None:
+                self.handle_hits += 1
+                return model
+
+            model = genai.GenerativeModel(model_name, generation_config=generation_config)
+            model._client = self._clients[index]
+            self._handles[key] = model
+            self.handles_created += 1
+            return model
+
+    def stats(self) -> dict:
+        """Client and handle reuse counters."""
+        lookups = self.handles_created + self.handle_hits
+        return {
+            "channels": self.channels,
+            "clients_created": self.clients_created,
+            "handles": len(self._handles),
+            "handles_created": self.handles_created,
+            "handle_hits": self.handle_hits,
+            "reuse_rate": round(self.handle_hits / lookups, 4) if lookups else 0.0,
+            "calls_per_client": list(self.calls_per_client),
+        }
+
+
+# Global model pool instance
+model_pool = ModelPool(
+    channels=settings.GEMINI_POOL_CHANNELS,
+    keepalive_ms=settings.GEMINI_KEEPALIVE_MS
+)
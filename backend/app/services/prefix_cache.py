@@ -0,0 +1,109 @@
+import time
+from collections import OrderedDict
+from typing import Optional
+from app.core.config import get_settings
+
+settings = get_settings()
+
+
+def _filter(anchor: str, prefix: str, completions: list[str]) -> list[str]:
+    """Completions for `anchor` that still fit once the user has typed `prefix`.
+
+    The model answers either with the continuation of the prefix or with the
+    whole line. Continuations are trimmed by the newly typed text; whole lines
+    are kept as they are if they still start with the line typed so far.
+    """
+    typed = prefix[len(anchor):]
+    matches = []
+    for completion in completions:
+        if anchor.strip() and completion.lstrip().startswith(anchor.strip()):
+            if completion.lstrip().startswith(prefix.strip()):
+                matches.append(completion)
+        elif completion.startswith(typed) and len(completion) > len(typed):
+            matches.append(completion[len(typed):])
+    return matches
+
+
+class PrefixCache:
+    """Recent autocomplete answers indexed by (scope, line prefix).
+
+    A request for a longer prefix of the same line is answered from the
+    longest cached prefix of it whose completions still match what was
+    typed since, so `pd.read_c` and `pd.read_cs` reuse the answer fetched
+    for `pd.read_`. Entries expire after `ttl` seconds and the least
+    recently used are evicted beyond `max_entries`; 0 turns the cache off.
+    """
+
+    def __init__(self, max_entries: int, ttl: int, min_prefix: int = 3):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.min_prefix = min_prefix
+        self._entries: OrderedDict[tuple[str, str], tuple[list[str], float]] = OrderedDict()
+        self.lookups = 0
+        self.exact_hits = 0
+        self.prefix_hits = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def lookup(self, prefix: str, scope: str) -> Optional[list[str]]:
+        """Serve completions for `prefix` from the longest live cached prefix of it."""
+        if not self.enabled:
+            return None
+        self.lookups += 1
+        now = time.monotonic()
+        for end in range(len(prefix), self.min_prefix - 1, -1):
+            key = (scope, prefix[:end])
+            entry = self._entries.get(key)
+            if entry is None:
+                continue
+            completions, expires_at = entry
+            if expires_at <= now:
+                del self._entries[key]
+                continue
+
+            matches = _filter(prefix[:end], prefix, completions)
+            if matches:
+                self._entries.move_to_end(key)
+                if end == len(prefix):
+                    self.exact_hits += 1
+                else:
+                    self.prefix_hits += 1
+                return matches
+        return None
+
+    def add(self, prefix: str, scope: str, completions: list[str]):
+        """Remember the completions fetched upstream for `prefix`."""
+        if not self.enabled or not completions or len(prefix) < self.min_prefix:
+            return
+        key = (scope, prefix)
+        self._entries[key] = (completions, time.monotonic() + self.ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        """Share of keystrokes answered without an upstream call."""
+        served = self.exact_hits + self.prefix_hits
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "keystrokes": self.lookups,
+            "served": served,
+            "served_by_longer_prefix": self.prefix_hits,
+            "served_rate": round(served / self.lookups, 4) if self.lookups else 0.0,
+            "evictions": self.evictions,
+        }
+
+
+# Global autocomplete prefix cache, disabled when AUTOCOMPLETE_PREFIX_CACHE_ENTRIES is 0
+autocomplete_prefix_cache = PrefixCache(
+    max_entries=settings.AUTOCOMPLETE_PREFIX_CACHE_ENTRIES,
+    ttl=settings.AUTOCOMPLETE_PREFIX_CACHE_TTL
+)
@@ -0,0 +1,189 @@
+import asyncio
+import json
+from abc import ABC, abstractmethod
+from typing import AsyncIterator, Optional
+import httpx
+from google.api_core import exceptions as google_exceptions
+from app.core.config import get_settings
+from app.core.executor import llm_executor
+from app.services.model_pool import model_pool
+
+settings = get_settings()
+
+
+class LLMProvider(ABC):
+    """An upstream LLM endpoint the router can send prompts to.
+
+    Profiles are "default" and "fast"; the fast profile trades output length
+    (and, where available, model size) for latency.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+
+    @abstractmethod
+    async def complete(self, endpoint: str, prompt: str, profile: str = "default") -> str:
+        """Return the full completion for a prompt."""
+
+    @abstractmethod
+    def stream(
+        self,
+        endpoint: str,
+        prompt: str,
+        profile: str = "default"
+    ) -> AsyncIterator[str]:
+        """Yield completion text chunks as they arrive."""
+
+    def model_name(self, profile: str = "default") -> str:
+        """The model that answers a profile, as recorded in cache metadata."""
+        return self.name
+
+    async def close(self):
+        """Release any long-lived connections."""
+
+
+class GeminiProvider(LLMProvider):
+    """Google Gemini through the pooled SDK clients and the LLM executor."""
+
+    def __init__(self, name: str = "gemini"):
+        super().__init__(name)
+        self.profiles = {
+            "default": (settings.GEMINI_MODEL, None),
+            "fast": (
+                settings.GEMINI_FAST_MODEL,
+                {"max_output_tokens": settings.GEMINI_FAST_MAX_OUTPUT_TOKENS}
+            ),
+        }
+
+    def model_name(self, profile: str = "default") -> str:
+        return self.profiles[profile][0]
+
+    async def complete(self, endpoint: str, prompt: str, profile: str = "default") -> str:
+        model = model_pool.get(*self.profiles[profile])
+        response = await llm_executor.run(endpoint, model.generate_content, prompt)
+        return response.text
+
+    async def stream(
+        self,
+        endpoint: str,
+        prompt: str,
+        profile: str = "default"
+    ) -> AsyncIterator[str]:
+        model = model_pool.get(*self.profiles[profile])
+
+        def chunks():
+            for chunk in model.generate_content(prompt, stream=True):
+                yield chunk.text
+
+        async for text in llm_executor.stream(endpoint, chunks):
+            if text:
+                yield text
+
+
+class OpenAICompatibleProvider(LLMProvider):
+    """Any endpoint speaking the OpenAI chat completions API (vLLM, Ollama, OpenAI...)."""
+
+    def __init__(
+        self,
+        name: str,
+        base_url: str,
+        model: str,
+        api_key: str = "",
+        fast_model: Optional[str] = None,
+        timeout: float = 120.0
+    ):
+        super().__init__(name)
+        self.model = model
+        self.fast_model = fast_model or model
+        headers = {"Authorization": f"Bearer {api_key}"} if api_key else {}
+        self._client = httpx.AsyncClient(
+            base_url=base_url.rstrip("/"),
+            headers=headers,
+            timeout=timeout,
+            limits=httpx.Limits(max_keepalive_connections=20, keepalive_expiry=60)
+        )
+
+    def model_name(self, profile: str = "default") -> str:
+        return self.fast_model if profile == "fast" else self.model
+
+    def _payload(self, prompt: str, profile: str, stream: bool) -> dict:
+        payload = {
+            "model": self.model_name(profile),
+            "messages": [{"role": "user", "content": prompt}],
+            "stream": stream,
+        }
+        if profile == "fast":
+            payload["max_tokens"] = settings.GEMINI_FAST_MAX_OUTPUT_TOKENS
+        return payload
+
+    @staticmethod
+    async def _raise_for_status(response: httpx.Response):
+        if response.status_code >= 400:
+            body = (await response.aread()).decode(errors="replace")[:200]
+            raise google_exceptions.from_http_status(response.status_code, body)
+
+    async def complete(self, endpoint: str, prompt: str, profile: str = "default") -> str:
+        response = await self._client.post(
+            "/chat/completions", json=self._payload(prompt, profile, stream=False)
+        )
+        await self._raise_for_status(response)
+        return response.json()["choices"][0]["message"]["content"]
+
+    async def stream(
+        self,
+        endpoint: str,
+        prompt: str,
+        profile: str = "default"
+    ) -> AsyncIterator[str]:
+        async with self._client.stream(
+            "POST", "/chat/completions", json=self._payload(prompt, profile, stream=True)
+        ) as response:
+            await self._raise_for_status(response)
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    break
+                text = json.loads(data)["choices"][0]["delta"].get("content")
+                if text:
+                    yield text
+
+    async def close(self):
+        await self._client.aclose()
+
+
+class LocalProvider(LLMProvider):
+    """In-process stand-in provider for tests and offline development.
+
+    Answers with a fixed reply after `latency` seconds, or raises `error`
+    when one is set.
+    """
+
+    def __init__(
+        self,
+        name: str = "local",
+        reply: str = "# local stand-in completion",
+        latency: float = 0.0,
+        error: Optional[Exception] = None
+    ):
+        super().__init__(name)
+        self.reply = reply
+        self.latency = latency
+        self.error = error
+        self.calls = 0
+
+    async def complete(self, endpoint: str, prompt: str, profile: str = "default") -> str:
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        if self.error is not None:
+            raise self.error
+        return self.reply
+
+    async def stream(
+        self,
+        endpoint: str,
+        prompt: str,
+        profile: str = "default"
+    ) -> AsyncIterator[str]:
+        yield await self.complete(endpoint, prompt, profile)
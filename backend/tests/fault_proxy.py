@@ -0,0 +1,119 @@
+"""TCP fault-injection proxy for exercising the cache against a sick Redis.
+
+Sits between the app and Redis and can add latency, swallow traffic
+(`blackhole`: connections hang) or drop and refuse connections (`refuse`).
+Modes can be switched while connections are open.
+
+Standalone use against a local Redis:
+    python tests/fault_proxy.py --target localhost:6379 --listen 6380 --latency-ms 300
+"""
+import argparse
+import asyncio
+from typing import Optional
+
+
+class FaultProxy:
+    PASS = "pass"
+    BLACKHOLE = "blackhole"
+    REFUSE = "refuse"
+
+    def __init__(
+        self,
+        target_host: str,
+        target_port: int,
+        host: str = "127.0.0.1",
+        port: int = 0
+    ):
+        self.target_host = target_host
+        self.target_port = target_port
+        self.host = host
+        self.port = port
+        self.mode = self.PASS
+        self.latency = 0.0
+        self._server: Optional[asyncio.base_events.Server] = None
+        self._writers: set[asyncio.StreamWriter] = set()
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self._drop_connections()
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+    def set_mode(self, mode: str, latency_ms: float = 0.0):
+        """Switch behaviour; `refuse` also drops every open connection."""
+        self.mode = mode
+        self.latency = latency_ms / 1000
+        if mode == self.REFUSE:
+            self._drop_connections()
+
+    def _drop_connections(self):
+        for writer in list(self._writers):
+            writer.close()
+        self._writers.clear()
+
+    async def _handle(
+        self,
+        client_reader: asyncio.StreamReader,
+        client_writer: asyncio.StreamWriter
+    ):
+        if self.mode == self.REFUSE:
+            client_writer.close()
+            return
+        try:
+            upstream_reader, upstream_writer = await asyncio.open_connection(
+                self.target_host, self.target_port
+            )
+        except OSError:
+            client_writer.close()
+            return
+
+        self._writers.update((client_writer, upstream_writer))
+        await asyncio.gather(
+            self._pump(client_reader, upstream_writer),
+            self._pump(upstream_reader, client_writer),
+            return_exceptions=True
+        )
+        for writer in (client_writer, upstream_writer):
+            self._writers.discard(writer)
+            writer.close()
+
+    async def _pump(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        while True:
+            data = await reader.read(65536)
+            if not data:
+                break
+            if self.mode == self.BLACKHOLE:
+                continue
+            if self.latency:
+                await asyncio.sleep(self.latency)
+            writer.write(data)
+            await writer.drain()
+        writer.close()
+
+
+async def _main():
+    parser = argparse.ArgumentParser(description="TCP fault-injection proxy")
+    parser.add_argument("--target", default="localhost:6379")
+    parser.add_argument("--listen", type=int, default=6380)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument(
+        "--mode",
+        choices=[FaultProxy.PASS, FaultProxy.BLACKHOLE, FaultProxy.REFUSE],
+        default=FaultProxy.PASS
+    )
+    args = parser.parse_args()
+
+    host, port = args.target.rsplit(":", 1)
+    proxy = FaultProxy(host, int(port), host="0.0.0.0", port=args.listen)
+    proxy.set_mode(args.mode, args.latency_ms)
+    await proxy.start()
+    print(f"Proxying :{proxy.port} -> {args.target} ({args.mode}, +{args.latency_ms}ms)")
+    await asyncio.Event().wait()
+
+
+if __name__ == "__main__":
+    asyncio.run(_main())
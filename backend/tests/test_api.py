@@ -66,4 +66,41 @@ async def test_generate_code_missing_prompt():
             json={}
         )
     
-    assert response.status_code == 422  # Validation error
\ No newline at end of file
+    assert response.status_code == 422  # Validation error
+
+
+@pytest.mark.asyncio
+async def test_generate_code_stream(monkeypatch):
+    """Test streaming code generation emits chunk and done events."""
+    from app.services.gemini_service import GeminiService
+
+    async def fake_stream(endpoint, full_prompt, profile="default"):
+        for text in ["import pandas", " as pd\n"]:
+            yield text
+
+    monkeypatch.setattr(GeminiService, "_stream", staticmethod(fake_stream))
+
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        response = await ac.post(
+            "/api/v1/code/generate/stream",
+            json={"prompt": "Read CSV", "use_cache": False}
+        )
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = [block for block in response.text.split("\n\n") if block]
+    assert events[0] == 'event: chunk\ndata: {"text": "import pandas"}'
+    assert events[-1] == 'event: done\ndata: {"cached": false, "chars": 20}'
+
+
+@pytest.mark.asyncio
+async def test_autocomplete_rejects_unmeetable_deadline():
+    """A deadline too short to call upstream fails fast with 504."""
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        response = await ac.post(
+            "/api/v1/code/autocomplete",
+            json={"code_prefix": "df = pd.read_"},
+            headers={"X-Request-Deadline-Ms": "1"}
+        )
+
+    assert response.status_code == 504
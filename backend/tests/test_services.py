@@ -0,0 +1,1312 @@
+import asyncio
+import os
+import time
+import pytest
+from app.core.executor import LLMExecutor
+
+
+class FakeBackend:
+    """Dict-backed stand-in for the shared (L2) cache backend."""
+
+    connected = True
+
+    def __init__(self, store=None):
+        from app.core.circuit_breaker import CircuitBreaker
+        self.store = dict(store or {})
+        self.locks = {}
+        self.breaker = CircuitBreaker()
+        self.gets = 0
+
+    async def get(self, key):
+        self.gets += 1
+        return self.store.get(key)
+
+    async def mget(self, keys):
+        return [self.store.get(key) for key in keys]
+
+    async def set(self, key, value, ttl=None):
+        self.store[key] = value
+
+    async def delete(self, key):
+        self.store.pop(key, None)
+
+    async def get_or_lock(self, key, lock_ttl_ms=30000):
+        self.gets += 1
+        if key in self.store:
+            return self.store[key], None
+        if key in self.locks:
+            return None, None
+        self.locks[key] = token = os.urandom(8).hex()
+        return None, token
+
+    async def release_lock(self, key, token):
+        if self.locks.get(key) != token:
+            return False
+        del self.locks[key]
+        return True
+
+    async def scan(self, match, cursor=0, count=500):
+        family = match[:-1]
+        return 0, sorted(key for key in self.store if key.startswith(family))
+
+    async def delete_many(self, keys):
+        for key in keys:
+            self.store.pop(key, None)
+        return len(keys)
+
+
+@pytest.mark.asyncio
+async def test_executor_keeps_event_loop_free():
+    """Blocking calls run off-loop and respect the endpoint limit."""
+    executor = LLMExecutor(max_workers=4, limits={"generate": 1})
+    ticks = 0
+
+    async def ticker():
+        nonlocal ticks
+        while True:
+            ticks += 1
+            await asyncio.sleep(0.01)
+
+    tick_task = asyncio.create_task(ticker())
+    try:
+        results = await asyncio.gather(
+            executor.run("generate", time.sleep, 0.1),
+            executor.run("generate", time.sleep, 0.1),
+        )
+    finally:
+        tick_task.cancel()
+        executor.shutdown()
+
+    assert results == [None, None]
+    assert ticks >= 10
+    stats = executor.stats()["endpoints"]["generate"]
+    assert stats["completed"] == 2
+    assert stats["max_queued"] == 1
+    assert stats["in_flight"] == 0
+
+
+@pytest.mark.asyncio
+async def test_cancelled_callers_keep_their_slots_until_the_sdk_call_returns():
+    """Disconnects cannot push upstream concurrency past the endpoint limit."""
+    import threading
+    from app.core.limiter import AdaptiveLimiter
+    executor = LLMExecutor(max_workers=8, limits={"generate": 1})
+    limiter = AdaptiveLimiter(initial=4, min_limit=1, max_limit=8)
+    lock = threading.Lock()
+    release = threading.Event()
+    running = peak = 0
+
+    def upstream_call():
+        nonlocal running, peak
+        with lock:
+            running += 1
+            peak = max(peak, running)
+        release.wait(5)
+        with lock:
+            running -= 1
+
+    async def request():
+        async with limiter.slot("generate"):
+            await executor.run("generate", upstream_call)
+
+    try:
+        for _ in range(5):
+            task = asyncio.create_task(request())
+            for _ in range(100):
+                if running or executor.stats()["endpoints"].get("generate", {}).get("queued"):
+                    break
+                await asyncio.sleep(0.01)
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+            assert executor.stats()["endpoints"]["generate"]["in_flight"] == 1
+            assert limiter.in_flight == 1
+        release.set()
+        for _ in range(100):
+            if limiter.in_flight == 0:
+                break
+            await asyncio.sleep(0.01)
+    finally:
+        release.set()
+        executor.shutdown()
+
+    assert peak == 1
+    assert executor.stats()["endpoints"]["generate"]["in_flight"] == 0
+    assert limiter.in_flight == 0
+    assert limiter.stats()["abandoned"] >= 1
+
+
+@pytest.mark.asyncio
+async def test_generate_code_coalesces_identical_requests(monkeypatch):
+    """Concurrent identical prompts share a single upstream call."""
+    from app.core.singleflight import llm_singleflight
+    from app.services.gemini_service import GeminiService
+    calls = 0
+
+    async def fake_generate(endpoint, full_prompt, profile="default"):
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.05)
+        return "print('hello')"
+
+    monkeypatch.setattr(GeminiService, "_generate", staticmethod(fake_generate))
+    coalesced_before = llm_singleflight.coalesced
+
+    results = await asyncio.gather(*[
+        GeminiService.generate_code("Read CSV", use_cache=True) for _ in range(5)
+    ])
+
+    assert results == ["print('hello')"] * 5
+    assert calls == 1
+    assert llm_singleflight.coalesced - coalesced_before == 4
+
+
+@pytest.mark.asyncio
+async def test_singleflight_caller_after_cancellation_starts_fresh_call():
+    """Joining right after the last waiter cancelled must not inherit the cancellation."""
+    from app.core.singleflight import SingleFlight
+    flight = SingleFlight()
+    started = asyncio.Event()
+
+    async def slow():
+        started.set()
+        await asyncio.sleep(10)
+
+    async def fast():
+        return "fresh"
+
+    waiter = asyncio.create_task(flight.do("key", slow))
+    await started.wait()
+    waiter.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await waiter
+
+    assert await flight.do("key", fast) == "fresh"
+    assert flight.coalesced == 0
+    assert flight.stats()["in_flight"] == 0
+
+
+def test_model_pool_reuses_handles():
+    """Model handles are created once per channel, model and config."""
+    from app.services.model_pool import ModelPool
+    pool = ModelPool(channels=2, keepalive_ms=30000)
+    try:
+        first = pool.get("gemini-2.5-flash")
+        second = pool.get("gemini-2.5-flash")
+        third = pool.get("gemini-2.5-flash")
+        tuned = pool.get("gemini-2.5-flash", {"max_output_tokens": 64})
+
+        assert first is not second
+        assert first is third
+        assert tuned not in (first, second)
+        stats = pool.stats()
+        assert stats["clients_created"] == 2
+        assert stats["handles_created"] == 3
+        assert stats["handle_hits"] == 1
+    finally:
+        pool.close()
+
+
+@pytest.mark.asyncio
+async def test_adaptive_limiter_backs_off_on_rate_limit():
+    """The window grows on successes and is cut on 429s."""
+    from google.api_core.exceptions import ResourceExhausted
+    from app.core.limiter import AdaptiveLimiter
+    limiter = AdaptiveLimiter(initial=4, min_limit=1, max_limit=8, sample_size=4)
+
+    for _ in range(4):
+        await limiter.acquire("generate")
+        limiter.release(0.1, "generate")
+    assert limiter.limit("generate") == 5
+
+    with pytest.raises(ResourceExhausted):
+        async with limiter.slot("generate"):
+            raise ResourceExhausted("quota")
+    assert limiter.limit("generate") == 3
+    assert limiter.stats()["overloads"] == 1
+    assert limiter.in_flight == 0
+
+
+@pytest.mark.asyncio
+async def test_adaptive_limiter_ignores_latency_tails_but_not_sustained_inflation():
+    """Long-tailed latency alone keeps growing the window; a slower median cuts
+    it, and only for the endpoint that slowed down."""
+    import random
+    from app.core.limiter import AdaptiveLimiter
+    rng = random.Random(1)
+    limiter = AdaptiveLimiter(initial=8, min_limit=1, max_limit=64)
+
+    async def calls(endpoint, count, scale=1.0):
+        for _ in range(count):
+            await limiter.acquire(endpoint)
+            limiter.release(scale * rng.lognormvariate(0, 0.8), endpoint)
+
+    await calls("improve", 5000)
+    await calls("autocomplete", 5000, scale=0.05)
+    assert limiter.limit("improve") == 64
+    assert limiter.limit("autocomplete") == 64
+
+    await calls("improve", 400, scale=3.0)
+    assert limiter.limit("improve") <= 8
+    assert limiter.limit("autocomplete") == 64
+    assert limiter.in_flight == 0
+
+    # A full improve window queues only improve calls
+    limiter = AdaptiveLimiter(initial=1, min_limit=1, max_limit=4)
+    await limiter.acquire("improve")
+    queued = asyncio.create_task(limiter.acquire("improve"))
+    await asyncio.sleep(0)
+    assert not queued.done()
+    await asyncio.wait_for(limiter.acquire("autocomplete"), 0.1)
+    limiter.release(1.0, "improve")
+    await asyncio.wait_for(queued, 0.1)
+    assert limiter.stats()["endpoints"]["improve"]["in_flight"] == 1
+
+
+@pytest.mark.asyncio
+async def test_fair_queue_prefers_autocomplete_without_starving_improve():
+    """Autocomplete jumps queued reviews, but a starving lane is promoted."""
+    from app.core.scheduler import FairQueue
+    loop = asyncio.get_running_loop()
+    queue = FairQueue(weights={"autocomplete": 8, "improve": 1}, max_wait=60)
+    reviews = [loop.create_future() for _ in range(3)]
+    for future in reviews:
+        queue.push(future, "improve")
+    completion = loop.create_future()
+    queue.push(completion, "autocomplete")
+
+    assert queue.pop() is completion
+
+    queue.max_wait = 0
+    queue.push(loop.create_future(), "autocomplete")
+    assert queue.pop() is reviews[0]
+    assert queue.stats()["improve"]["promoted"] == 1
+
+
+@pytest.mark.asyncio
+async def test_autocomplete_batcher_shares_one_upstream_call():
+    """Requests within the window are answered by one batched call."""
+    from app.services.autocomplete_batcher import AutocompleteBatcher
+    batched = []
+
+    async def complete_one(code_prefix, context):
+        return [f"{code_prefix}:single"]
+
+    async def complete_many(items):
+        batched.append(items)
+        return [[f"{prefix}:batch"] for prefix, _ in items[:-1]] + [None]
+
+    batcher = AutocompleteBatcher(20, 8, complete_one, complete_many)
+    results = await asyncio.gather(*[batcher.submit(p) for p in ["a", "b", "c"]])
+
+    assert results == [["a:batch"], ["b:batch"], ["c:single"]]
+    assert len(batched) == 1
+    stats = batcher.stats()
+    assert stats["batches"] == 1
+    assert stats["upstream_calls"] == 2
+    assert stats["fallbacks"] == 1
+
+
+@pytest.mark.asyncio
+async def test_autocomplete_batch_ignores_caller_deadline_and_stops_when_abandoned():
+    """The batch does not inherit its first caller's budget and is cancelled with its callers."""
+    from app.core import deadline
+    from app.services.autocomplete_batcher import AutocompleteBatcher
+    started = asyncio.Event()
+    seen_budgets = []
+    upstream_cancelled = False
+
+    async def complete_one(code_prefix, context):
+        return [code_prefix]
+
+    async def complete_many(items):
+        nonlocal upstream_cancelled
+        seen_budgets.append(deadline.remaining())
+        started.set()
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            upstream_cancelled = True
+            raise
+
+    async def submit_with_budget(prefix):
+        deadline.set_budget(50)
+        return await batcher.submit(prefix)
+
+    batcher = AutocompleteBatcher(10, 2, complete_one, complete_many)
+    callers = [asyncio.create_task(submit_with_budget(p)) for p in ["a", "b"]]
+    await started.wait()
+    assert seen_budgets == [None]
+
+    callers[0].cancel()
+    await asyncio.sleep(0)
+    assert not upstream_cancelled
+    callers[1].cancel()
+    await asyncio.gather(*callers, return_exceptions=True)
+    await asyncio.sleep(0)
+
+    assert upstream_cancelled
+    assert batcher.stats()["abandoned"] == 1
+
+
+@pytest.mark.asyncio
+async def test_hedger_fires_backup_for_slow_call():
+    """A call slower than the hedge delay is raced against a backup."""
+    from app.core.hedging import Hedger
+    hedger = Hedger(percentile=95, budget=0.5, min_delay_ms=10, min_samples=1)
+    hedger._latencies.append(0.01)
+    attempts = 0
+
+    async def call():
+        nonlocal attempts
+        attempts += 1
+        await asyncio.sleep(1 if attempts == 1 else 0.01)
+        return attempts
+
+    assert await hedger.run(call) == 2
+    stats = hedger.stats()
+    assert stats["hedges"] == 1
+    assert stats["win_rate"] == 1.0
+
+
+@pytest.mark.asyncio
+async def test_tight_deadline_selects_fast_profile(monkeypatch):
+    """A budget below the endpoint's usual latency uses the cheaper profile."""
+    from app.core import deadline
+    from app.core.limiter import llm_limiter
+    from app.services.gemini_service import GeminiService
+    monkeypatch.setitem(llm_limiter.baseline_latency, "improve", 5.0)
+
+    deadline.set_budget(None)
+    assert GeminiService._select_profile("improve") == "default"
+    deadline.set_budget(1000)
+    assert GeminiService._select_profile("improve") == "fast"
+    deadline.set_budget(10)
+    with pytest.raises(deadline.DeadlineExceeded):
+        GeminiService._select_profile("improve")
+
+
+@pytest.mark.asyncio
+async def test_router_fails_over_and_ejects_unhealthy_provider():
+    """A failing provider is routed around and ejected after repeated errors."""
+    from google.api_core.exceptions import ServiceUnavailable
+    from app.services.llm_router import LLMRouter
+    from app.services.providers import LocalProvider
+    broken = LocalProvider("broken", error=ServiceUnavailable("down"))
+    healthy = LocalProvider("healthy", reply="ok", latency=0.01)
+    router = LLMRouter([(broken, 100.0), (healthy, 1.0)], min_requests=3)
+
+    for _ in range(10):
+        assert await router.complete("generate", "prompt") == "ok"
+
+    stats = router.stats()["providers"]
+    assert stats["broken"]["ejections"] >= 1
+    assert stats["healthy"]["requests"] == 10
+    assert broken.calls < 10
+
+
+@pytest.mark.asyncio
+async def test_router_raises_request_errors_without_failing_over(monkeypatch):
+    """Bad input and a passed deadline are neither failed over nor held against a provider."""
+    from google.api_core.exceptions import InvalidArgument, ServiceUnavailable
+    from app.core import deadline
+    from app.core.response_cache import recording_origin
+    from app.services.llm_router import LLMRouter
+    from app.services.providers import LocalProvider
+    primary = LocalProvider("primary", error=InvalidArgument("bad prompt"))
+    backup = LocalProvider("backup", reply="ok")
+    router = LLMRouter([(primary, 1.0), (backup, 1.0)])
+    monkeypatch.setattr(router, "_candidates", lambda: ["primary", "backup"])
+
+    with pytest.raises(InvalidArgument):
+        await router.complete("generate", "prompt")
+    assert backup.calls == 0
+    assert router.stats()["providers"]["primary"]["requests"] == 0
+
+    primary.error, primary.latency = ServiceUnavailable("down"), 0.02
+    deadline.set_budget(10)
+    try:
+        with pytest.raises(ServiceUnavailable):
+            await router.complete("generate", "prompt")
+    finally:
+        deadline.set_budget(None)
+    assert backup.calls == 0
+    assert router.stats()["providers"]["primary"]["failures"] == 1
+
+    with recording_origin() as origin:
+        assert await router.complete("generate", "prompt") == "ok"
+    assert origin == {"provider": "backup", "model": "backup"}
+    assert router.failovers == 1
+
+
+@pytest.mark.asyncio
+async def test_generate_reports_cache_hit_with_single_lookup(monkeypatch):
+    """One cache lookup per request, stable keys and an accurate cached flag."""
+    from app.core.response_cache import response_cache
+    from app.services.gemini_service import GeminiService
+    store = {}
+    lookups = 0
+
+    async def fake_get(key, refresh=None, lock=False):
+        nonlocal lookups
+        lookups += 1
+        return store.get(key)
+
+    async def fake_set(key, value, **metadata):
+        store[key] = value
+
+    async def fake_generate(endpoint, full_prompt, profile="default"):
+        return "print('hello')"
+
+    monkeypatch.setattr(response_cache, "get", fake_get)
+    monkeypatch.setattr(response_cache, "set", fake_set)
+    monkeypatch.setattr(GeminiService, "_generate", staticmethod(fake_generate))
+
+    assert await GeminiService.generate("Load  CSV into Postgres") == ("print('hello')", False)
+    assert await GeminiService.generate(" Load CSV into Postgres\n") == ("print('hello')", True)
+    assert lookups == 2
+    assert list(store) == [GeminiService._generate_cache_key("Load CSV into Postgres")]
+
+
+@pytest.mark.asyncio
+async def test_l1_cache_serves_hits_without_backend():
+    """L2 hits are promoted into L1; the L1 tier stays within its byte budget."""
+    from app.core.memory_cache import MemoryCache
+    from app.core.response_cache import ENTRY_MARKER, ResponseCache
+
+    backend = FakeBackend({"hot": "value"})
+    local = MemoryCache(max_bytes=400, default_ttl=60)
+    tiered = ResponseCache(backend, local=local)
+
+    assert await tiered.get("hot") == "value"
+    assert await tiered.get("hot") == "value"
+    assert backend.gets == 1
+    assert local.stats()["hits"] == 1
+
+    for i in range(10):
+        await tiered.set(f"key{i}", "x" * 50)
+    assert local.bytes <= 400
+    assert local.evictions > 0
+    assert await tiered.get("key9") == "x" * 50
+
+    local.set("short", "v", ttl=0)
+    assert local.get("short") is None
+    assert local.expirations == 1
+
+    # L2 hits are copied for no longer than they have left in L2
+    backend.store["expiring"] = {ENTRY_MARKER: 1, "value": "v", "expires_at": time.time() + 5}
+    backend.store["expired"] = {ENTRY_MARKER: 1, "value": "v", "expires_at": time.time() + 0.5}
+    assert await tiered.get("expiring") == "v"
+    assert await tiered.get_many(["expired"]) == ["v"]
+    _, _, expires_at = local._segments[local._where["expiring"]]["expiring"]
+    assert expires_at - time.monotonic() <= 5
+    assert "expired" not in local._where
+
+
+@pytest.mark.asyncio
+async def test_semantic_cache_matches_reworded_prompt(monkeypatch):
+    """A reworded prompt reuses the cached generation; opting out or a new context does not."""
+    from app.core.response_cache import response_cache
+    from app.core.semantic_cache import SemanticCache
+    from app.services import gemini_service
+    from app.services.gemini_service import GeminiService
+    store = {}
+    calls = 0
+
+    async def fake_get(key, refresh=None, lock=False):
+        return store.get(key)
+
+    async def fake_set(key, value, **metadata):
+        store[key] = value
+
+    async def fake_generate(endpoint, full_prompt, profile="default"):
+        nonlocal calls
+        calls += 1
+        return f"# generation {calls}"
+
+    index = SemanticCache(dim=512, capacity=16)
+    monkeypatch.setattr(gemini_service.settings, "SEMANTIC_CACHE_ENABLED", True)
+    monkeypatch.setattr(response_cache, "get", fake_get)
+    monkeypatch.setattr(response_cache, "set", fake_set)
+    monkeypatch.setattr(gemini_service, "semantic_cache", index)
+    monkeypatch.setattr(GeminiService, "_generate", staticmethod(fake_generate))
+
+    reworded = "Load the CSV from S3 into Postgres."
+    first = await GeminiService.generate("load CSV from S3 into Postgres")
+    assert first == ("# generation 1", False)
+    assert await GeminiService.generate(reworded) == ("# generation 1", True)
+    assert await GeminiService.generate(
+        reworded, use_semantic_cache=False
+    ) == ("# generation 2", False)
+    assert await GeminiService.generate(
+        reworded, context="use COPY"
+    ) == ("# generation 3", False)
+    assert await GeminiService.generate("load JSON from GCS into BigQuery") == (
+        "# generation 4", False
+    )
+    assert index.stats()["hits"] == 1
+    assert index.stats()["min_hit_similarity"] >= 0.95
+
+
+@pytest.mark.parametrize("cached, asked", [
+    ("copy data from S3 to Postgres", "copy data from Postgres to S3"),
+    ("delete rows older than 30 days", "delete rows newer than 30 days"),
+    ("show the first 5 rows", "show the first 10 rows"),
+])
+def test_semantic_cache_rejects_prompts_needing_different_code(tmp_path, cached, asked):
+    """Direction, comparison and number changes never match, whatever the threshold."""
+    from app.core.semantic_cache import SemanticCache, embed
+    assert embed(cached, 512) @ embed(asked, 512) > 0.8
+    for threshold in (0.95, 0.5):
+        index = SemanticCache(dim=512, capacity=16, threshold=threshold, path=str(tmp_path))
+        index.add(cached, "scope", "key")
+        assert index.lookup(cached, "scope") == ("key", pytest.approx(1.0, abs=0.01))
+        assert index.lookup(asked, "scope") is None
+    assert index.stats()["guard_rejections"] == 1
+
+
+def test_code_fingerprint_ignores_formatting_comments_and_docstrings():
+    """Cosmetic edits keep the improve cache key; behavioural edits change it."""
+    from app.services.gemini_service import GeminiService
+    original = 'def load(path):\n    """Load rows."""\n    return read(path)\n'
+    cosmetic = '# loader\ndef load( path ):\n\n    return read(path)  # read it\n'
+    changed = 'def load(path):\n    return read(path, header=True)\n'
+
+    key = GeminiService._improve_cache_key(original, ["performance", "security"])
+    assert GeminiService._improve_cache_key(cosmetic, ["security", "performance "]) == key
+    assert GeminiService._improve_cache_key(changed, ["performance", "security"]) != key
+    assert GeminiService._improve_cache_key(original, ["performance"]) != key
+
+    broken = GeminiService._improve_cache_key("def load(:\n")
+    assert GeminiService._improve_cache_key("def load(:  \r\n") == broken
+
+
+@pytest.mark.parametrize("code", ["x = " + "1+" * 100000 + "1", "x = " + "-" * 100000 + "1"])
+def test_code_fingerprint_falls_back_to_text_for_pathological_nesting(code):
+    """Code too deeply nested for the parser is hashed as text instead of failing."""
+    from app.services.code_normalizer import code_fingerprint
+    assert code_fingerprint(code).startswith("text:")
+    assert code_fingerprint(code) == code_fingerprint(code + "\n")
+
+
+@pytest.mark.asyncio
+async def test_autocomplete_prefix_cache_serves_further_keystrokes(monkeypatch):
+    """Typing on from a completed prefix filters cached completions before going upstream."""
+    from app.services import gemini_service
+    from app.services.gemini_service import GeminiService
+    from app.services.prefix_cache import PrefixCache
+    calls = []
+
+    async def fake_autocomplete_one(code_prefix, context=None):
+        calls.append(code_prefix)
+        return ["csv(path)", "json(path)", "df = pd.read_parquet(path)"]
+
+    cache = PrefixCache(max_entries=2, ttl=60)
+    monkeypatch.setattr(gemini_service, "autocomplete_prefix_cache", cache)
+    monkeypatch.setattr(GeminiService, "_autocomplete_one", staticmethod(fake_autocomplete_one))
+    monkeypatch.setattr(gemini_service.autocomplete_batcher, "window_ms", 0)
+
+    assert len(await GeminiService.autocomplete("df = pd.read_", "import pandas")) == 3
+    assert await GeminiService.autocomplete("df = pd.read_c", "import pandas") == ["sv(path)"]
+    assert await GeminiService.autocomplete("df = pd.read_p", "import pandas") == [
+        "df = pd.read_parquet(path)"
+    ]
+    assert calls == ["df = pd.read_"]
+
+    await GeminiService.autocomplete("df = pd.read_x", "import pandas")
+    await GeminiService.autocomplete("df = pd.read_c", "other context")
+    assert len(calls) == 3
+    assert cache.stats()["served"] == 2
+    assert cache.stats()["evictions"] == 1
+
+
+def test_prefix_cache_with_no_entries_is_off():
+    """max_entries=0 stores nothing and counts nothing."""
+    from app.services.prefix_cache import PrefixCache
+    cache = PrefixCache(max_entries=0, ttl=60)
+    cache.add("df = pd.read_", "scope", ["csv(path)"])
+    assert cache.lookup("df = pd.read_c", "scope") is None
+    assert len(cache) == 0
+    assert cache.stats()["keystrokes"] == 0
+    assert cache.stats()["evictions"] == 0
+
+
+def test_codec_compresses_large_values_and_reads_legacy_json():
+    """Large values shrink, small ones round-trip, and old JSON entries stay readable."""
+    import json
+    from app.core.codec import Codec
+    codec = Codec(serializer="json", compression="zlib", threshold=256)
+    pipeline = "import pandas as pd\n" + "df = df.dropna()\n" * 2000
+
+    encoded = codec.encode(pipeline)
+    assert codec.decode(encoded) == pipeline
+    assert len(encoded) * 10 < len(json.dumps(pipeline))
+    assert codec.decode(codec.encode(["a", "b"])) == ["a", "b"]
+    assert codec.decode(json.dumps({"legacy": True}).encode()) == {"legacy": True}
+    assert codec.stats()["compressed"] == 1
+    assert codec.stats()["bytes_saved"] > 0
+
+    with pytest.raises(ValueError):
+        codec.decode(encoded[:20])
+
+
+@pytest.mark.asyncio
+async def test_response_cache_serves_stale_and_caches_errors():
+    """Stale hits trigger one background refresh; deterministic errors are cached briefly."""
+    from google.api_core import exceptions as google_exceptions
+    from app.core.response_cache import ResponseCache
+
+    backend = FakeBackend()
+    responses = ResponseCache(
+        backend, ttl=3600, soft_ttl=0, jitter=0.1, negative_ttl=60, refresh_beta=0
+    )
+    refreshes = 0
+
+    async def refresh():
+        nonlocal refreshes
+        refreshes += 1
+        await asyncio.sleep(0.01)
+        return "fresh"
+
+    backend.store["legacy"] = "bare value"
+    assert await responses.get("legacy", refresh=refresh) == "bare value"
+
+    await responses.set("key", "stale")
+    assert await responses.get("key", refresh=refresh) == "stale"
+    assert await responses.get("key", refresh=refresh) == "stale"
+    await asyncio.sleep(0.05)
+    assert refreshes == 1
+    assert backend.store["key"]["value"] == "fresh"
+    assert responses.stats()["stale_served"] == 2
+
+    async def bad_prompt():
+        raise google_exceptions.InvalidArgument("prompt rejected")
+
+    async def overloaded():
+        raise google_exceptions.ResourceExhausted("quota")
+
+    with pytest.raises(google_exceptions.InvalidArgument):
+        await responses.compute("bad", bad_prompt)
+    with pytest.raises(google_exceptions.BadRequest, match="prompt rejected"):
+        await responses.get("bad")
+    with pytest.raises(google_exceptions.ResourceExhausted):
+        await responses.compute("busy", overloaded)
+    assert await responses.get("busy") is None
+    assert responses.stats()["negative_hits"] == 1
+
+
+def test_heavy_hitters_heap_stays_bounded():
+    """Repeated updates of the same candidates do not grow the heap."""
+    from app.core.sketch import HeavyHitters
+    hitters = HeavyHitters(k=5)
+    for i in range(20000):
+        hitters.add(f"item{i % 50}")
+
+    assert len(hitters._heap) <= 10
+    assert len(hitters.top()) == 5
+
+
+@pytest.mark.asyncio
+async def test_cache_warmer_ranks_frequent_prompts_within_budget(monkeypatch):
+    """The sketch finds the heavy hitters and warming stops at the upstream budget."""
+    import json
+    from app.core.response_cache import response_cache
+    from app.services.cache_warmer import rank_requests, warm_cache
+    from app.services.gemini_service import GeminiService
+    lines = []
+    for i in range(200):
+        lines.append(json.dumps({"endpoint": "generate", "prompt": f"rare prompt {i}"}))
+    for prompt, repeats in [("load csv  to postgres", 50), ("s3 to redshift", 30), ("dedupe", 20)]:
+        lines += [json.dumps({"endpoint": "generate", "prompt": prompt})] * repeats
+    lines += ["not json", json.dumps({"endpoint": "autocomplete", "prompt": "dedupe"})]
+
+    ranked = rank_requests(lines, top_k=3)
+    assert [prompt for prompt, _, _ in ranked] == [
+        "load csv to postgres", "s3 to redshift", "dedupe"
+    ]
+    assert ranked[0][2] >= 50
+
+    store = {GeminiService._generate_cache_key("dedupe"): "cached"}
+    generated = []
+
+    async def fake_get_many(keys):
+        return [store.get(key) for key in keys]
+
+    async def fake_generate_code(prompt, context=None, use_cache=True, use_semantic_cache=True):
+        generated.append(prompt)
+        return "code"
+
+    monkeypatch.setattr(response_cache, "get_many", fake_get_many)
+    monkeypatch.setattr(GeminiService, "generate_code", staticmethod(fake_generate_code))
+
+    summary = await warm_cache(ranked, concurrency=2, budget=1)
+    assert generated == ["load csv to postgres"]
+    assert summary["already_cached"] == 1
+    assert summary["skipped_over_budget"] == 1
+
+
+@pytest.mark.asyncio
+async def test_response_cache_waits_for_a_key_another_replica_is_computing():
+    """A miss locked by another replica is answered by its result, or computed after the wait."""
+    from app.core.response_cache import ResponseCache
+    backend = FakeBackend()
+    responses = ResponseCache(backend, lock_wait=2)
+    other_replica = ResponseCache(backend)
+    calls = 0
+
+    async def upstream():
+        nonlocal calls
+        calls += 1
+        return "mine"
+
+    _, token = await backend.get_or_lock("shared")
+    computing = asyncio.create_task(responses.compute("shared", upstream))
+    await asyncio.sleep(0.1)
+    assert not computing.done()
+    await other_replica.set("shared", "theirs")
+    await backend.release_lock("shared", token)
+    assert await computing == "theirs"
+    assert calls == 0
+
+    await backend.get_or_lock("abandoned")
+    responses.lock_wait = 0.2
+    assert await responses.compute("abandoned", upstream) == "mine"
+    assert calls == 1
+
+    assert await responses.compute("free", upstream) == "mine"
+    assert list(backend.locks) == ["abandoned"]
+    assert responses.stats()["computed_elsewhere"] == 1
+
+    # A locking lookup is the only read of a miss, and its lock is handed to compute
+    reads = backend.gets
+    assert await responses.get("single", lock=True) is None
+    assert "single" in backend.locks
+    assert await responses.compute("single", upstream) == "mine"
+    assert backend.gets == reads + 1
+    assert await responses.get("unused", lock=True) is None
+    await responses.release("unused")
+    assert list(backend.locks) == ["abandoned"]
+
+
+@pytest.mark.asyncio
+async def test_response_cache_reports_savings_per_endpoint():
+    """Hits are credited with the stored upstream latency and tokens of their entry."""
+    from app.core.response_cache import ResponseCache
+
+    responses = ResponseCache(FakeBackend(), sample_rate=1.0)
+
+    async def upstream():
+        await asyncio.sleep(0.02)
+        return "x" * 400
+
+    await responses.compute("gemini:generate:abc", upstream, model="m", input_tokens=50)
+    for _ in range(3):
+        assert await responses.get("gemini:generate:abc") == "x" * 400
+    assert await responses.get("gemini:improve:def") is None
+
+    endpoints = responses.namespace_stats()
+    generate = endpoints["gemini:generate"]
+    assert generate["hits"] == 3
+    assert generate["hit_rate"] == 1.0
+    assert generate["tokens_saved"] == 3 * (50 + 101)
+    assert generate["upstream_seconds_saved"] >= 0.06
+    assert generate["entry_bytes"]["max"] > 400
+    assert endpoints["gemini:improve"]["misses"] == 1
+    assert responses.stats()["hit_rate"] == 0.75
+
+
+@pytest.mark.asyncio
+async def test_redis_cache_batches_reads_and_writes():
+    """mget and mset_with_ttl each cost one round trip and go through the codec."""
+    from app.core.cache import RedisCache
+
+    class FakePipeline:
+        def __init__(self, client, transaction):
+            self.client = client
+            self.transaction = transaction
+            self.commands = []
+
+        async def __aenter__(self):
+            return self
+
+        async def __aexit__(self, *exc):
+            return False
+
+        def setex(self, key, ttl, value):
+            self.commands.append((key, ttl, value))
+
+        async def execute(self):
+            self.client.round_trips += 1
+            for key, ttl, value in self.commands:
+                self.client.data[key] = value
+
+    class FakeRedis:
+        def __init__(self):
+            self.data = {}
+            self.round_trips = 0
+
+        def pipeline(self, transaction=True):
+            return FakePipeline(self, transaction)
+
+        async def mget(self, keys):
+            self.round_trips += 1
+            return [self.data.get(key) for key in keys]
+
+    redis_cache = RedisCache()
+    redis_cache.redis_client = FakeRedis()
+    await redis_cache.mset_with_ttl({"a": "x" * 5000, "b": ["y"]}, ttl=60)
+    redis_cache.redis_client.data["legacy"] = b'"old"'
+
+    assert await redis_cache.mget(["a", "missing", "b", "legacy"]) == [
+        "x" * 5000, None, ["y"], "old"
+    ]
+    assert redis_cache.redis_client.round_trips == 2
+    assert len(redis_cache.redis_client.data["a"]) < 5000
+
+
+async def _serve_fake_redis(store: dict) -> asyncio.base_events.Server:
+    """Minimal RESP server answering PING, GET, SETEX and DEL, with pub/sub and
+    broadcast client tracking (NOLOOP included); anything else gets +OK."""
+    clients = {}
+    client_ids = iter(range(1, 1 << 30))
+    subscribers: dict[bytes, set] = {}
+    trackers = []
+
+    def bulk(value: bytes) -> bytes:
+        return b"$%d\r\n%s\r\n" % (len(value), value)
+
+    def push(writer, channel: bytes, payload: bytes):
+        writer.write(b"*3\r\n" + bulk(b"message") + bulk(channel) + payload)
+
+    def touched(key: bytes, by: int):
+        for tracker, redirect, prefixes, noloop in trackers:
+            if noloop and tracker == by or tracker not in clients or redirect not in clients:
+                continue
+            if any(key.startswith(prefix) for prefix in prefixes):
+                push(clients[redirect], b"__redis__:invalidate", b"*1\r\n" + bulk(key))
+
+    async def handle(reader, writer):
+        client_id = next(client_ids)
+        clients[client_id] = writer
+        try:
+            while True:
+                header = await reader.readline()
+                if not header:
+                    break
+                args = []
+                for _ in range(int(header[1:])):
+                    length = int((await reader.readline())[1:])
+                    args.append((await reader.readexactly(length + 2))[:-2])
+                command = args[0].upper()
+                if command == b"PING":
+                    writer.write(b"+PONG\r\n")
+                elif command == b"GET":
+                    value = store.get(args[1])
+                    writer.write(b"$-1\r\n" if value is None else bulk(value))
+                elif command == b"SETEX":
+                    store[args[1]] = args[3]
+                    writer.write(b"+OK\r\n")
+                    touched(args[1], client_id)
+                elif command in (b"DEL", b"UNLINK"):
+                    deleted = [key for key in args[1:] if store.pop(key, None) is not None]
+                    writer.write(b":%d\r\n" % len(deleted))
+                    for key in deleted:
+                        touched(key, client_id)
+                elif command == b"CLIENT" and args[1].upper() == b"ID":
+                    writer.write(b":%d\r\n" % client_id)
+                elif command == b"CLIENT" and args[1].upper() == b"TRACKING":
+                    options = [arg.upper() for arg in args]
+                    prefixes = [args[i + 1] for i, arg in enumerate(options) if arg == b"PREFIX"]
+                    trackers.append((client_id, int(args[4]), prefixes, b"NOLOOP" in options))
+                    writer.write(b"+OK\r\n")
+                elif command == b"SUBSCRIBE":
+                    for count, channel in enumerate(args[1:], 1):
+                        subscribers.setdefault(channel, set()).add(writer)
+                        reply = bulk(b"subscribe") + bulk(channel) + b":%d\r\n" % count
+                        writer.write(b"*3\r\n" + reply)
+                elif command == b"PUBLISH":
+                    receivers = subscribers.get(args[1], set())
+                    for receiver in receivers:
+                        push(receiver, args[1], bulk(args[2]))
+                    writer.write(b":%d\r\n" % len(receivers))
+                else:
+                    writer.write(b"+OK\r\n")
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        del clients[client_id]
+        for receivers in subscribers.values():
+            receivers.discard(writer)
+        writer.close()
+
+    return await asyncio.start_server(handle, "127.0.0.1", 0)
+
+
+@pytest.mark.asyncio
+async def test_redis_faults_cost_cache_hits_not_availability(monkeypatch):
+    """Latency spikes and outages become misses; the breaker bypasses Redis and recovers."""
+    from app.core import cache as cache_module
+    from app.core.cache import RedisCache
+    from tests.fault_proxy import FaultProxy
+    monkeypatch.setattr(cache_module.settings, "REDIS_RECONNECT_MIN_SECONDS", 0.05)
+    server = await _serve_fake_redis({})
+    proxy = FaultProxy("127.0.0.1", server.sockets[0].getsockname()[1])
+    await proxy.start()
+    redis_cache = RedisCache()
+    redis_cache.op_timeout = 0.1
+    redis_cache.breaker.failure_threshold = 2
+    redis_cache.breaker.reset_timeout = 60
+    try:
+        await redis_cache.connect(host="127.0.0.1", port=proxy.port)
+        assert redis_cache.last_ping_ms is not None
+        assert await redis_cache.set("key", "value")
+        assert await redis_cache.get("key") == "value"
+
+        proxy.set_mode(FaultProxy.PASS, latency_ms=300)
+        started_at = time.perf_counter()
+        assert await redis_cache.get("key") is None
+        assert time.perf_counter() - started_at < 0.25
+
+        proxy.set_mode(FaultProxy.REFUSE)
+        assert await redis_cache.get("key") is None
+        assert redis_cache.breaker.state == "open"
+        started_at = time.perf_counter()
+        assert await redis_cache.get("key") is None
+        assert time.perf_counter() - started_at < 0.01
+        assert redis_cache.breaker.short_circuited >= 1
+
+        proxy.set_mode(FaultProxy.PASS)
+        for _ in range(50):
+            if redis_cache.breaker.state == "closed":
+                break
+            await asyncio.sleep(0.05)
+        assert redis_cache.reconnects == 1
+        assert await redis_cache.get("key") == "value"
+    finally:
+        await redis_cache.disconnect()
+        await proxy.stop()
+        server.close()
+        await server.wait_closed()
+        await asyncio.sleep(0.01)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("outcome", ["cancelled", "unexpected error"])
+async def test_breaker_trial_that_ends_without_an_outcome_frees_the_slot(outcome):
+    """A half-open trial that is cancelled or raises something else must not wedge the breaker."""
+    from app.core.cache import RedisCache
+
+    started = asyncio.Event()
+    release = asyncio.Event()
+
+    class Client:
+        calls = 0
+
+        async def get(self, key):
+            self.calls += 1
+            if self.calls == 1:
+                started.set()
+                if outcome == "unexpected error":
+                    raise ValueError("bad reply")
+                await release.wait()
+            return b'"value"'
+
+    redis_cache = RedisCache()
+    redis_cache.redis_client = Client()
+    redis_cache.breaker.reset_timeout = 0
+    redis_cache.breaker.trip()
+    assert redis_cache.breaker.state == "half_open"
+
+    trial = asyncio.create_task(redis_cache.get("key"))
+    await started.wait()
+    if outcome == "cancelled":
+        trial.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await trial
+    else:
+        with pytest.raises(ValueError):
+            await trial
+
+    assert await redis_cache.get("key") == "value"
+    assert redis_cache.redis_client.calls == 2
+    assert redis_cache.breaker.state == "closed"
+    assert redis_cache.breaker.short_circuited == 0
+
+
+@pytest.mark.asyncio
+async def test_template_change_moves_only_its_endpoint_namespace(monkeypatch):
+    """A new prompt gets fresh keys for its endpoint; the sweep drops only superseded ones."""
+    from app.core.response_cache import sweep_namespaces
+    from app.services.gemini_service import GeminiService
+    before = GeminiService.current_namespaces()
+    generate_key = GeminiService._generate_cache_key("load csv")
+    improve_key = GeminiService._improve_cache_key("x = 1")
+
+    monkeypatch.setattr(GeminiService, "_namespaces", {})
+    monkeypatch.setattr(GeminiService, "SYSTEM_PROMPT", "You write Python ETL code.")
+    after = GeminiService.current_namespaces()
+    assert after["generate"] != before["generate"]
+    assert after["improve"] == before["improve"]
+    assert GeminiService._generate_cache_key("load csv") != generate_key
+    assert GeminiService._improve_cache_key("x = 1") == improve_key
+
+    new_generate_key = GeminiService._generate_cache_key("load csv")
+    legacy_key = "gemini:generate:" + "0" * 64
+    backend = FakeBackend(dict.fromkeys(
+        [generate_key, legacy_key, new_generate_key, improve_key, "other"], "value"
+    ))
+    namespaces = {f"gemini:{endpoint}": ns for endpoint, ns in after.items()}
+    assert await sweep_namespaces(backend, namespaces, pause=0) == 2
+    assert set(backend.store) == {new_generate_key, improve_key, "other"}
+
+
+@pytest.mark.asyncio
+async def test_disk_cache_persists_evicts_and_locks(tmp_path):
+    """The SQLite backend survives restarts, stays within its budget and locks like Redis."""
+    from app.core.disk_cache import DiskCache
+    path = str(tmp_path / "cache.db")
+    disk = DiskCache(path, max_bytes=256 * 1024)
+    await disk.connect()
+    assert disk.connected and disk.last_ping_ms is not None
+
+    await disk.set("gemini:generate:v1:a", {"value": "x = 1"}, ttl=60)
+    await disk.mset_with_ttl({"gemini:generate:v1:b": "b", "gemini:improve:v1:c": "c"}, ttl=60)
+    await disk.set("expired", "gone", ttl=-1)
+    assert await disk.mget(["gemini:generate:v1:a", "missing", "expired"]) == [
+        {"value": "x = 1"}, None, None
+    ]
+    cursor, keys = await disk.scan("gemini:generate:*", count=1)
+    assert cursor != 0 and len(keys) == 1
+    cursor, more = await disk.scan("gemini:generate:*", cursor=cursor, count=10)
+    assert cursor == 0 and sorted(keys + more) == ["gemini:generate:v1:a", "gemini:generate:v1:b"]
+
+    value, token = await disk.get_or_lock("slow")
+    assert value is None and token
+    assert await disk.get_or_lock("slow") == (None, None)
+    assert await disk.release_lock("slow", token)
+    await disk.disconnect()
+
+    # A restart keeps the entries; writing well past the budget evicts the coldest ones
+    disk = DiskCache(path, max_bytes=256 * 1024)
+    disk.op_timeout = 0.05
+    await disk.connect()
+    assert await disk.get("gemini:generate:v1:a") == {"value": "x = 1"}
+    for i in range(200):
+        await disk.set(f"bulk:{i}", os.urandom(2000).hex(), ttl=60)
+    await disk._maintenance
+    assert disk.evictions > 0
+    assert disk.breaker.failures == 0
+    assert await disk._run(disk._used_bytes) <= disk.max_bytes
+    assert await disk.get("bulk:199") is not None
+    assert await disk.get("bulk:0") is None
+    assert await disk.delete_many(["bulk:199", "missing"]) == 1
+    await disk.disconnect()
+
+
+@pytest.mark.asyncio
+async def test_disk_cache_writes_read_times_in_batches(tmp_path):
+    """Reads are not each followed by an UPDATE; read times land together, oldest first evicted."""
+    from app.core.disk_cache import DiskCache
+    disk = DiskCache(str(tmp_path / "cache.db"), max_bytes=256 * 1024)
+    disk.ACCESS_BATCH = 3
+    await disk.connect()
+    await disk.mset_with_ttl({"a": 1, "b": 2, "c": 3}, ttl=60)
+    await disk._maintenance
+
+    def read_times():
+        return dict(disk.db.execute("SELECT key, accessed_at FROM entries").fetchall())
+
+    written = await disk._run(read_times)
+    assert await disk.mget(["a", "b"]) == [1, 2]
+    assert await disk._run(read_times) == written
+    assert await disk.get("a") == 1
+    assert disk._maintenance is None or disk._maintenance.done()
+
+    assert await disk.get("c") == 3
+    await disk._maintenance
+    flushed = await disk._run(read_times)
+    assert all(flushed[key] > written[key] for key in "abc")
+    assert disk._accessed == {}
+
+    await disk.get("b")
+    await disk.disconnect()
+    disk = DiskCache(str(tmp_path / "cache.db"), max_bytes=256 * 1024)
+    await disk.connect()
+    assert (await disk._run(read_times))["b"] > flushed["b"]
+    await disk.disconnect()
+
+
+def test_tinylfu_admission_beats_lru_on_batch_scans():
+    """Replayed traffic: bursts of one-off batch keys do not flush the hot set."""
+    import random
+    from app.core.memory_cache import MemoryCache, estimate_size
+
+    rng = random.Random(7)
+    trace = []
+    for burst in range(40):
+        trace += [f"hot:{min(int(rng.paretovariate(1.2)), 50)}" for _ in range(200)]
+        trace += [f"batch:{burst}:{i}" for i in range(100)]
+
+    def replay(cache):
+        for key in trace:
+            if cache.get(key) is None:
+                cache.set(key, "x" * 200)
+        return cache.stats()
+
+    budget = estimate_size("hot:10", "x" * 200) * 40
+    lru = replay(MemoryCache(max_bytes=budget, default_ttl=600, window=1.0))
+    tinylfu_cache = MemoryCache(max_bytes=budget, default_ttl=600, sketch_width=1024)
+    tinylfu = replay(tinylfu_cache)
+
+    assert lru["policy"] == "lru" and lru["rejected"] == 0
+    assert tinylfu["policy"] == "w-tinylfu"
+    assert tinylfu["hit_rate"] > lru["hit_rate"] + 0.03
+    assert tinylfu["rejected"] > tinylfu["admitted"] > 0
+    assert tinylfu["bytes"] <= budget
+    # Aging keeps the sketch bounded by its sample size
+    assert tinylfu_cache.sketch.total < tinylfu_cache.sample_size
+
+    # Updating an entry keeps it in its segment
+    tinylfu_cache.set("hot:1", "y" * 200)
+    assert tinylfu_cache._where["hot:1"] == "protected"
+    assert tinylfu_cache.get("hot:1") == "y" * 200
+
+
+@pytest.mark.asyncio
+async def test_l1_copies_are_invalidated_across_replicas():
+    """A write or delete on one replica drops the other replica's L1 copy via client tracking."""
+    from app.core.cache import RedisCache
+    from app.core.invalidation import L1Invalidator
+    from app.core.memory_cache import MemoryCache
+    from app.core.response_cache import ResponseCache
+    server = await _serve_fake_redis({})
+    port = server.sockets[0].getsockname()[1]
+    replicas = []
+    for _ in range(2):
+        redis_cache = RedisCache()
+        await redis_cache.connect(host="127.0.0.1", port=port)
+        local = MemoryCache(max_bytes=1 << 20, default_ttl=60)
+        invalidator = L1Invalidator(redis_cache, local, ("gemini:",), check_interval=0.05)
+        invalidator.start()
+        replicas.append((redis_cache, invalidator, ResponseCache(
+            redis_cache, local=local, invalidator=invalidator, soft_ttl=3600
+        )))
+
+    async def settle(condition):
+        for _ in range(100):
+            if condition():
+                return
+            await asyncio.sleep(0.01)
+        raise AssertionError("condition not reached")
+
+    (_, mine, tiered), (_, _, other) = replicas
+    key = "gemini:generate:v1:abc"
+    try:
+        await settle(lambda: all(inv.subscribed and inv.tracking for _, inv, _ in replicas))
+        await tiered.set(key, "one")
+        assert await other.get(key) == "one"
+        # NOLOOP: this replica's own write does not drop the copy it just stored
+        await asyncio.sleep(0.05)
+        assert mine.invalidations == 0
+        assert key in tiered.local._where
+        assert await tiered.get(key) == "one"
+
+        await other.set(key, "two")
+        await settle(lambda: key not in tiered.local._where)
+        assert await tiered.get(key) == "two"
+
+        await other.delete(key)
+        await settle(lambda: key not in tiered.local._where)
+        assert await tiered.get(key) is None
+        assert mine.stats()["invalidations"] >= 2
+    finally:
+        for redis_cache, invalidator, _ in replicas:
+            await invalidator.stop()
+            await redis_cache.disconnect()
+        server.close()
+        await server.wait_closed()
+        await asyncio.sleep(0.01)
+
+
+@pytest.mark.asyncio
+async def test_invalidation_during_a_load_keeps_the_stale_reply_out_of_l1():
+    """An L2 reply that was in flight when its key was invalidated is served but not copied."""
+    from app.core.invalidation import L1Invalidator
+    from app.core.memory_cache import MemoryCache
+    from app.core.response_cache import ResponseCache
+    key = "gemini:generate:v1:abc"
+    replied = asyncio.Event()
+
+    class SlowBackend(FakeBackend):
+        async def get(self, key):
+            value = await super().get(key)
+            await replied.wait()
+            return value
+
+        async def mget(self, keys):
+            values = await super().mget(keys)
+            await replied.wait()
+            return values
+
+    backend = SlowBackend()
+    local = MemoryCache(max_bytes=1 << 20, default_ttl=60)
+    invalidator = L1Invalidator(backend, local, ("gemini:",))
+    tiered = ResponseCache(backend, local=local, invalidator=invalidator)
+
+    for load in (lambda: tiered.get(key), lambda: tiered.get_many([key])):
+        backend.store[key] = "old"
+        replied.clear()
+        loading = asyncio.create_task(load())
+        await asyncio.sleep(0.01)
+        # The key changes in Redis and its invalidation overtakes the GET reply
+        backend.store[key] = "new"
+        invalidator._invalidate([key])
+        replied.set()
+        assert await loading in ("old", ["old"])
+        assert key not in local._where
+
+    # Writes to other keys while a read is in flight do not hold back its copy
+    backend.store["gemini:generate:v1:other"] = "value"
+    replied.clear()
+    loading = asyncio.create_task(tiered.get_many(["gemini:generate:v1:other"]))
+    await asyncio.sleep(0.01)
+    bucket = hash("gemini:generate:v1:other") % len(invalidator._generations)
+    invalidator._invalidate([
+        unrelated for unrelated in (f"gemini:generate:v1:unrelated{i}" for i in range(100))
+        if hash(unrelated) % len(invalidator._generations) != bucket
+    ])
+    replied.set()
+    assert await loading == ["value"]
+    assert "gemini:generate:v1:other" in local._where
+
+    replied.set()
+    assert await tiered.get(key) == "new"
+    assert local.get(key) == "new"
+
+
+def test_semantic_lookup_scores_across_chunks_like_a_full_pass():
+    """Chunked scoring finds the same neighbour as scoring every row at once."""
+    import numpy as np
+    from app.core.semantic_cache import SemanticCache, embed, quantize
+    index = SemanticCache(dim=64, capacity=10)
+    index.CHUNK_ROWS = 3
+    prompts = [f"load table {name} from S3 into Postgres" for name in "abcdefghij"]
+    for number, prompt in enumerate(prompts):
+        index.add(prompt, "scope", f"key{number}")
+
+    rows = np.arange(10)
+    query = quantize(embed(prompts[7], 64))
+    exact = index._vectors[rows].astype(np.int32) @ query.astype(np.int32)
+    assert np.array_equal(index._dot(rows, query.astype(np.float32)), exact)
+    assert index.lookup(prompts[7], "scope") == ("key7", pytest.approx(1.0, abs=0.01))
+
+
+def test_semantic_indexes_sharing_a_path_stay_separate(tmp_path):
+    """Each worker maps its own file; starting another worker wipes nothing."""
+    from app.core.semantic_cache import SemanticCache
+    first = SemanticCache(dim=64, capacity=4, path=str(tmp_path))
+    first.add("load CSV from S3 into Postgres", "scope", "key")
+    second = SemanticCache(dim=64, capacity=4, path=str(tmp_path))
+    second.add("load JSON from GCS into BigQuery", "scope", "other")
+    assert first.lookup("load CSV from S3 into Postgres", "scope")[0] == "key"
+    assert second.lookup("load CSV from S3 into Postgres", "scope") is None
+    assert list(tmp_path.iterdir()) == []
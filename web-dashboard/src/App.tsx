@@ -2,7 +2,7 @@ import { useState } from 'react';
 import { Sparkles, Code2, RefreshCw } from 'lucide-react';
 import PromptInput from './components/PromptInput';
 import CodeEditor from './components/CodeEditor';
-import { generateCode, improveCode } from './services/api';
+import { streamGenerateCode, streamImproveCode } from './services/api';
 import './App.css';
 
 function App() {
@@ -14,11 +14,16 @@ function App() {
     setLoading(true);
     try {
       console.log('Generating code for prompt:', prompt);
-      const response = await generateCode(prompt);
+      let generated = '';
+      setCode('');
+      const response = await streamGenerateCode(prompt, (text) => {
+        generated += text;
+        setCode(generated);
+      });
       console.log('Response received:', response);
       
       // Clean markdown formatting if present
-      let cleanCode = response.code;
+      let cleanCode = generated;
       if (cleanCode.includes('```python')) {
         cleanCode = cleanCode.replace(/```python\n?/g, '').replace(/```/g, '');
       } else if (cleanCode.includes('```')) {
@@ -41,12 +46,14 @@ function App() {
     setLoading(true);
     try {
       console.log('Improving code with focus areas:', focusAreas);
-      const response = await improveCode(code, focusAreas);
-      console.log('Improvement response received');
-      
-      // Format the improvement display
-      const improvedDisplay = `# Original Code\n\n${response.original_code}\n\n# Suggestions\n\n${response.suggestions}`;
+      // Format the improvement display, appending suggestions as they stream in
+      let improvedDisplay = `# Original Code\n\n${code}\n\n# Suggestions\n\n`;
       setCode(improvedDisplay);
+      await streamImproveCode(code, (text) => {
+        improvedDisplay += text;
+        setCode(improvedDisplay);
+      }, focusAreas);
+      console.log('Improvement response received');
     } catch (error: any) {
       console.error('Improvement error:', error);
       const errorMsg = error.response?.data?.detail || error.message || 'Unknown error';
@@ -43,4 +43,62 @@ export const improveCode = async (
     focus_areas: focusAreas,
   });
   return response.data;
-};
\ No newline at end of file
+};
+export interface StreamDone {
+  cached: boolean;
+  chars: number;
+}
+
+// Reads `chunk` / `done` / `error` Server-Sent Events from a streaming endpoint.
+const streamEvents = async (
+  path: string,
+  body: unknown,
+  onChunk: (text: string) => void
+): Promise<StreamDone> => {
+  const response = await fetch(`${API_BASE_URL}${path}`, {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify(body),
+  });
+  if (!response.ok || !response.body) {
+    throw new Error(`Request failed with status ${response.status}`);
+  }
+
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+
+  for (;;) {
+    const { value, done } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+
+    let boundary = buffer.indexOf('\n\n');
+    while (boundary !== -1) {
+      const block = buffer.slice(0, boundary);
+      buffer = buffer.slice(boundary + 2);
+      boundary = buffer.indexOf('\n\n');
+
+      const event = block.match(/^event: (.*)$/m)?.[1];
+      const data = JSON.parse(block.match(/^data: (.*)$/m)?.[1] ?? '{}');
+      if (event === 'chunk') onChunk(data.text);
+      else if (event === 'done') return data as StreamDone;
+      else if (event === 'error') throw new Error(data.detail);
+    }
+  }
+  throw new Error('Stream ended unexpectedly');
+};
+
+export const streamGenerateCode = (
+  prompt: string,
+  onChunk: (text: string) => void,
+  context?: string
+): Promise<StreamDone> =>
+  streamEvents('/code/generate/stream', { prompt, context, use_cache: true }, onChunk);
+
+export const streamImproveCode = (
+  code: string,
+  onChunk: (text: string) => void,
+  focusAreas?: string[]
+): Promise<StreamDone> =>
+  streamEvents('/code/improve/stream', { code, focus_areas: focusAreas }, onChunk);